@@ -0,0 +1,102 @@
+""" Compare drawing points as a GeoPointLayer with drawing them as GeoCircle
+components, and with clustering them in a GeoClusterLayer.
+
+Both are drawn into an offscreen image of the whole map at a given zoom
+level, after a zoom change, so the points have to be projected again. The
+GeoCircles are fewer, as creating them is slow, and their cost is reported
+per point. The clusters of a zoom level are computed on its first draw, so
+the cluster layer is timed on its first and second draw.
+
+Usage::
+
+    python benchmarks/bench_geo_point_layer.py [--points N] [--circles N]
+        [--marker {circle,square}]
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+from kiva.image import GraphicsContext
+
+from mapping.enable.canvas import MappingCanvas
+from mapping.enable.http_tile_manager import HTTPTileManager
+from mapping.enable.primitives.api import (
+    GeoCircle, GeoClusterLayer, GeoPointLayer
+)
+
+ZOOM = 2
+
+
+def draw_layer(canvas, layer, gc, view_bounds):
+    canvas._zoom_level = ZOOM + 1
+    canvas._zoom_level = ZOOM
+    start = time.perf_counter()
+    layer.overlay(canvas, gc, view_bounds)
+    return time.perf_counter() - start
+
+
+def draw_circles(canvas, circles, gc, view_bounds):
+    canvas._zoom_level = ZOOM + 1
+    canvas._zoom_level = ZOOM
+    start = time.perf_counter()
+    for circle in circles:
+        circle._draw_mainlayer(gc, view_bounds)
+    return time.perf_counter() - start
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    ap.add_argument('--points', type=int, default=100000)
+    ap.add_argument('--circles', type=int, default=2000)
+    ap.add_argument('--marker', choices=['circle', 'square'],
+                    default='circle')
+    args = ap.parse_args()
+
+    size = 256 << ZOOM
+    view_bounds = (0, 0, size, size)
+    gc = GraphicsContext((size, size))
+    rng = np.random.default_rng(0)
+
+    canvas = MappingCanvas(tile_cache=HTTPTileManager(), _zoom_level=ZOOM)
+    layer = GeoPointLayer(component=canvas,
+                          lat=rng.uniform(-80, 80, args.points),
+                          lon=rng.uniform(-180, 180, args.points),
+                          marker_size=8.0, marker=args.marker)
+    layer_time = draw_layer(canvas, layer, gc, view_bounds)
+
+    cluster_layer = GeoClusterLayer(component=canvas, lat=layer.lat,
+                                    lon=layer.lon, marker_size=8.0,
+                                    marker=args.marker)
+    cluster_first = draw_layer(canvas, cluster_layer, gc, view_bounds)
+    start = time.perf_counter()
+    cluster_layer.overlay(canvas, gc, view_bounds)
+    cluster_second = time.perf_counter() - start
+
+    canvas = MappingCanvas(tile_cache=HTTPTileManager(), _zoom_level=ZOOM)
+    circles = [
+        GeoCircle(radius=4, geoposition=[lat, lon], scale_with_zoom=True)
+        for lat, lon in zip(rng.uniform(-80, 80, args.circles),
+                            rng.uniform(-180, 180, args.circles))
+    ]
+    canvas.add(*circles)
+    circles_time = draw_circles(canvas, circles, gc, view_bounds)
+
+    layer_cost = layer_time / args.points * 1e6
+    circle_cost = circles_time / args.circles * 1e6
+    print('{:<16}{:>10}{:>12}{:>14}'.format('', 'points', 'time (s)',
+                                            'us / point'))
+    print('{:<16}{:>10}{:>12.3f}{:>14.2f}'.format(
+        'GeoPointLayer', args.points, layer_time, layer_cost))
+    print('{:<16}{:>10}{:>12.3f}{:>14.2f}'.format(
+        'GeoCircle', args.circles, circles_time, circle_cost))
+    print('speedup: {:.0f}x'.format(circle_cost / layer_cost))
+    print()
+    print('GeoClusterLayer, {} clusters: first draw {:.3f} s, then '
+          '{:.3f} s'.format(len(cluster_layer.clusters()[1]), cluster_first,
+                            cluster_second))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+""" Compare drawing a zoomed-in view of a GeoJSONOverlay through its spatial
+index with drawing every polygon, as it used to.
+
+The overlay holds a grid of county-sized squares covering the United States,
+about as many as the counties example. Views of a screen's size are drawn at
+random places over the country into an offscreen image.
+
+Usage::
+
+    python benchmarks/bench_geojson_overlay.py [--zoom N] [--draws N]
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from kiva.constants import FILL_STROKE
+from kiva.image import GraphicsContext
+
+from mapping.enable.canvas import MappingCanvas
+from mapping.enable.geojson_overlay import GeoJSONOverlay
+from mapping.enable.http_tile_manager import HTTPTileManager
+
+WIDTH, HEIGHT = 1024, 768
+
+
+def write_counties(filename, step=0.75):
+    features = []
+    for lon in np.arange(-125, -67, step):
+        for lat in np.arange(25, 49, step):
+            ring = [[lon, lat], [lon + step, lat], [lon + step, lat + step],
+                    [lon, lat + step], [lon, lat]]
+            features.append({
+                'type': 'Feature', 'properties': {},
+                'geometry': {'type': 'Polygon', 'coordinates': [ring]}
+            })
+    with open(filename, 'w') as fp:
+        json.dump({'type': 'FeatureCollection', 'features': features}, fp)
+    return len(features)
+
+
+def draw_all(overlay, canvas, gc, view_bounds):
+    """ The previous drawing of the overlay, without the index. """
+    x, y, width, height = view_bounds
+    factor = 256 << canvas._zoom_level
+    with gc:
+        gc.clip_to_rect(x, y, width, height)
+        gc.set_stroke_color((1, 1, 1))
+        gc.set_line_width(1)
+        gc.scale_ctm(factor, factor)
+        for path, color in zip(overlay._paths, overlay._colors):
+            gc.begin_path()
+            gc.add_path(path)
+            gc.set_fill_color(color)
+            gc.draw_path(FILL_STROKE)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    ap.add_argument('--zoom', type=int, default=7)
+    ap.add_argument('--draws', type=int, default=20)
+    args = ap.parse_args()
+
+    fd, filename = tempfile.mkstemp(suffix='.geojson')
+    os.close(fd)
+    try:
+        count = write_counties(filename)
+        canvas = MappingCanvas(tile_cache=HTTPTileManager(),
+                               _zoom_level=args.zoom)
+        overlay = GeoJSONOverlay(component=canvas, geojs_filename=filename)
+    finally:
+        os.remove(filename)
+
+    # Views centered on random places within the country
+    rng = np.random.default_rng(0)
+    centers = canvas.transformToScreen(rng.uniform(28, 46, args.draws),
+                                       rng.uniform(-120, -72, args.draws))
+    views = [(cx - WIDTH / 2., cy - HEIGHT / 2., WIDTH, HEIGHT)
+             for cx, cy in zip(*centers)]
+    gc = GraphicsContext((WIDTH, HEIGHT))
+    visible = np.mean([len(overlay._index.query(
+        x / (256 << args.zoom), y / (256 << args.zoom),
+        (x + w) / (256 << args.zoom), (y + h) / (256 << args.zoom)))
+        for x, y, w, h in views])
+
+    def run(draw):
+        start = time.perf_counter()
+        for view in views:
+            with gc:
+                gc.translate_ctm(-view[0], -view[1])
+                draw(view)
+        return (time.perf_counter() - start) / len(views) * 1e3
+
+    indexed = run(lambda view: overlay.overlay(canvas, gc, view))
+    everything = run(lambda view: draw_all(overlay, canvas, gc, view))
+
+    print('{} polygons, zoom {}, {:.0f} visible per view on average'.format(
+        count, args.zoom, visible))
+    print('all polygons: {:8.2f} ms / frame'.format(everything))
+    print('indexed:      {:8.2f} ms / frame'.format(indexed))
+    print('speedup: {:.0f}x'.format(everything / indexed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+""" Compare per-tile latency of bare `requests.get` calls with the pooled,
+keep-alive session used by HTTPTileManager.
+
+A local HTTP/1.1 server stands in for the tile server, so the numbers only
+show the connection setup overhead which the pooled session saves. Against a
+remote TLS server the difference is considerably larger.
+
+Usage::
+
+    python benchmarks/bench_http_session.py [--tiles N]
+"""
+from __future__ import print_function
+
+import argparse
+import threading
+import time
+
+import requests
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+
+from mapping.enable.http_tile_manager import get_shared_session
+
+TILE = b'\x89PNG' + b'\x00' * 4096
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Send headers and body without waiting on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(TILE)))
+        self.end_headers()
+        self.wfile.write(TILE)
+
+    def log_message(self, *args):
+        pass
+
+
+class TileServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def time_fetches(get, port, count):
+    start = time.time()
+    for i in range(count):
+        r = get('http://127.0.0.1:{}/0/{}/{}.png'.format(port, i, i))
+        assert r.status_code == 200
+    return (time.time() - start) / count
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--tiles', type=int, default=500)
+    args = ap.parse_args()
+
+    server = TileServer(('127.0.0.1', 0), TileHandler)
+    port = server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    session = get_shared_session('127.0.0.1', port)
+    # Warm up the pool
+    session.get('http://127.0.0.1:{}/'.format(port))
+
+    bare = time_fetches(requests.get, port, args.tiles)
+    pooled = time_fetches(session.get, port, args.tiles)
+    print('requests.get:   {:8.3f} ms/tile'.format(bare * 1000))
+    print('pooled session: {:8.3f} ms/tile'.format(pooled * 1000))
+    print('speedup:        {:8.2f}x'.format(bare / pooled))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+""" Compare the cost of loading and drawing ImageTileManager tiles through
+a PNG round trip with the direct path handing memory-mapped pixels to kiva.
+
+A pyramid level of random tiles is written to a temporary directory, then
+every tile is loaded by a fresh manager and drawn into an offscreen
+graphics context.
+
+Usage::
+
+    python benchmarks/bench_img_tiles.py [--tiles N]
+"""
+from __future__ import print_function
+
+import argparse
+from io import BytesIO
+import os
+import os.path as op
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from kiva.image import GraphicsContext, Image
+
+from mapping.enable.canvas import array_to_image
+from mapping.enable.img_tile_manager import ImageTileManager
+
+
+def make_level(lod_dir, side):
+    level_dir = op.join(lod_dir, '0')
+    os.makedirs(level_dir)
+    rng = np.random.RandomState(0)
+    for row in range(side):
+        for col in range(side):
+            tile = rng.randint(0, 256, (256, 256, 3)).astype(np.uint8)
+            np.save(op.join(level_dir, '{}.{}.npy'.format(row, col)), tile)
+
+
+def time_tiles(lod_dir, side, **traits):
+    manager = ImageTileManager(lod_dir=lod_dir, **traits)
+    gc = GraphicsContext((256, 256))
+    start = time.perf_counter()
+    for row in range(side):
+        for col in range(side):
+            tile = manager.get_tile(0, row, col)
+            gc.draw_image(tile, (0, 0, 257, 257))
+    return (time.perf_counter() - start) / side ** 2
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--tiles', type=int, default=400)
+    args = ap.parse_args()
+
+    side = int(args.tiles ** 0.5)
+    lod_dir = tempfile.mkdtemp()
+    try:
+        make_level(lod_dir, side)
+        png = time_tiles(lod_dir, side,
+                         process_raw=lambda d: Image(BytesIO(d)))
+        direct = time_tiles(lod_dir, side, process_array=array_to_image)
+        print('{} tiles'.format(side ** 2))
+        print('PNG round trip: {:8.3f} ms/tile'.format(png * 1000))
+        print('direct:         {:8.3f} ms/tile'.format(direct * 1000))
+        print('speedup:        {:8.2f}x'.format(png / direct))
+    finally:
+        shutil.rmtree(lod_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+""" Compare the lookup cost of the ordered-dict `lru_cache` with the
+deque-and-refcount implementation it replaced.
+
+The workload mimics tile lookups while panning: most calls hit a working set
+of keys which slowly drifts, so the cache sees a steady trickle of misses and
+evictions. Besides the mean cost per call, the 99.99th percentile is
+reported, which shows the queue compaction spikes of the old implementation.
+
+Usage::
+
+    python benchmarks/bench_lru_cache.py [--calls N] [--maxsize N]
+"""
+from __future__ import print_function
+
+import argparse
+import collections
+import functools
+import random
+import time
+
+from six.moves import filterfalse as ifilterfalse
+
+from mapping.enable.cacheing_decorators import Counter, lru_cache
+
+
+def deque_lru_cache(maxsize=1024):
+    """ The previous implementation of `lru_cache`, without the extras. """
+    maxqueue = maxsize * 10
+
+    def decorating_function(user_function, len=len, iter=iter, tuple=tuple,
+                            sorted=sorted, KeyError=KeyError):
+        cache = {}
+        queue = collections.deque()
+        refcount = Counter()
+        sentinel = object()
+        kwd_mark = object()
+
+        queue_append, queue_popleft = queue.append, queue.popleft
+        queue_appendleft, queue_pop = queue.appendleft, queue.pop
+
+        @functools.wraps(user_function)
+        def wrapper(*args, **kwds):
+            key = args[:]
+            if kwds:
+                key += (kwd_mark,) + tuple(sorted(kwds.items()))
+
+            queue_append(key)
+            refcount[key] += 1
+
+            try:
+                result = cache[key]
+                wrapper.hits += 1
+            except KeyError:
+                result = user_function(*args, **kwds)
+                cache[key] = result
+                wrapper.misses += 1
+
+                if len(cache) > maxsize:
+                    key = queue_popleft()
+                    refcount[key] -= 1
+                    while refcount[key]:
+                        key = queue_popleft()
+                        refcount[key] -= 1
+                    cache.pop(key, None)
+                    del refcount[key]
+
+            if len(queue) > maxqueue:
+                refcount.clear()
+                queue_appendleft(sentinel)
+                for key in ifilterfalse(refcount.__contains__,
+                                        iter(queue_pop, sentinel)):
+                    queue_appendleft(key)
+                    refcount[key] = 1
+
+            return result
+
+        wrapper.hits = wrapper.misses = 0
+        return wrapper
+    return decorating_function
+
+
+def make_keys(calls, maxsize, seed=0):
+    """ Tile keys of a view which drifts across a large map. """
+    rng = random.Random(seed)
+    side = int((maxsize * 0.8) ** 0.5)
+    keys = []
+    x = y = 0
+    for i in range(calls):
+        if i % 200 == 0:
+            x += rng.randint(-1, 1)
+            y += rng.randint(-1, 1)
+        keys.append((12, y + rng.randrange(side), x + rng.randrange(side)))
+    return keys
+
+
+def time_calls(decorator, keys, maxsize):
+    @decorator(maxsize=maxsize)
+    def load(zoom, row, col):
+        return (zoom, row, col)
+
+    clock = time.perf_counter
+    durations = []
+    record = durations.append
+    for key in keys:
+        t = clock()
+        load(*key)
+        record(clock() - t)
+    durations.sort()
+    tail = durations[int(len(durations) * 0.9999)]
+    return (sum(durations) / len(durations), tail, durations[-1],
+            load.hits, load.misses)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--calls', type=int, default=500000)
+    ap.add_argument('--maxsize', type=int, default=1024)
+    args = ap.parse_args()
+
+    keys = make_keys(args.calls, args.maxsize)
+    for name, decorator in [('deque lru_cache', deque_lru_cache),
+                            ('ordered lru_cache', lru_cache)]:
+        mean, tail, worst, hits, misses = time_calls(decorator, keys,
+                                                     args.maxsize)
+        print('{:18s} mean {:6.3f} us  p99.99 {:7.1f} us  max {:7.1f} us  '
+              '({} hits, {} misses)'.format(name, mean * 1e6, tail * 1e6,
+                                            worst * 1e6, hits, misses))
+
+
+if __name__ == '__main__':
+    main()
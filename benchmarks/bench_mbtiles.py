@@ -0,0 +1,112 @@
+""" Measure the per-tile cost of loading a full-screen redraw from the
+bundled `map.mbtiles`.
+
+Each redraw fetches every tile of a screen-sized viewport at a random
+position, either one query per tile, as formatted SQL strings (the previous
+`Mbtile.get_png`) or as a parameterized statement, or with one batched
+`MbtileSet.get_tiles` query. The last two rows time the same redraws through
+an MBTileManager with a cold cache, without and with the batched prefetch of
+`set_visible_tiles`. Tiles are not decoded, so only the SQLite cost shows.
+
+Usage::
+
+    python benchmarks/bench_mbtiles.py [--redraws N] [--zoom Z]
+"""
+from __future__ import print_function
+
+import argparse
+import random
+import time
+
+from mapping.api import get_builtin_mbtiles_path
+from mapping.enable.mbtile_manager import MBTileManager
+from mapping.enable.mbtiles import MbtileSet
+
+SCREEN = (1920, 1080)
+TILE_SIZE = 256
+
+
+def formatted_get_png(conn, zoom, row, col):
+    """ The previous `Mbtile.get_png`. """
+    c = conn.cursor()
+    c.execute('''select tile_data from tiles
+                 where zoom_level = %s
+                 and tile_row = %s
+                 and tile_column = %s''' % (zoom, row, col))
+    row = c.fetchone()
+    if not row:
+        return None
+    return bytes(row[0])
+
+
+def make_viewports(redraws, zoom, seed=0):
+    rng = random.Random(seed)
+    n = 1 << zoom
+    columns = min(n, -(-SCREEN[0] // TILE_SIZE) + 1)
+    rows = min(n, -(-SCREEN[1] // TILE_SIZE) + 1)
+    viewports = []
+    for i in range(redraws):
+        col0 = rng.randrange(n)
+        row0 = rng.randrange(n - rows + 1)
+        viewports.append([(zoom, row0 + r, (col0 + c) % n)
+                          for r in range(rows) for c in range(columns)])
+    return viewports
+
+
+def time_redraws(redraw, viewports):
+    start = time.perf_counter()
+    tiles = 0
+    for keys in viewports:
+        redraw(keys)
+        tiles += len(keys)
+    return (time.perf_counter() - start) / tiles
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--redraws', type=int, default=2000)
+    ap.add_argument('--zoom', type=int, default=4)
+    args = ap.parse_args()
+
+    filename = get_builtin_mbtiles_path()
+    tileset = MbtileSet(mbtiles=filename)
+    viewports = make_viewports(args.redraws, args.zoom)
+
+    def formatted(keys):
+        for key in keys:
+            formatted_get_png(tileset.conn, *key)
+
+    def parameterized(keys):
+        for key in keys:
+            tileset.get_tile(*key).get_png()
+
+    def batched(keys):
+        tileset.get_tiles(keys)
+
+    manager = MBTileManager(filename=filename, process_raw=lambda data: data)
+
+    def manager_redraw(prefetch):
+        def redraw(keys):
+            manager._clear_cache()
+            if prefetch:
+                manager.set_visible_tiles(dict.fromkeys(keys, 0))
+            for key in keys:
+                manager.get_tile(*key)
+        return redraw
+
+    # Warm up the page cache and the statement caches
+    for redraw in (formatted, parameterized, batched):
+        redraw(viewports[0])
+
+    print('{} tiles per redraw'.format(len(viewports[0])))
+    for name, redraw in [('formatted SQL', formatted),
+                         ('parameterized', parameterized),
+                         ('batched', batched),
+                         ('manager, per tile', manager_redraw(False)),
+                         ('manager, batched', manager_redraw(True))]:
+        per_tile = time_redraws(redraw, viewports)
+        print('{:18s} {:7.2f} us/tile'.format(name, per_tile * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+""" Compare random-access tile reads from an MBTiles file opened with the
+default connection settings and opened read-only with memory mapping.
+
+Unless an existing file is given, a synthetic file of incompressible tiles
+is generated first, large enough that SQLite's default page cache can't hold
+it. Both modes read the same random sequence of tiles after a warm-up pass,
+so the file is in the OS page cache either way and the difference is the
+copying through SQLite's pager.
+
+Usage::
+
+    python benchmarks/bench_mbtiles_mmap.py [--mbtiles FILE] [--size-mb N]
+                                            [--reads N]
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import os.path as op
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from mapping.enable.mbtiles import MbtileSet
+
+TILE_BYTES = 16 * 1024
+
+
+def make_mbtiles(filename, size_mb):
+    """ Write an MBTiles file of random tiles, about size_mb MiB large. """
+    count = size_mb * 1024 * 1024 // TILE_BYTES
+    conn = sqlite3.connect(filename)
+    with conn:
+        conn.executescript('''
+            CREATE TABLE metadata (name text, value text);
+            CREATE TABLE tiles (zoom_level integer, tile_column integer,
+                                tile_row integer, tile_data blob);
+            CREATE UNIQUE INDEX tile_index
+                ON tiles (zoom_level, tile_column, tile_row);
+        ''')
+        zoom = 0
+        while (1 << zoom) ** 2 < count:
+            zoom += 1
+        n = 1 << zoom
+        conn.executemany(
+            'INSERT INTO tiles VALUES (?, ?, ?, ?)',
+            ((zoom, i % n, i // n, os.urandom(TILE_BYTES))
+             for i in range(count))
+        )
+    conn.close()
+
+
+def tile_keys(filename):
+    conn = sqlite3.connect(filename)
+    keys = conn.execute(
+        'SELECT zoom_level, tile_row, tile_column FROM tiles'
+    ).fetchall()
+    conn.close()
+    return keys
+
+
+def time_reads(tileset, keys):
+    start = time.perf_counter()
+    for key in keys:
+        tileset.get_tile(*key).get_png()
+    return (time.perf_counter() - start) / len(keys)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--mbtiles')
+    ap.add_argument('--size-mb', type=int, default=256)
+    ap.add_argument('--reads', type=int, default=50000)
+    args = ap.parse_args()
+
+    tmpdir = None
+    filename = args.mbtiles
+    if filename is None:
+        tmpdir = tempfile.mkdtemp()
+        filename = op.join(tmpdir, 'random.mbtiles')
+        print('Writing {} MiB of tiles to {}'.format(args.size_mb, filename))
+        make_mbtiles(filename, args.size_mb)
+
+    try:
+        keys = tile_keys(filename)
+        rng = random.Random(0)
+        reads = [rng.choice(keys) for i in range(args.reads)]
+        size = op.getsize(filename)
+        modes = [
+            ('default', MbtileSet(filename)),
+            ('read-only + mmap', MbtileSet(filename, read_only=True,
+                                           mmap_size=size,
+                                           cache_size=-64 * 1024)),
+        ]
+        for name, tileset in modes:
+            # Warm up the OS page cache
+            time_reads(tileset, keys)
+        for name, tileset in modes:
+            per_tile = time_reads(tileset, reads)
+            print('{:18s} {:7.2f} us/tile'.format(name, per_tile * 1e6))
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+""" Compare projecting points to the canvas one at a time with projecting
+them as arrays.
+
+Both directions are timed: WGS84 to canvas coordinates, as done to place
+markers on each zoom change, and back. The array results are checked
+against the scalar ones.
+
+Usage::
+
+    python benchmarks/bench_projection.py [--points N] [--zoom N]
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+
+from mapping.api import get_builtin_mbtiles_path
+from mapping.enable.api import MBTileManager
+from mapping.enable.canvas import MappingCanvas
+
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def scalar_to_screen(canvas, lats, lons):
+    return [canvas.transformToScreen(lat, lon)
+            for lat, lon in zip(lats.tolist(), lons.tolist())]
+
+
+def scalar_to_wgs84(canvas, xs, ys):
+    return [canvas.transformToWGS84(x, y)
+            for x, y in zip(xs.tolist(), ys.tolist())]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    ap.add_argument('--points', type=int, default=1000000)
+    ap.add_argument('--zoom', type=int, default=12)
+    args = ap.parse_args()
+
+    manager = MBTileManager(filename=get_builtin_mbtiles_path())
+    canvas = MappingCanvas(tile_cache=manager, _zoom_level=args.zoom)
+    rng = np.random.default_rng(0)
+    lats = rng.uniform(-85, 85, args.points)
+    lons = rng.uniform(-180, 180, args.points)
+
+    print('{} points, zoom {}'.format(args.points, args.zoom))
+    print('{:<22}{:>12}{:>12}{:>10}'.format('', 'scalar (s)', 'array (s)',
+                                            'speedup'))
+
+    scalar, expected = time_call(scalar_to_screen, canvas, lats, lons)
+    array, (xs, ys) = time_call(canvas.transformToScreen, lats, lons)
+    np.testing.assert_allclose(np.column_stack([xs, ys]), expected,
+                               rtol=1e-9)
+    print('{:<22}{:>12.3f}{:>12.3f}{:>9.0f}x'.format(
+        'WGS84 -> screen', scalar, array, scalar / array))
+
+    scalar, expected = time_call(scalar_to_wgs84, canvas, xs, ys)
+    array, (lats2, lons2) = time_call(canvas.transformToWGS84, xs, ys)
+    np.testing.assert_allclose(np.column_stack([lats2, lons2]), expected,
+                               rtol=1e-9, atol=1e-9)
+    print('{:<22}{:>12.3f}{:>12.3f}{:>9.0f}x'.format(
+        'screen -> WGS84', scalar, array, scalar / array))
+
+
+if __name__ == '__main__':
+    main()
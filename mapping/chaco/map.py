@@ -107,7 +107,7 @@ class Map(AbstractOverlay):
                 range.set_bounds(midp - half, midp + half)
             self.invalidate()
 
-    @on_trait_change("_canvas:tile_cache:tile_ready")
+    @on_trait_change("_canvas:tile_cache:tiles_ready")
     def _tile_ready(self):
         self.invalidate()
 
@@ -7,6 +7,13 @@ except ImportError:
     # No geojson
     pass
 
+from .utfgrid import UTFGrid
+from .utfgrid_overlay import UTFGridOverlay
+
 # Tile managers
 from .mbtile_manager import MBTileManager
 from .http_tile_manager import HTTPTileManager
+
+# Tile caches
+from .disk_tile_cache import DiskTileCache
+from .tile_cache import TileCache, get_global_tile_cache
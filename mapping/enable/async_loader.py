@@ -1,41 +1,90 @@
 from abc import ABCMeta, abstractmethod
-from threading import Event, Thread
+import heapq
+from itertools import count
+import logging
+from threading import Event, Lock, Thread
 
 from six.moves import queue
 from six import with_metaclass
 
-from traits.api import HasTraits, Any, Instance
+from traits.api import HasTraits, Any, Bool, Instance, List, Range
+
+logger = logging.getLogger(__name__)
 
 
 class AsyncLoader(HasTraits):
     """ A class which executes generic 'request' objects off of the main thread
+
+    Requests are drained from a single queue by a pool of `num_workers`
+    threads. The pool can be resized while the loader is running.
+
+    Queued requests are executed in order of their priority. Requests which
+    have gone stale by the time a worker gets to them are discarded instead
+    of being executed.
     """
 
+    #: The number of worker threads draining the request queue.
+    num_workers = Range(low=1, value=1)
+
+    #: True while the worker threads are running.
+    running = Bool(False)
+
     def start(self):
-        self._thread.start()
+        with self._lock:
+            self._stop_signal.clear()
+            self._resize_pool(self.num_workers)
+            self.running = True
 
     def stop(self):
-        self._stop_signal.set()
-        self._thread.join()
+        with self._lock:
+            self._stop_signal.set()
+            threads, self._threads = self._threads, []
+            self.running = False
+        for thread in threads:
+            thread.join()
 
     def put(self, request):
         self._queue.put(request)
 
+    def reprioritize(self):
+        """ Re-evaluate the priority of every queued request and discard the
+        ones which have gone stale.
+        """
+        for request in self._queue.reprioritize():
+            _discard(request)
+
     # Private interface ##################################################
 
-    _thread = Any
+    _threads = List(Instance(Thread))
     _stop_signal = Any
     _queue = Instance(queue.Queue)
-
-    def __thread_default(self):
-        return RequestingThread(self._queue, self._stop_signal)
+    _lock = Any
+
+    def _resize_pool(self, count):
+        threads = [t for t in self._threads if not t.retire_signal.is_set()]
+        while len(threads) > count:
+            # Retire the newest workers. They exit after their current request
+            threads.pop().retire_signal.set()
+        while len(threads) < count:
+            thread = RequestingThread(self._queue, self._stop_signal)
+            thread.start()
+            threads.append(thread)
+        self._threads = threads
+
+    def _num_workers_changed(self, new):
+        with self._lock:
+            if self.running:
+                self._resize_pool(new)
 
     def __queue_default(self):
-        return queue.Queue()
+        return RequestQueue()
 
     def __stop_signal_default(self):
         return Event()
 
+    def __lock_default(self):
+        return Lock()
+
 
 class AsyncRequest(with_metaclass(ABCMeta, object)):
     """ Interface for requests processed by AsyncLoader """
@@ -45,23 +94,105 @@ class AsyncRequest(with_metaclass(ABCMeta, object)):
         """ Run the request
         """
 
+    def priority(self):
+        """ Return the priority of the request. Lower values run first.
+        """
+        return 0
+
+    def is_stale(self):
+        """ Return True if the request is no longer needed.
+        """
+        return False
+
+    def discard(self):
+        """ Called instead of `execute` when a stale request is dropped.
+        """
+
+
+class RequestQueue(queue.Queue):
+    """ A queue which hands out requests in order of their priority.
+
+    Requests of equal priority are handed out in the order they were put.
+    """
+
+    def reprioritize(self):
+        """ Recompute the priorities of the queued requests.
+
+        Stale requests are removed from the queue and returned.
+        """
+        with self.mutex:
+            stale, entries = [], []
+            for _, seq, request in self.queue:
+                if _is_stale(request):
+                    stale.append(request)
+                else:
+                    entries.append((request.priority(), seq, request))
+            heapq.heapify(entries)
+            self.queue = entries
+            if stale:
+                self.not_full.notify(len(stale))
+        return stale
+
+    def _init(self, maxsize):
+        self.queue = []
+        self._counter = count()
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, request):
+        entry = (request.priority(), next(self._counter), request)
+        heapq.heappush(self.queue, entry)
+
+    def _get(self):
+        return heapq.heappop(self.queue)[-1]
+
 
 class RequestingThread(Thread):
+    """ A worker thread which executes requests taken from a queue.
+
+    The thread exits once either the loader-wide `stop_signal` or its own
+    `retire_signal` is set.
+    """
+
     def __init__(self, queue_, stop_signal):
         super(RequestingThread, self).__init__()
         self.queue = queue_
         self.stop_signal = stop_signal
+        self.retire_signal = Event()
         self.daemon = True
 
     def run(self):
         # Wait for any requests
-        while not self.stop_signal.is_set():
+        while not (self.stop_signal.is_set() or self.retire_signal.is_set()):
             try:
-                # Use a timeout so that `self.stop_signal` controls our exit
+                # Use a timeout so that the stop signals control our exit
                 req = self.queue.get(block=True, timeout=1.0)
-                req.execute()
             except queue.Empty:
-                pass
+                continue
+            if _is_stale(req):
+                _discard(req)
+                continue
+            try:
+                req.execute()
+            except Exception:
+                # Don't let a single bad request take down the worker
+                logger.exception("Exception executing %r", req)
+
+
+def _is_stale(request):
+    try:
+        return request.is_stale()
+    except Exception:
+        logger.exception("Exception checking %r", request)
+        return False
+
+
+def _discard(request):
+    try:
+        request.discard()
+    except Exception:
+        logger.exception("Exception discarding %r", request)
 
 
 #: Global async_loader instance. Use get_global_async_loader
@@ -69,14 +200,21 @@ class RequestingThread(Thread):
 _async_loader = None
 
 
-def get_global_async_loader():
+def get_global_async_loader(num_workers=None):
     """
     Get the current global AsyncLoader instance,
     creating and initializing it if necessary.
+
+    If `num_workers` is given, the worker pool of the global loader is
+    resized to that many threads.
     """
     global _async_loader
     if _async_loader is None:
         async_loader = AsyncLoader()
+        if num_workers is not None:
+            async_loader.num_workers = num_workers
         async_loader.start()
         _async_loader = async_loader
+    elif num_workers is not None:
+        _async_loader.num_workers = num_workers
     return _async_loader
@@ -1,11 +1,10 @@
 from __future__ import print_function
 
-import collections
 import functools
+from collections import OrderedDict
 from heapq import nsmallest
 from operator import itemgetter
-
-from six.moves import filterfalse as ifilterfalse
+from threading import Lock
 
 
 class Counter(dict):
@@ -22,81 +21,89 @@ def lru_cache(maxsize=1024):
     Clear the cache with f.clear().
     http://en.wikipedia.org/wiki/Cache_algorithms#Least_Recently_Used
 
+    The cache may be used from several threads at once. The cached function
+    itself is called without holding the lock, so a slow call doesn't block
+    lookups of other keys.
+
     '''
-    maxqueue = maxsize * 10
-
-    def decorating_function(user_function, len=len, iter=iter, tuple=tuple,
-                            sorted=sorted, KeyError=KeyError):
-        cache = {}                   # mapping of args to results
-        queue = collections.deque()  # order that keys have been used
-        refcount = Counter()         # times each key is in the queue
-        sentinel = object()          # marker for looping around the queue
+    def decorating_function(user_function, len=len, tuple=tuple,
+                            sorted=sorted):
+        cache = OrderedDict()        # mapping of args to results, LRU first
+        lock = Lock()                # guards the cache and the statistics
         kwd_mark = object()          # separate positional and keyword args
+        sentinel = object()          # marker for keys not in the cache
+
+        def make_key(args, kwds):
+            # cache key records both positional and keyword args
+            key = args
+            if kwds:
+                key += (kwd_mark,) + tuple(sorted(kwds.items()))
+            return key
+
+        def trim():
+            # purge least recently used cache entries
+            while len(cache) > maxsize:
+                cache.popitem(last=False)
 
         # lookup optimizations (ugly but fast)
-        queue_append, queue_popleft = queue.append, queue.popleft
-        queue_appendleft, queue_pop = queue.appendleft, queue.pop
+        cache_get, move_to_end = cache.get, cache.move_to_end
 
         @functools.wraps(user_function)
         def wrapper(*args, **kwds):
             # cache key records both positional and keyword args
-            key = args[:]
+            key = args
             if kwds:
                 key += (kwd_mark,) + tuple(sorted(kwds.items()))
 
-            # record recent use of this key
-            queue_append(key)
-            refcount[key] += 1
-
-            # get cache entry or compute if not found
-            try:
-                result = cache[key]
-                wrapper.hits += 1
-            except KeyError:
-                result = user_function(*args, **kwds)
-                cache[key] = result
+            # get cache entry and record its recent use
+            with lock:
+                result = cache_get(key, sentinel)
+                if result is not sentinel:
+                    move_to_end(key)
+                    wrapper.hits += 1
+                    return result
+
+            # compute if not found
+            result = user_function(*args, **kwds)
+            with lock:
                 wrapper.misses += 1
-
-                # purge least recently used cache entry
-                if len(cache) > maxsize:
-                    key = queue_popleft()
-                    refcount[key] -= 1
-                    while refcount[key]:
-                        key = queue_popleft()
-                        refcount[key] -= 1
-                    del cache[key], refcount[key]
-
-            # periodically compact the queue by eliminating duplicate keys
-            # while preserving order of most recent access
-            if len(queue) > maxqueue:
-                refcount.clear()
-                queue_appendleft(sentinel)
-                for key in ifilterfalse(refcount.__contains__,
-                                        iter(queue_pop, sentinel)):
-                    queue_appendleft(key)
-                    refcount[key] = 1
-
+                # Keep a value stored by another thread in the meantime, e.g.
+                # with replace(), rather than overwriting it
+                result = cache.setdefault(key, result)
+                move_to_end(key)
+                trim()
             return result
 
         def replace(value, *args, **kwds):
-            # replace a value to the cache
-
-            # cache key records both positional and keyword args
-            key = args
-            if kwds:
-                key += (kwd_mark,) + tuple(sorted(kwds.items()))
-
-            cache[key] = value
+            # replace a value in the cache
+            key = make_key(args, kwds)
+            with lock:
+                cache[key] = value
+                cache.move_to_end(key)
+                trim()
+
+        def peek(*args, **kwds):
+            # look up a value without computing it or counting the access
+            key = make_key(args, kwds)
+            with lock:
+                return cache.get(key)
+
+        def discard(*args, **kwds):
+            # remove a value from the cache, if present
+            key = make_key(args, kwds)
+            with lock:
+                cache.pop(key, None)
 
         def clear():
-            cache.clear()
-            queue.clear()
-            refcount.clear()
-            wrapper.hits = wrapper.misses = 0
+            with lock:
+                cache.clear()
+                wrapper.hits = wrapper.misses = 0
 
         wrapper.hits = wrapper.misses = 0
         wrapper.clear = clear
         wrapper.replace = replace
+        wrapper.peek = peek
+        wrapper.discard = discard
         return wrapper
     return decorating_function
 
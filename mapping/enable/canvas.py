@@ -3,10 +3,11 @@ from __future__ import print_function
 import math
 from io import BytesIO
 
+import numpy as np
 from enable.api import Canvas, ColorTrait
-from kiva.image import Image
+from kiva.image import GraphicsContext, Image
 from kiva.constants import FILL
-from traits.api import Int, Range, Instance, on_trait_change
+from traits.api import Any, Bool, Int, Range, Instance, on_trait_change
 
 from .i_tile_manager import ITileManager
 
@@ -22,9 +23,16 @@ class MappingCanvas(Canvas):
 
     bgcolor = ColorTrait("lightsteelblue")
 
+    #: Whether missing tiles are stood in for by scaled versions of loaded
+    #: tiles from other zoom levels while they load.
+    draw_fallback_tiles = Bool(True)
+
     # FIXME This is a hack - remove when viewport is fixed
     _zoom_level = Int(0)
 
+    # The viewport currently drawing the canvas, if any
+    _viewer = Any
+
     _blank_tile = Instance(Image)
 
     def __blank_tile_default(self):
@@ -55,9 +63,11 @@ class MappingCanvas(Canvas):
 
     def _tile_cache_changed(self, new):
         new.process_raw = lambda d: Image(BytesIO(d))
+        if hasattr(new, 'process_array'):
+            new.process_array = array_to_image
 
-    @on_trait_change('tile_cache:tile_ready')
-    def _tile_ready(self, zoom_row_col):
+    @on_trait_change('tile_cache:tiles_ready')
+    def _tile_ready(self, tiles):
         self.request_redraw()
 
     def _draw_background(self, gc, view_bounds=None, mode="default"):
@@ -93,39 +103,153 @@ class MappingCanvas(Canvas):
                 starty = max(starty, 0)
                 endy = min(endy, rows * tile_size)
 
-            gc.set_alpha(self.tile_alpha)
+            # Find the visible tiles and their distance from the center
+            center_x = x + (width - tile_size) / 2.
+            center_y = y + (height - tile_size) / 2.
+            tiles, visible = [], {}
             for tx in range(startx, endx, tile_size):
                 for ty in range(starty, endy, tile_size):
-                    zoom, row, col = self.tile_cache.convert_to_tilenum(tx, ty,
-                                                                        zoom)
-                    tile = self.tile_cache.get_tile(zoom, row, col)
-                    if not tile:
-                        tile = self._blank_tile
-                    gc.draw_image(tile, (tx, ty, tile_size+1, tile_size+1))
+                    key = self.tile_cache.convert_to_tilenum(tx, ty, zoom)
+                    distance = math.hypot(tx - center_x,
+                                          ty - center_y) / tile_size
+                    visible[key] = min(distance, visible.get(key, distance))
+                    tiles.append((tx, ty, key))
+            self.tile_cache.set_visible_tiles(visible, viewer=self._viewer)
+
+            gc.set_alpha(self.tile_alpha)
+            for tx, ty, (zoom, row, col) in tiles:
+                tile = self.tile_cache.get_tile(zoom, row, col)
+                if not tile:
+                    if (self.draw_fallback_tiles and
+                            self._draw_fallback_tile(gc, tx, ty, zoom)):
+                        continue
+                    tile = self._blank_tile
+                gc.draw_image(tile, (tx, ty, tile_size+1, tile_size+1))
 
         super(MappingCanvas, self)._draw_underlay(gc, view_bounds, mode)
 
+    def _draw_fallback_tile(self, gc, tx, ty, zoom):
+        """ Fill in the missing tile at (tx, ty) from loaded tiles of other
+        zoom levels. Returns False if there is nothing to draw it with.
+        """
+        tile_cache = self.tile_cache
+        tile_size = tile_cache.get_tile_size()
+
+        # Tiles of different levels are matched up by their distance from
+        # the top of the data, as the data of a level is drawn from the
+        # bottom of the canvas and may have an odd number of rows.
+        def level_height(level):
+            return tile_cache.get_data_dimensions(level)[0] * tile_size
+
+        height = level_height(zoom)
+        top = height - ty - tile_size
+
+        # Scale up the matching part of the nearest loaded ancestor
+        for levels in range(1, zoom - tile_cache.min_level + 1):
+            scale = 1 << levels
+            px = tx // scale // tile_size * tile_size
+            ptop = top // scale // tile_size * tile_size
+            py = level_height(zoom - levels) - ptop - tile_size
+            key = tile_cache.convert_to_tilenum(px, py, zoom - levels)
+            tile = tile_cache.get_cached_tile(*key)
+            if tile:
+                size = tile_size * scale
+                y = height - ptop * scale - size
+                with gc:
+                    gc.clip_to_rect(tx, ty, tile_size, tile_size)
+                    gc.draw_image(tile, (px * scale, y,
+                                         size + scale, size + scale))
+                return True
+
+        # Otherwise scale down any loaded children
+        if zoom >= tile_cache.max_level:
+            return False
+        half = tile_size // 2
+        child_height = level_height(zoom + 1)
+        children = []
+        for dx in (0, tile_size):
+            for dtop in (0, tile_size):
+                cy = child_height - top * 2 - dtop - tile_size
+                if cy < 0:
+                    # The data of the level ends above
+                    continue
+                key = tile_cache.convert_to_tilenum(tx * 2 + dx, cy, zoom + 1)
+                tile = tile_cache.get_cached_tile(*key)
+                if tile:
+                    children.append((tile, dx // 2, half - dtop // 2))
+        for tile, dx, dy in children:
+            gc.draw_image(tile, (tx + dx, ty + dy, half + 1, half + 1))
+        return bool(children)
+
     def transformToScreen(self, lat_deg, lon_deg):
+        """ Project WGS84 coordinates to canvas coordinates at the current
+        zoom level. Takes and returns scalars or arrays of coordinates.
+        """
         return self._WGS84_to_screen(lat_deg, lon_deg, self._zoom_level)
 
     def transformToWSG84(self, x, y):
+        """ The inverse of `transformToScreen`. """
         return self._screen_to_WGS84(x, y, self._zoom_level)
 
+    transformToWGS84 = transformToWSG84
+
     def _WGS84_to_screen(self, lat_deg, lon_deg, zoom):
         """
          lat = Latitude in degrees
          lon = Longitude in degrees
          zoom = zoom level
         """
-        lat_rad = math.radians(lat_deg)
         mapsize = self.tile_cache.get_tile_size() << zoom
+        if np.ndim(lat_deg) or np.ndim(lon_deg):
+            return WGS84_to_screen(lat_deg, lon_deg, mapsize)
+        lat_rad = math.radians(lat_deg)
         x = (lon_deg + 180.0) / 360.0 * mapsize
         y = (1- (1.0 - math.log(math.tan(lat_rad) + (1 / math.cos(lat_rad))) / math.pi) / 2.0) * mapsize  # noqa
         return (x, y)
 
     def _screen_to_WGS84(self, x, y, zoom):
         mapsize = self.tile_cache.get_tile_size() << zoom
+        if np.ndim(x) or np.ndim(y):
+            return screen_to_WGS84(x, y, mapsize)
         lon_deg = (x * 360.0 / mapsize) - 180.0
         lat_rad = math.atan(math.sinh(math.pi * (1 - 2 * (1 - y / mapsize))))
         lat_deg = math.degrees(lat_rad)
         return (lat_deg, lon_deg)
+
+
+def WGS84_to_screen(lat_deg, lon_deg, mapsize):
+    """ Project arrays of WGS84 coordinates to Web Mercator coordinates on a
+    map of `mapsize` pixels. Returns arrays of x and y, y pointing north.
+    """
+    lat_rad = np.radians(np.asarray(lat_deg, dtype=np.float64))
+    x = (np.asarray(lon_deg, dtype=np.float64) + 180.0) * (mapsize / 360.0)
+    # log(tan + sec) is asinh(tan), without the division
+    y = (0.5 + np.arcsinh(np.tan(lat_rad)) / (2 * math.pi)) * mapsize
+    return x, y
+
+
+def screen_to_WGS84(x, y, mapsize):
+    """ The inverse of `WGS84_to_screen`. Returns arrays of latitudes and
+    longitudes, in degrees.
+    """
+    lon_deg = np.asarray(x, dtype=np.float64) * (360.0 / mapsize) - 180.0
+    y = np.asarray(y, dtype=np.float64)
+    lat_deg = np.degrees(np.arctan(np.sinh(math.pi * (2 * y / mapsize - 1))))
+    return lat_deg, lon_deg
+
+
+def array_to_image(array):
+    """ Wrap an array of pixels as a kiva image which can be drawn.
+
+    RGB and RGBA arrays of bytes are used as they are, without copying them,
+    so memory-mapped arrays are only read as they are drawn.
+    """
+    if array.ndim == 3 and array.shape[2] == 1:
+        # Grayscale, as stored in single-file pyramids
+        array = array[:, :, 0]
+    if array.ndim == 2:
+        # Grayscale
+        array = np.dstack([array] * 3)
+    pix_format = {3: 'rgb24', 4: 'rgba32'}[array.shape[2]]
+    array = np.ascontiguousarray(array, dtype=np.uint8)
+    return GraphicsContext(array, pix_format=pix_format)
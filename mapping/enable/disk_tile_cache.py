@@ -0,0 +1,206 @@
+import sqlite3
+import time
+from threading import Lock
+
+
+class DiskTileCache(object):
+    """ A persistent, size-bounded tile cache stored in an MBTiles file.
+
+    Tiles are kept in the standard MBTiles `tiles` table, so the cache file
+    can also be opened with MBTileManager. The least recently used tiles are
+    evicted once the cache grows beyond `max_bytes`.
+
+    Each tile may carry cache info, an `(etag, last_modified, expires)` tuple
+    describing how fresh it is.
+
+    Tiles are stored under the tile source they come from, such as the URL
+    pattern of a tile server, so that one cache can hold the tiles of several
+    sources. All sources share the same budget. Tiles stored without a source
+    belong to the empty source.
+
+    A cache may be used from several threads at once.
+    """
+
+    def __init__(self, filename, max_bytes=512 * 1024 * 1024, origin='top'):
+        if origin not in ['bottom', 'top']:
+            raise Exception("origin must be either `bottom` or `top`")
+        self.filename = filename
+        self.max_bytes = max_bytes
+        # Rows of tile keys are flipped into the bottom-origin (TMS) scheme
+        # used by MBTiles when the keys use a top origin.
+        self.origin = origin
+        self._lock = Lock()
+        self._last_used = 0.0
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        with self._lock:
+            self._create_tables()
+            self.total_bytes = self.conn.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM tile_usage'
+            ).fetchone()[0]
+
+    def get(self, zoom, row, col, source=''):
+        """ Return the data of a tile, or None if the tile isn't cached.
+        """
+        entry = self.get_entry(zoom, row, col, source)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, zoom, row, col, source=''):
+        """ Return the data and cache info of a tile, or None if the tile
+        isn't cached. The cache info is None if none was stored.
+        """
+        key = self._key(zoom, row, col, source)
+        with self._lock:
+            result = self.conn.execute(
+                '''SELECT tile_data, etag, last_modified, expires
+                   FROM tiles JOIN tile_usage
+                   USING (zoom_level, tile_column, tile_row, source)
+                   WHERE zoom_level = ? AND tile_column = ?
+                   AND tile_row = ? AND source = ?''',
+                key
+            ).fetchone()
+            if result is None:
+                return None
+            with self.conn:
+                self.conn.execute(
+                    '''UPDATE tile_usage SET last_used = ?
+                       WHERE zoom_level = ? AND tile_column = ?
+                       AND tile_row = ? AND source = ?''',
+                    (self._now(),) + key
+                )
+        info = tuple(result[1:])
+        if info[2] is None:
+            info = None
+        return bytes(result[0]), info
+
+    def put(self, zoom, row, col, data, info=None, source=''):
+        """ Store the data and cache info of a tile, evicting old tiles if
+        necessary.
+        """
+        if info is None:
+            info = (None, None, None)
+        key = self._key(zoom, row, col, source)
+        size = len(data)
+        with self._lock:
+            with self.conn:
+                old = self.conn.execute(
+                    '''SELECT size FROM tile_usage
+                       WHERE zoom_level = ? AND tile_column = ?
+                       AND tile_row = ? AND source = ?''',
+                    key
+                ).fetchone()
+                self.conn.execute(
+                    '''INSERT OR REPLACE INTO tiles
+                       (zoom_level, tile_column, tile_row, source, tile_data)
+                       VALUES (?, ?, ?, ?, ?)''',
+                    key + (sqlite3.Binary(data),)
+                )
+                self.conn.execute(
+                    '''INSERT OR REPLACE INTO tile_usage
+                       (zoom_level, tile_column, tile_row, source, size,
+                        last_used, etag, last_modified, expires)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                    key + (size, self._now()) + tuple(info)
+                )
+                self.total_bytes += size - (old[0] if old else 0)
+                self._evict()
+
+    def update_info(self, zoom, row, col, info, source=''):
+        """ Replace the cache info of a tile, if it is cached.
+        """
+        key = self._key(zoom, row, col, source)
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    '''UPDATE tile_usage
+                       SET etag = ?, last_modified = ?, expires = ?
+                       WHERE zoom_level = ? AND tile_column = ?
+                       AND tile_row = ? AND source = ?''',
+                    tuple(info) + key
+                )
+
+    def clear(self):
+        """ Remove every tile from the cache.
+        """
+        with self._lock:
+            with self.conn:
+                self.conn.execute('DELETE FROM tiles')
+                self.conn.execute('DELETE FROM tile_usage')
+            self.total_bytes = 0
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    # Private interface ##################################################
+
+    def _create_tables(self):
+        # WAL lets readers in other processes work alongside our writes
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        with self.conn:
+            self.conn.executescript('''
+                CREATE TABLE IF NOT EXISTS metadata (name text, value text);
+                CREATE TABLE IF NOT EXISTS tiles (
+                    zoom_level integer,
+                    tile_column integer,
+                    tile_row integer,
+                    tile_data blob,
+                    source text NOT NULL DEFAULT ''
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS tile_index
+                    ON tiles (zoom_level, tile_column, tile_row, source);
+                CREATE TABLE IF NOT EXISTS tile_usage (
+                    zoom_level integer,
+                    tile_column integer,
+                    tile_row integer,
+                    source text,
+                    size integer,
+                    last_used real,
+                    etag text,
+                    last_modified text,
+                    expires real,
+                    PRIMARY KEY (zoom_level, tile_column, tile_row, source)
+                );
+                CREATE INDEX IF NOT EXISTS tile_usage_last_used
+                    ON tile_usage (last_used);
+            ''')
+
+    def _evict(self):
+        """ Delete least recently used tiles, whatever their source, until
+        the cache fits its budget. Must be called with the lock held, inside
+        a transaction.
+        """
+        while self.total_bytes > self.max_bytes:
+            victims = self.conn.execute(
+                '''SELECT zoom_level, tile_column, tile_row, source, size
+                   FROM tile_usage ORDER BY last_used LIMIT 64'''
+            ).fetchall()
+            if not victims:
+                self.total_bytes = 0
+                break
+            for zoom, col, row, source, size in victims:
+                key = (zoom, col, row, source)
+                self.conn.execute(
+                    '''DELETE FROM tiles WHERE zoom_level = ?
+                       AND tile_column = ? AND tile_row = ? AND source = ?''',
+                    key
+                )
+                self.conn.execute(
+                    '''DELETE FROM tile_usage WHERE zoom_level = ?
+                       AND tile_column = ? AND tile_row = ? AND source = ?''',
+                    key
+                )
+                self.total_bytes -= size
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+    def _now(self):
+        # Strictly increasing, so that the usage order is never ambiguous
+        self._last_used = max(time.time(), self._last_used + 1e-6)
+        return self._last_used
+
+    def _key(self, zoom, row, col, source):
+        zoom, row, col = int(zoom), int(row), int(col)
+        if self.origin == 'top':
+            row = (1 << zoom) - 1 - row
+        return zoom, col, row, source
@@ -5,7 +5,10 @@ import numpy as np
 from chaco.api import AbstractOverlay
 from enable.compiled_path import CompiledPath
 from kiva.constants import FILL_STROKE
-from traits.api import Str, List, Array
+from traits.api import Str, List, Array, Instance
+
+from .canvas import WGS84_to_screen as project
+from .grid_index import GridIndex
 
 
 class GeoJSONOverlay(AbstractOverlay):
@@ -17,6 +20,12 @@ class GeoJSONOverlay(AbstractOverlay):
 
     _colors = Array
 
+    #: An index of the bounding boxes of the paths.
+    _index = Instance(GridIndex)
+
+    def __index_default(self):
+        return GridIndex([])
+
     def _geojs_filename_changed(self, name):
         with open(name, 'r') as fp:
             data = fp.read()
@@ -29,6 +38,7 @@ class GeoJSONOverlay(AbstractOverlay):
                 path.lines(p)
             paths.append(path)
         self._paths = paths
+        self._index = GridIndex([polygon_bounds(poly) for poly in polys])
 
         red = np.array([202, 0, 32])/255.
         blue = np.array([5, 113, 176])/255.
@@ -53,10 +63,14 @@ class GeoJSONOverlay(AbstractOverlay):
 
             gc.scale_ctm(factor, factor)
 
-            for path, color in zip(self._paths, self._colors):
+            # Only draw the paths which can be seen
+            visible = self._index.query(x / factor, y / factor,
+                                        (x + width) / factor,
+                                        (y + height) / factor)
+            for i in visible:
                 gc.begin_path()
-                gc.add_path(path)
-                gc.set_fill_color(color)
+                gc.add_path(self._paths[i])
+                gc.set_fill_color(self._colors[i])
                 gc.draw_path(FILL_STROKE)
         super(GeoJSONOverlay, self).overlay(other_component, gc, view_bounds,
                                             mode)
@@ -80,6 +94,18 @@ def process_raw(data):
     return polys
 
 
+def polygon_bounds(poly):
+    """ Return the (xmin, ymin, xmax, ymax) bounds of the rings of a
+    polygon, empty bounds if it has no points.
+    """
+    rings = [np.asarray(ring).reshape(-1, 2) for ring in poly]
+    points = np.concatenate(rings) if rings else np.zeros((0, 2))
+    if len(points) == 0:
+        return (np.inf, np.inf, -np.inf, -np.inf)
+    (xmin, ymin), (xmax, ymax) = points.min(axis=0), points.max(axis=0)
+    return (xmin, ymin, xmax, ymax)
+
+
 def process_geometry(obj, polys):
     if obj.type == "MultiPolygon":
         for poly in obj.coordinates:
@@ -94,7 +120,7 @@ def process_geometry(obj, polys):
 
 
 def WGS84_to_screen(coords):
-    coords[:, :, 0] = (coords[:, :, 0] + 180.) / 360.
-    coords[:, :, 1] = np.radians(coords[:, :, 1])
-    coords[:, :, 1] = (1 - (1. - np.log(np.tan(coords[:, :, 1]) + (1 / np.cos(coords[:, :, 1]))) / np.pi) / 2.0)  # noqa
+    # Project to the unit square, the overlay scales it to the map size
+    coords[:, :, 0], coords[:, :, 1] = project(coords[:, :, 1],
+                                               coords[:, :, 0], 1.0)
     return coords
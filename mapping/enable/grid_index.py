@@ -0,0 +1,80 @@
+import numpy as np
+
+
+class GridIndex(object):
+    """ A uniform grid index of bounding boxes, for finding the boxes which
+    intersect a rectangle.
+
+    Each box is listed in every cell of the grid it overlaps. A query only
+    looks at the boxes listed in the cells the rectangle overlaps, then
+    checks those boxes exactly.
+    """
+
+    def __init__(self, bboxes, extent=(0., 0., 1., 1.), cells=64):
+        #: The (xmin, ymin, xmax, ymax) of each box, as an (N, 4) array.
+        self.bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        #: The (xmin, ymin, xmax, ymax) area covered by the grid. Boxes
+        #: outside of it are clamped to its border cells.
+        self.extent = tuple(extent)
+        #: The number of cells along each side of the grid.
+        self.cells = cells
+
+        # Build the lists of boxes of the cells in compressed form: the
+        # boxes of cell i are items[starts[i]:starts[i + 1]].
+        col0, row0, col1, row1 = self._cell_ranges(self.bboxes.T)
+        widths = col1 - col0 + 1
+        heights = row1 - row0 + 1
+        # Empty boxes, with their minimum above their maximum, are in no cell
+        counts = np.where((widths > 0) & (heights > 0), widths * heights, 0)
+        boxes = np.repeat(np.arange(len(self.bboxes)), counts)
+        # Enumerate the cells of each box, row-major within the box
+        offsets = np.arange(counts.sum()) - np.repeat(
+            np.cumsum(counts) - counts, counts)
+        box_widths = np.repeat(widths, counts)
+        cols = np.repeat(col0, counts) + offsets % box_widths
+        rows = np.repeat(row0, counts) + offsets // box_widths
+        cell_ids = rows * cells + cols
+
+        order = np.argsort(cell_ids, kind='stable')
+        self._items = boxes[order]
+        self._starts = np.searchsorted(cell_ids[order],
+                                       np.arange(cells * cells + 1))
+
+    def __len__(self):
+        return len(self.bboxes)
+
+    def query(self, xmin, ymin, xmax, ymax):
+        """ Return the sorted indices of the boxes intersecting a rectangle.
+        """
+        if len(self.bboxes) == 0:
+            return np.zeros(0, dtype=int)
+        col0, row0, col1, row1 = (int(value) for value in self._cell_ranges(
+            (xmin, ymin, xmax, ymax)))
+        if col1 < col0 or row1 < row0:
+            return np.zeros(0, dtype=int)
+        starts, items = self._starts, self._items
+        candidates = np.concatenate([
+            items[starts[row * self.cells + col0]:
+                  starts[row * self.cells + col1 + 1]]
+            for row in range(row0, row1 + 1)
+        ])
+        candidates = np.unique(candidates)
+        bboxes = self.bboxes[candidates]
+        hits = ((bboxes[:, 0] <= xmax) & (bboxes[:, 2] >= xmin) &
+                (bboxes[:, 1] <= ymax) & (bboxes[:, 3] >= ymin))
+        return candidates[hits]
+
+    def _cell_ranges(self, bounds):
+        """ Return the first and last columns and rows of the cells covered
+        by (xmin, ymin, xmax, ymax) bounds, as scalars or arrays.
+        """
+        x0, y0, x1, y1 = self.extent
+        cells = self.cells
+        xmin, ymin, xmax, ymax = (np.asarray(value) for value in bounds)
+
+        def cell(value, start, end):
+            index = np.floor((value - start) / (end - start) * cells)
+            return np.clip(index, 0, cells - 1).astype(int)
+
+        return (cell(xmin, x0, x1), cell(ymin, y0, y1),
+                cell(xmax, x0, x1), cell(ymax, y0, y1))
@@ -1,16 +1,27 @@
 from __future__ import print_function
 
+from collections import namedtuple
+from email.utils import mktime_tz, parsedate_tz
 import logging
+import re
+import sqlite3
+from threading import Lock
+import time
+from weakref import WeakKeyDictionary
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from traits.api import Int, Str, on_trait_change, Instance, provides
+from traits.api import (
+    Any, Dict, Float, Int, Str, Tuple, on_trait_change, Instance, provides
+)
 from pyface.gui import GUI
 
 from .i_tile_manager import ITileManager
-from .tile_manager import TileManager
-from .cacheing_decorators import lru_cache
-from .async_loader import AsyncLoader, AsyncRequest, get_global_async_loader
+from .tile_manager import _MISSING, AsyncTileRequest, TileManager
+from .async_loader import AsyncLoader, get_global_async_loader
+from .disk_tile_cache import DiskTileCache
 
 
 @provides(ITileManager)
@@ -31,14 +42,32 @@ class HTTPTileManager(TileManager):
         row = (n - 1 - y / size % n)
         return (zoom, row, col)
 
-    @lru_cache()
     def get_tile(self, zoom, row, col):
-        # Schedule a request to get the tile
-        self.async_loader.put(TileRequest(self._tile_received,
-                                          self.server, self.port, self.url,
-                                          dict(zoom=zoom, row=row, col=col)))
-        # return a blank tile for now
-        return None
+        key = (zoom, row, col)
+        tile = self._get_from_cache(key, _MISSING)
+        if tile is _MISSING:
+            self._request_tile(zoom, row, col)
+            # return a blank tile for now
+            return None
+        if tile is not None:
+            validators = self._validators.get(key)
+            if validators is not None and validators.expires < time.time():
+                # Serve the stale tile while it is revalidated
+                self._request_tile(zoom, row, col, validators)
+        return tile
+
+    def set_visible_tiles(self, tiles, viewer=None):
+        if viewer is None:
+            viewer = self
+        tiles = dict(tiles)
+        regions = self._visible_regions
+        if (regions.get(viewer) == tiles and
+                len(regions) == len(self._visible)):
+            return
+        regions[viewer] = tiles
+        # Loader threads only ever read this snapshot
+        self._visible = tuple(regions.values())
+        self.async_loader.reprioritize()
 
     # Public interface ################################################
 
@@ -46,50 +75,347 @@ class HTTPTileManager(TileManager):
     port = Int(80)
     url = Str
 
+    #: The maximum number of pooled keep-alive connections to the server.
+    pool_size = Int(10)
+
+    #: The number of times a failed tile request is retried.
+    max_retries = Int(2)
+
+    #: The (connect, read) timeouts of a tile request, in seconds.
+    timeout = Tuple(Float(3.05), Float(10.0))
+
+    #: The HTTP session used to fetch tiles. By default this is a pooled
+    #: session shared by all the managers talking to the same server.
+    session = Instance(requests.Session)
+
+    #: An optional persistent cache which is checked before the server is
+    #: asked for a tile. Tiles are kept apart by server and url, so a cache
+    #: can be shared by several managers.
+    disk_cache = Instance(DiskTileCache)
+
+    #: How long tiles stay fresh when the server doesn't say, in seconds.
+    default_max_age = Float(24 * 60 * 60)
+
+    #: How long to wait before revalidating a tile again after a failed
+    #: revalidation, in seconds.
+    retry_interval = Float(60)
+
     # Private interface ##################################################
 
+    #: The tiles visible in each viewer, keyed weakly on the viewer.
+    _visible_regions = Instance(WeakKeyDictionary, ())
+
+    #: A snapshot of the visible tiles of all viewers.
+    _visible = Any(())
+
+    #: The cache validators of each tile received from the server.
+    _validators = Dict
+
     def _async_loader_default(self):
         return get_global_async_loader()
 
-    def _tile_received(self, tile_args, data):
+    def _session_default(self):
+        return get_shared_session(self.server, self.port,
+                                  pool_size=self.pool_size,
+                                  max_retries=self.max_retries)
+
+    @on_trait_change('server, port, pool_size, max_retries')
+    def _reset_session(self):
+        self.reset_traits(['session'])
+
+    def _request_tile(self, zoom, row, col, validators=None):
+        key = (zoom, row, col)
+        if key in self._pending:
+            # A fetch is already in flight. Everyone waiting on the tile is
+            # notified through `tile_ready` when it arrives.
+            return
+
+        # Schedule a request to get the tile
+        tile_args = dict(zoom=zoom, row=row, col=col)
+        self._pending[key] = tile_args
+        self.async_loader.put(TileRequest(self._tile_received,
+                                          self.server, self.port, self.url,
+                                          tile_args,
+                                          session=self.session,
+                                          timeout=self.timeout,
+                                          disk_cache=self.disk_cache,
+                                          validators=validators,
+                                          default_max_age=self.default_max_age,
+                                          process_raw=self.process_raw,
+                                          priority=self._tile_priority,
+                                          is_stale=self._tile_is_stale,
+                                          on_discard=self._tile_discarded))
+
+    def _tile_received(self, tile_args, data, validators=None,
+                       not_modified=False):
         zoom, row, col = tile_args['zoom'], tile_args['row'], tile_args['col']
-        try:
-            data = self.process_raw(data)
-            self.get_tile.replace(data, self, zoom, row, col)
+        key = (zoom, row, col)
+        if not self._finish_pending(key, tile_args):
+            # The cache was reset while the tile was in flight
+            return
+        if not_modified:
+            # Our copy of the tile is still good
+            self._validators[key] = validators
+            return
+        if data is None:
+            # The request failed. Keep whatever is in the cache, and hold off
+            # revalidating it for a while.
+            old = self._validators.get(key)
+            if old is not None:
+                self._validators[key] = old._replace(
+                    expires=time.time() + self.retry_interval
+                )
+            if self.get_cached_tile(zoom, row, col) is None:
+                # Remember the failure so that the tile isn't requested on
+                # every draw
+                self._put_in_cache(key, None)
+            return
+        # The tile was already decoded by the loader thread
+        self._put_in_cache(key, data)
+        if validators is not None:
+            self._validators[key] = validators
+        self.tile_ready = (zoom, row, col)
+
+    def _tile_evicted(self, key):
+        # Validators are only useful along with the tile
+        self._validators.pop(key, None)
+
+    def _tile_priority(self, tile_args):
+        key = tile_args['zoom'], tile_args['row'], tile_args['col']
+        distances = [r[key] for r in self._visible if key in r]
+        return min(distances) if distances else 0
+
+    def _tile_is_stale(self, tile_args):
+        key = tile_args['zoom'], tile_args['row'], tile_args['col']
+        visible = self._visible
+        return bool(visible) and not any(key in r for r in visible)
+
+    def _tile_discarded(self, tile_args):
+        zoom, row, col = tile_args['zoom'], tile_args['row'], tile_args['col']
+        if not self._finish_pending((zoom, row, col), tile_args):
+            return
+        if not self._tile_is_stale(tile_args):
+            # The tile came back into view in the meantime
             self.tile_ready = (zoom, row, col)
-        except Exception:
-            # Failed to process tile
-            logging.exception(
-                "Failed to process %s%s",
-                self.server,
-                self.url % tile_args,
-            )
-
-    @on_trait_change('server, url')
+
+    @on_trait_change('server, port, url', post_init=True)
     def _reset_cache(self, new):
-        self.get_tile.clear()
+        self._clear_cache()
+        self._validators = {}
+        # Results of requests still in flight are for the old server
+        self._pending = {}
         # This is a hack to repaint
         self.tile_ready = 0, 0, 0
 
 
-class TileRequest(AsyncRequest):
-    def __init__(self, handler, host, port, url, tile_args):
-        self.handler = handler
+#: The HTTP cache validators of a tile, and the time at which it expires.
+TileValidators = namedtuple('TileValidators', 'etag last_modified expires')
+
+
+class TileRequest(AsyncTileRequest):
+    """ A request for a single tile.
+
+    The tile is taken from the disk cache if it's there, otherwise it is
+    fetched from the server. If `validators` are given, the request instead
+    revalidates a tile we already have, and the handler is told whether it
+    has been modified.
+
+    The tile data is passed through `process_raw` on the loader thread, so
+    that the handler only receives tiles which are ready to draw.
+    """
+
+    def __init__(self, handler, host, port, url, tile_args, session=None,
+                 timeout=None, disk_cache=None, validators=None,
+                 default_max_age=0, process_raw=None, priority=None,
+                 is_stale=None, on_discard=None):
+        super(TileRequest, self).__init__(handler, process_raw)
         self._host = host
+        self._port = port
         self._url = url
         self._tile_args = tile_args
+        self._session = session if session is not None else requests
+        self._timeout = timeout
+        self._disk_cache = disk_cache
+        self._validators = validators
+        self._default_max_age = default_max_age
+        self._priority = priority
+        self._is_stale = is_stale
+        self._on_discard = on_discard
+
+    def priority(self):
+        if self._priority is None:
+            return 0
+        return self._priority(self._tile_args)
+
+    def is_stale(self):
+        if self._is_stale is None:
+            return False
+        return self._is_stale(self._tile_args)
+
+    def discard(self):
+        if self._on_discard is not None:
+            GUI.invoke_later(self._on_discard, self._tile_args)
 
     def execute(self):
-        url = 'http://' + self._host + self._url % self._tile_args
+        zoom, row, col = [self._tile_args[k] for k in ('zoom', 'row', 'col')]
+        old = self._validators
+        if old is None:
+            entry = self._read_disk_cache(zoom, row, col)
+            if entry is not None:
+                # Expired tiles are revalidated when the manager next asks
+                # for them.
+                data, validators = self._process(entry[0]), entry[1]
+                if data is not None:
+                    GUI.invoke_later(self.handler, self._tile_args, data,
+                                     validators)
+                    return
+
+        headers = {}
+        if old is not None:
+            if old.etag:
+                headers['If-None-Match'] = old.etag
+            if old.last_modified:
+                headers['If-Modified-Since'] = old.last_modified
+
+        url = _base_url(self._host, self._port) + self._url % self._tile_args
         try:
-            r = requests.get(url)
+            r = self._session.get(url, headers=headers, timeout=self._timeout)
             if r.status_code == 200:
-                GUI.invoke_later(self.handler, self._tile_args, r.content)
+                validators = get_validators(r.headers, self._default_max_age)
+                data = self._process(r.content)
+                if data is not None:
+                    if not _no_store(r.headers):
+                        self._write_disk_cache(zoom, row, col, r.content,
+                                               validators)
+                    GUI.invoke_later(self.handler, self._tile_args, data,
+                                     validators)
+                    return
+            elif r.status_code == 304 and old is not None:
+                validators = get_validators(r.headers, self._default_max_age,
+                                            old)
+                self._update_disk_cache(zoom, row, col, validators)
+                GUI.invoke_later(self.handler, self._tile_args, None,
+                                 validators, not_modified=True)
+                return
         except requests.exceptions.RequestException as ex:
             print("Exception in request '{}': {}".format(self, ex))
+        # Let the handler know that nothing is coming
+        GUI.invoke_later(self.handler, self._tile_args, None)
+
+    def _source(self):
+        """ The tile source of the request, for the disk cache. """
+        return _base_url(self._host, self._port) + self._url
+
+    def _read_disk_cache(self, zoom, row, col):
+        if self._disk_cache is None:
+            return None
+        try:
+            entry = self._disk_cache.get_entry(zoom, row, col,
+                                               self._source())
+        except sqlite3.Error:
+            logging.exception("Failed to read %s from the disk cache", self)
+            return None
+        if entry is None:
+            return None
+        data, info = entry
+        return data, None if info is None else TileValidators(*info)
+
+    def _write_disk_cache(self, zoom, row, col, data, validators):
+        if self._disk_cache is None:
+            return
+        try:
+            self._disk_cache.put(zoom, row, col, data, validators,
+                                 self._source())
+        except sqlite3.Error:
+            logging.exception("Failed to write %s to the disk cache", self)
+
+    def _update_disk_cache(self, zoom, row, col, validators):
+        if self._disk_cache is None:
+            return
+        try:
+            self._disk_cache.update_info(zoom, row, col, validators,
+                                         self._source())
+        except sqlite3.Error:
+            logging.exception("Failed to update %s in the disk cache", self)
 
     def __str__(self):
         return "TileRequest for %s" % str(self._tile_args)
 
     def __repr__(self):
         return str(self)
+
+
+#: Pooled sessions shared between tile managers, keyed on the server and
+#: connection settings. Use get_shared_session to request a session.
+_sessions = {}
+_sessions_lock = Lock()
+
+
+def get_shared_session(host, port=80, pool_size=10, max_retries=2):
+    """ Get a pooled, keep-alive session for requests to a tile server.
+
+    Connections to the server are reused across tile requests, and at most
+    `pool_size` of them are kept open. Requests which fail to connect or get
+    a server error response are retried up to `max_retries` times.
+    """
+    key = (host, port, pool_size, max_retries)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            retries = Retry(total=max_retries, backoff_factor=0.1,
+                            status_forcelist=(500, 502, 503, 504))
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                                  max_retries=retries, pool_block=True)
+            session = requests.Session()
+            session.mount(_base_url(host, port), adapter)
+            _sessions[key] = session
+    return session
+
+
+def _base_url(host, port):
+    if port == 80:
+        return 'http://' + host
+    return 'http://{}:{}'.format(host, port)
+
+
+def get_validators(headers, default_max_age, old=None):
+    """ Extract the cache validators and expiry time from response headers.
+
+    Validators missing from a 304 response are carried over from `old`.
+    """
+    now = time.time()
+    etag = headers.get('ETag')
+    last_modified = headers.get('Last-Modified')
+    if old is not None:
+        etag = etag or old.etag
+        last_modified = last_modified or old.last_modified
+
+    cache_control = headers.get('Cache-Control', '').lower()
+    max_age = re.search(r'(?:^|[\s,])max-age\s*=\s*"?(\d+)', cache_control)
+    if 'no-cache' in cache_control:
+        expires = now
+    elif max_age is not None:
+        age = headers.get('Age', '0')
+        age = int(age) if age.isdigit() else 0
+        expires = now + int(max_age.group(1)) - age
+    elif headers.get('Expires'):
+        expires = _http_date(headers['Expires'], now)
+        date = _http_date(headers.get('Date'), None)
+        if date is not None:
+            # Correct for the difference between our clock and the server's
+            expires += now - date
+    else:
+        expires = now + default_max_age
+
+    return TileValidators(etag, last_modified, expires)
+
+
+def _http_date(value, default):
+    parsed = parsedate_tz(value) if value else None
+    if parsed is None:
+        return default
+    return mktime_tz(parsed)
+
+
+def _no_store(headers):
+    return 'no-store' in headers.get('Cache-Control', '').lower()
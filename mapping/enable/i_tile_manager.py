@@ -20,6 +20,19 @@ class ITileManager(Interface):
         """ Request a tile at row and col for a particular zoom level
         """
 
+    def get_cached_tile(self, zoom, row, col):
+        """ Return a tile if it is already loaded, without requesting it.
+        Returns None if the tile isn't loaded.
+        """
+
+    def set_visible_tiles(self, tiles, viewer=None):
+        """ Tell the manager which tiles are currently on screen.
+
+        `tiles` maps (zoom, row, col) tuples to their distance from the center
+        of the view, in tiles. `viewer` identifies the view being drawn, so
+        that several views can share one manager.
+        """
+
     def get_wrap_flags(self):
         """ Return a tuple of booleans which indicate which axes should wrap
         infinitely.
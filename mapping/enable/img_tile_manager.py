@@ -1,44 +1,43 @@
 from __future__ import division
 
 from io import BytesIO
-import os
 import os.path as op
 
 import numpy as np
 from PIL import Image
 
-from traits.api import String, Tuple, provides
+from traits.api import Instance, String, Tuple, provides
 
-from .cacheing_decorators import lru_cache
 from .i_tile_manager import ITileManager
-from .tile_manager import TileManager
+from .lod_manifest import load_lod_dir
+from .pyramid import Pyramid
+from .tile_manager import _MISSING, TileManager
 
 
 @provides(ITileManager)
 class ImageTileManager(TileManager):
 
+    #: A directory of tiles, stored as lod_dir/<level>/<row>.<col>.npy files.
     lod_dir = String
-    _level_dimensions = Tuple
 
-    @lru_cache(maxsize=256)
-    def get_tile(self, zoom, row, col):
-        if zoom >= len(self._level_dimensions):
-            return None
+    #: A single-file pyramid of tiles, as written by `PyramidWriter`, used
+    #: instead of `lod_dir`.
+    filename = String
 
-        # Flip the Y axis
-        num_rows, _ = self.get_data_dimensions(zoom)
-        row = num_rows - 1 - row
+    _level_dimensions = Tuple
 
-        zoom_dir = op.join(self.lod_dir, str(int(zoom)))
-        tile_path = op.join(zoom_dir, '{}.{}.npy'.format(row, col))
-        if not op.exists(tile_path):
-            return None
+    #: Boolean arrays of the tiles present in each level of `lod_dir`.
+    _tile_presence = Tuple
 
-        tile = np.load(tile_path)
-        img = Image.fromarray(tile, mode='RGB')
-        data = BytesIO()
-        img.save(data, format='png')
-        return self.process_raw(data.getvalue())
+    _pyramid = Instance(Pyramid)
+
+    def get_tile(self, zoom, row, col):
+        key = (zoom, row, col)
+        tile = self._get_from_cache(key, _MISSING)
+        if tile is _MISSING:
+            tile = self._load_tile(zoom, row, col)
+            self._put_in_cache(key, tile)
+        return tile
 
     def get_tile_size(self):
         return 256
@@ -59,37 +58,59 @@ class ImageTileManager(TileManager):
         row = y // size % n
         return zoom, row, col
 
-    def _lod_dir_changed(self, new):
-        self.get_tile.clear()
+    def _load_tile(self, zoom, row, col):
+        if zoom >= len(self._level_dimensions):
+            return None
+
+        # Flip the Y axis
+        num_rows, _ = self.get_data_dimensions(zoom)
+        row = num_rows - 1 - row
+
+        tile = self._read_tile(int(zoom), int(row), int(col))
+        if tile is None:
+            return None
+
+        if self.process_array is not None:
+            # Hand the pixels over as they are. The mapped file is only read
+            # when the tile is drawn.
+            return self.process_array(tile)
+
+        img = Image.fromarray(np.asarray(tile), mode='RGB')
+        data = BytesIO()
+        img.save(data, format='png')
+        return self.process_raw(data.getvalue())
+
+    def _read_tile(self, zoom, row, col):
+        """ Return the memory-mapped pixels of a tile, or None. Rows count
+        from the top of the image.
+        """
+        if self._pyramid is not None:
+            return self._pyramid.get_tile(zoom, row, col)
+
+        presence = self._tile_presence[zoom]
+        rows, cols = presence.shape
+        if not (0 <= row < rows and 0 <= col < cols and presence[row, col]):
+            return None
+        tile_path = op.join(self.lod_dir, str(zoom),
+                            '{}.{}.npy'.format(row, col))
+        return np.load(tile_path, mmap_mode='r')
+
+    def _filename_changed(self, new):
+        self._clear_cache()
 
-        level_dimensions = _get_lod_dir_details(new)
+        self._pyramid = Pyramid(new) if new else None
+        level_dimensions = (self._pyramid.level_dimensions
+                            if self._pyramid is not None else ())
         self._level_dimensions = level_dimensions
         self.min_level = 0
         self.max_level = len(level_dimensions)
 
+    def _lod_dir_changed(self, new):
+        self._clear_cache()
+        self._pyramid = None
 
-def _get_lod_dir_details(path):
-    level_count = 0
-    level_dimensions = []
-
-    for fn in os.listdir(path):
-        if op.isdir(op.join(path, fn)):
-            level_count += 1
-
-    for i in range(level_count):
-        level_dirpath = op.join(path, str(i))
-        if op.exists(level_dirpath) and op.isdir(level_dirpath):
-            rows, cols = 0, 0
-            for fn in os.listdir(level_dirpath):
-                try:
-                    r, c = fn.split('.', 2)[:2]
-                    rows, cols = max(rows, int(r)), max(cols, int(c))
-                except ValueError:
-                    # Ignore bad filenames (like .DS_Store...)
-                    pass
-            level_dimensions.append((rows + 1, cols + 1))
-        else:
-            # Missing level directory! Bail out.
-            return ()
-
-    return tuple(level_dimensions)
+        level_dimensions, presence = load_lod_dir(new) if new else ((), [])
+        self._level_dimensions = level_dimensions
+        self._tile_presence = tuple(presence)
+        self.min_level = 0
+        self.max_level = len(level_dimensions)
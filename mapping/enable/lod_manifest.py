@@ -0,0 +1,115 @@
+""" The manifest of a directory of levels of detail.
+
+A lod directory holds its tiles as <level>/<row>.<col>.npy files. Finding
+out the dimensions of its levels means listing every tile, so the result is
+kept in a `manifest.json` file at the top of the directory: the (rows, cols)
+of each level, and a bitmap of the tiles it holds, packed 8 tiles to the byte
+in row-major order and base64 encoded.
+
+Delete the manifest after adding or removing tiles by hand, and it will be
+rebuilt the next time the directory is opened.
+"""
+import base64
+import json
+import os
+import os.path as op
+import tempfile
+
+import numpy as np
+
+MANIFEST_NAME = 'manifest.json'
+
+MANIFEST_VERSION = 1
+
+
+def load_lod_dir(path):
+    """ Return the (rows, cols) dimensions and the boolean tile presence
+    arrays of the levels of a lod directory.
+
+    The manifest is read if there is one. Otherwise the directory is scanned
+    and a manifest is written for next time, if the directory is writable.
+    """
+    presence = read_manifest(path)
+    if presence is None:
+        presence = scan_lod_dir(path)
+        try:
+            write_manifest(path, presence)
+        except (IOError, OSError):
+            # Read-only directories are scanned every time
+            pass
+    return tuple(bitmap.shape for bitmap in presence), presence
+
+
+def read_manifest(path):
+    """ Return the tile presence arrays of the levels of a lod directory
+    from its manifest, or None if it has no valid manifest.
+    """
+    try:
+        with open(op.join(path, MANIFEST_NAME), 'rb') as fp:
+            manifest = json.loads(fp.read().decode('utf-8'))
+        if manifest.get('version') != MANIFEST_VERSION:
+            return None
+        presence = []
+        for level in manifest['levels']:
+            rows, cols = level['rows'], level['cols']
+            bits = np.frombuffer(base64.b64decode(level['tiles']),
+                                 dtype=np.uint8)
+            bitmap = np.unpackbits(bits)[:rows * cols].astype(bool)
+            presence.append(bitmap.reshape(rows, cols))
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return None
+    return presence
+
+
+def write_manifest(path, presence):
+    """ Write the manifest of a lod directory from the tile presence arrays
+    of its levels.
+    """
+    levels = [
+        dict(rows=bitmap.shape[0], cols=bitmap.shape[1],
+             tiles=base64.b64encode(np.packbits(bitmap)).decode('ascii'))
+        for bitmap in presence
+    ]
+    data = json.dumps(dict(version=MANIFEST_VERSION, levels=levels))
+    # Readers never see a partial manifest
+    fd, tmp_path = tempfile.mkstemp(dir=path, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data.encode('utf-8'))
+        os.replace(tmp_path, op.join(path, MANIFEST_NAME))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def scan_lod_dir(path):
+    """ Find the tiles of a lod directory by listing its level directories.
+    Returns an empty list if a level is missing.
+    """
+    level_count = 0
+    for fn in os.listdir(path):
+        if op.isdir(op.join(path, fn)):
+            level_count += 1
+
+    presence = []
+    for i in range(level_count):
+        level_dirpath = op.join(path, str(i))
+        if not op.isdir(level_dirpath):
+            # Missing level directory! Bail out.
+            return []
+        tiles = []
+        for fn in os.listdir(level_dirpath):
+            try:
+                r, c, ext = fn.split('.', 2)
+                if ext == 'npy':
+                    tiles.append((int(r), int(c)))
+            except ValueError:
+                # Ignore bad filenames (like .DS_Store...)
+                pass
+        rows = max([r for r, c in tiles] + [-1]) + 1
+        cols = max([c for r, c in tiles] + [-1]) + 1
+        bitmap = np.zeros((rows, cols), dtype=bool)
+        for r, c in tiles:
+            bitmap[r, c] = True
+        presence.append(bitmap)
+    return presence
@@ -1,9 +1,13 @@
+import logging
 
-from traits.api import Instance, Str, provides
+from pyface.gui import GUI
+from traits.api import (
+    Bool, Either, Instance, Int, Str, on_trait_change, provides
+)
 
+from .async_loader import AsyncLoader, get_global_async_loader
 from .i_tile_manager import ITileManager
-from .tile_manager import TileManager
-from .cacheing_decorators import lru_cache
+from .tile_manager import _MISSING, AsyncTileRequest, TileManager
 from .mbtiles import MbtileSet
 
 
@@ -11,14 +15,33 @@ from .mbtiles import MbtileSet
 class MBTileManager(TileManager):
 
     # ITileManager interface ###########################################
-    @lru_cache()
     def get_tile(self, zoom, row, col):
-        tile = self._tileset.get_tile(zoom, row, col)
-        data = tile.get_png()
-        if not data:
-            return None
-        else:
-            return self.process_raw(data)
+        key = (zoom, row, col)
+        tile = self._get_from_cache(key, _MISSING)
+        if tile is _MISSING:
+            if self.async_loading:
+                self._request_tiles([key])
+                # return a blank tile for now
+                return None
+            tile = self._load_tile(zoom, row, col)
+            self._put_in_cache(key, tile)
+        return tile
+
+    def set_visible_tiles(self, tiles, viewer=None):
+        """ Load all of the visible tiles which aren't cached yet in a single
+        query, so that drawing them only hits the cache.
+        """
+        missing = [key for key in tiles if not self._is_cached(key)]
+        if not missing:
+            return
+        if self.async_loading:
+            self._request_tiles(missing)
+            return
+        found = self._tileset.get_tiles(missing)
+        for key in missing:
+            data = found.get(key)
+            tile = self.process_raw(data) if data else None
+            self._put_in_cache(key, tile)
 
     def get_tile_size(self):
         return 256
@@ -34,13 +57,109 @@ class MBTileManager(TileManager):
 
     filename = Str()
 
+    #: Whether the file is opened read-only.
+    read_only = Bool(False)
+
+    #: The number of bytes of the file SQLite maps into memory, or None for
+    #: SQLite's default. Mapping the file serves tiles from the OS page
+    #: cache without copying them through SQLite's page cache.
+    mmap_size = Either(None, Int)
+
+    #: The size of SQLite's page cache, as a number of pages or a negative
+    #: number of KiB, or None for SQLite's default.
+    page_cache_size = Either(None, Int)
+
+    #: Whether tiles are read from the file on the loader threads. If so,
+    #: `get_tile` returns None for tiles which aren't loaded yet, and
+    #: `tile_ready` is fired once they are.
+    async_loading = Bool(False)
+
+    #: The async_loader instance used to load the tiles.
+    async_loader = Instance(AsyncLoader)
+
     # Private interface ##################################################
 
     _tileset = Instance(MbtileSet)
 
+    def _async_loader_default(self):
+        return get_global_async_loader()
+
+    def _load_tile(self, zoom, row, col):
+        tile = self._tileset.get_tile(zoom, row, col)
+        data = tile.get_png()
+        if not data:
+            return None
+        else:
+            return self.process_raw(data)
+
+    def _request_tiles(self, keys):
+        keys = [key for key in keys if key not in self._pending]
+        if not keys:
+            # Everyone waiting on the tiles is notified through `tile_ready`
+            # when they arrive.
+            return
+        request = MBTileRequest(self._tiles_received, self._tileset, keys,
+                                process_raw=self.process_raw)
+        for key in keys:
+            self._pending[key] = request
+        self.async_loader.put(request)
+
+    def _tiles_received(self, request, tiles):
+        for key in request.keys:
+            if not self._finish_pending(key, request):
+                # The file was changed while the tile was in flight
+                continue
+            tile = tiles.get(key)
+            self._put_in_cache(key, tile)
+            if tile is not None:
+                self.tile_ready = key
+
+    def _open_tileset(self):
+        return MbtileSet(mbtiles=self.filename, read_only=self.read_only,
+                         mmap_size=self.mmap_size,
+                         cache_size=self.page_cache_size)
+
     def _filename_changed(self, new):
-        self._tileset = MbtileSet(mbtiles=new)
-        self.get_tile.clear()
+        self._tileset = self._open_tileset()
+        self._clear_cache()
+        # Results of requests still in flight are for the old file
+        self._pending = {}
+
+    @on_trait_change('read_only, mmap_size, page_cache_size')
+    def _reopen_tileset(self):
+        self._tileset = self._open_tileset()
 
     def __tileset_default(self):
-        return MbtileSet(mbtiles=self.filename)
+        return self._open_tileset()
+
+
+class MBTileRequest(AsyncTileRequest):
+    """ A request for a batch of tiles from an MBTiles file.
+
+    The tiles are read with a single query on the loader thread, and passed
+    through `process_raw` there too. The handler receives the request and a
+    dictionary mapping the keys of the tiles which were found to the
+    decoded tiles.
+    """
+
+    def __init__(self, handler, tileset, keys, process_raw=None):
+        super(MBTileRequest, self).__init__(handler, process_raw)
+        self.keys = keys
+        self._tileset = tileset
+
+    def execute(self):
+        tiles = {}
+        try:
+            found = self._tileset.get_tiles(self.keys)
+        except Exception:
+            logging.exception("Failed to read tiles for %s", self)
+            found = {}
+        for key, data in found.items():
+            tile = self._process(data)
+            if tile is not None:
+                tiles[key] = tile
+        GUI.invoke_later(self.handler, self, tiles)
+
+    def __str__(self):
+        return "MBTileRequest({} tiles of {})".format(len(self.keys),
+                                                      self._tileset.filename)
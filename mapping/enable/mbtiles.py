@@ -1,32 +1,214 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import math
 import sqlite3
+import threading
+import time
 import zlib
 import json
 import os
 
+from six.moves.urllib.request import pathname2url
+
+logger = logging.getLogger(__name__)
+
+#: Tiles fetched per query by `MbtileSet.get_tiles`. Keeps the number of
+#: query parameters below SQLite's default limit of 999.
+TILES_PER_QUERY = 300
+
 
 class MbtileSet:
+    """ A set of tiles stored in an MBTiles file.
 
-    def __init__(self, mbtiles, outdir=None, origin="bottom"):
-        self.conn = sqlite3.connect(mbtiles)
+    With `read_only`, the file is opened in read-only mode. `mmap_size` is
+    the number of bytes of the file which SQLite maps into memory, so that
+    tiles are read straight from the OS page cache rather than copied
+    through SQLite's own page cache. `cache_size` sets the size of that page
+    cache, as with `PRAGMA cache_size`: a number of pages, or a negative
+    number of KiB. Both apply to every connection, and are left at SQLite's
+    defaults when None.
+    """
+
+    def __init__(self, mbtiles, outdir=None, origin="bottom",
+                 read_only=False, mmap_size=None, cache_size=None):
+        self.filename = mbtiles
+        self.read_only = read_only
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        # sqlite3 connections can't be shared between threads, so every other
+        # thread reading tiles gets a read-only connection of its own
+        self._local = threading.local()
+        self._local.conn = self._connect(read_only)
         self.outdir = outdir
         self.origin = origin
         if self.origin not in ['bottom', 'top']:
             raise Exception("origin must be either `bottom` or `top`")
 
-    def write_all(self):
+    @property
+    def conn(self):
+        """ The connection to the MBTiles file for the calling thread.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect(read_only=True)
+        return conn
+
+    def write_all(self, zoom_range=None, bbox=None, num_workers=4,
+                  chunk_size=256, resume=True, progress=None):
+        """ Export the tiles to `outdir` as <zoom>/<col>/<row>.png files,
+        with the UTFGrid of each tile next to it as a .json file if the file
+        has grids.
+
+        Tiles are streamed from the file `chunk_size` at a time and written
+        by a pool of `num_workers` threads. `zoom_range` is an inclusive
+        (min, max) range of zoom levels to export, and `bbox` a (west,
+        south, east, north) bounding box in degrees which the exported tiles
+        must intersect.
+
+        Every file is written atomically, and a tile's PNG file last, so an
+        interrupted export can be resumed: with `resume`, tiles whose PNG
+        file already exists are skipped. `progress` is called after each
+        chunk with the number of tiles done, the total number of tiles and
+        the throughput in tiles/s.
+
+        Returns a dictionary with the number of tiles `written` and
+        `skipped`, the `seconds` taken and the `tiles_per_second`.
+        """
         if not self.outdir:
             raise Exception("Must specify the outdir property to write_all")
-        cur = self.conn.cursor()
-        stmt = 'select zoom_level, tile_row, tile_column, from map'
-        for row in cur.execute(stmt):
-            zoom, row, col = row[:3]
-            tile = Mbtile(zoom, row, col, self.conn, self.origin)
-            tile.write_png(self.outdir)
-            tile.write_json(self.outdir)
+        where, params = self._tile_filter(zoom_range, bbox)
+        total = self.conn.execute('SELECT COUNT(*) FROM tiles' + where,
+                                  params).fetchone()[0]
+        with_grids = self.has_grids()
+
+        start = time.time()
+        done = written = 0
+        cursor = self.conn.execute(
+            'SELECT zoom_level, tile_row, tile_column, tile_data FROM tiles' +
+            where, params
+        )
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            in_flight = []
+            while True:
+                # Read the next chunk from the file while the workers write
+                # the previous one, then wait for them to finish it
+                rows = cursor.fetchmany(chunk_size)
+                for future in in_flight:
+                    written += future.result()
+                done += len(in_flight)
+                if in_flight and progress is not None:
+                    progress(done, total, done / max(time.time() - start,
+                                                     1e-9))
+                if not rows:
+                    break
+                in_flight = [pool.submit(self._export_tile, row, resume,
+                                         with_grids) for row in rows]
+
+        seconds = time.time() - start
+        stats = dict(written=written, skipped=done - written,
+                     seconds=seconds,
+                     tiles_per_second=done / max(seconds, 1e-9))
+        logger.info("Exported %(written)d tiles, skipped %(skipped)d, "
+                    "%(tiles_per_second).0f tiles/s", stats)
+        return stats
 
     def get_tile(self, zoom, row, col):
         return Mbtile(zoom, row, col, self.conn, self.origin)
 
+    def get_tiles(self, keys):
+        """ Fetch the image data of many tiles at once.
+
+        `keys` is an iterable of (zoom, row, col) tuples, with rows in the
+        bottom-origin scheme of `get_tile`. Returns a dictionary mapping the
+        keys of the tiles which exist to their data.
+        """
+        keys = list(keys)
+        result = {}
+        for start in range(0, len(keys), TILES_PER_QUERY):
+            chunk = keys[start:start + TILES_PER_QUERY]
+            # Join the wanted keys against the tile index
+            lookup = {}
+            params = []
+            for key in chunk:
+                zoom, row, col = int(key[0]), int(key[1]), int(key[2])
+                lookup[zoom, row, col] = key
+                params.extend((zoom, col, row))
+            stmt = (
+                'WITH wanted (zoom_level, tile_column, tile_row) AS '
+                '(VALUES ' + ', '.join(['(?, ?, ?)'] * len(chunk)) + ') '
+                'SELECT tiles.zoom_level, tiles.tile_row, tiles.tile_column, '
+                'tiles.tile_data FROM wanted JOIN tiles '
+                'ON tiles.zoom_level = wanted.zoom_level '
+                'AND tiles.tile_column = wanted.tile_column '
+                'AND tiles.tile_row = wanted.tile_row'
+            )
+            for zoom, row, col, data in self.conn.execute(stmt, params):
+                if data:
+                    result[lookup[zoom, row, col]] = bytes(data)
+        return result
+
+    def has_grids(self):
+        """ Return whether the file has UTFGrid interaction data.
+        """
+        return self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'grids'"
+        ).fetchone() is not None
+
+    # Private interface ##################################################
+
+    def _export_tile(self, tile_row, resume, with_grids):
+        """ Write the files of one tile. Returns False if the tile was already
+        exported.
+        """
+        zoom, row, col, data = tile_row
+        tile = Mbtile(zoom, row, col, self.conn, self.origin)
+        png_path, json_path = tile.output_paths(self.outdir)
+        if resume and os.path.exists(png_path):
+            return False
+        if with_grids:
+            grid = tile.get_json()
+            if grid is not None:
+                _write_file(json_path, grid.encode('utf-8'))
+        _write_file(png_path, bytes(data))
+        return True
+
+    def _tile_filter(self, zoom_range, bbox):
+        """ Return a WHERE clause and its parameters selecting the tiles
+        within a zoom range and a bounding box.
+        """
+        if zoom_range is None and bbox is None:
+            return '', ()
+        if zoom_range is None:
+            zoom_range = self.conn.execute(
+                'SELECT MIN(zoom_level), MAX(zoom_level) FROM tiles'
+            ).fetchone()
+            if zoom_range[0] is None:
+                return '', ()
+        if bbox is None:
+            return ' WHERE zoom_level BETWEEN ? AND ?', tuple(zoom_range)
+        clauses, params = [], []
+        for zoom in range(zoom_range[0], zoom_range[1] + 1):
+            clauses.append('(zoom_level = ? AND tile_column BETWEEN ? AND ? '
+                           'AND tile_row BETWEEN ? AND ?)')
+            params.append(zoom)
+            params.extend(tile_range(bbox, zoom))
+        return ' WHERE ' + ' OR '.join(clauses), tuple(params)
+
+    def _connect(self, read_only):
+        if read_only:
+            uri = 'file:{}?mode=ro'.format(
+                pathname2url(os.path.abspath(self.filename))
+            )
+            conn = sqlite3.connect(uri, uri=True)
+            conn.execute('PRAGMA query_only = ON')
+        else:
+            conn = sqlite3.connect(self.filename)
+        if self.mmap_size is not None:
+            conn.execute('PRAGMA mmap_size = {:d}'.format(self.mmap_size))
+        if self.cache_size is not None:
+            conn.execute('PRAGMA cache_size = {:d}'.format(self.cache_size))
+        return conn
+
 
 class Mbtile:
 
@@ -56,69 +238,103 @@ class Mbtile:
         return y
 
     def get_png(self):
-        c = self.conn.cursor()
-        c.execute('''select tile_data from tiles
-                     where zoom_level = %s
-                     and tile_row = %s
-                     and tile_column = %s''' % (self.zoom, self.row, self.col))
+        # A constant, parameterized statement is only parsed once by SQLite
+        c = self.conn.execute('''select tile_data from tiles
+                                 where zoom_level = ?
+                                 and tile_row = ?
+                                 and tile_column = ?''', self._params)
         row = c.fetchone()
         if not row:
             return None
 
         return bytes(row[0])
 
-    def get_json(self):
-        c = self.conn.cursor()
-        c2 = self.conn.cursor()
-        c.execute('''select grid from grids
-                     where zoom_level = %s
-                     and tile_row = %s
-                     and tile_column = %s''' % (self.zoom, self.row, self.col))
-        row = c.fetchone()
+    def get_grid(self):
+        """ Return the UTFGrid of the tile, as a dictionary with the `grid`
+        rows, the `keys` and the `data` of each key, or None if the tile has
+        no grid.
+        """
+        row = self.conn.execute('''select grid from grids
+                                   where zoom_level = ?
+                                   and tile_row = ?
+                                   and tile_column = ?''',
+                                self._params).fetchone()
         if not row:
             return None
 
-        bt = bytes(row[0])
-        j = zlib.decompress(bt)
-        tgd = json.loads(j)
+        grid = json.loads(zlib.decompress(bytes(row[0])).decode('utf-8'))
 
         kq = '''
             SELECT
                 keymap.key_name AS key_name,
                 keymap.key_json AS key_json
             FROM map
-            JOIN grid_utfgrid ON grid_utfgrid.grid_id = map.grid_id
             JOIN grid_key ON grid_key.grid_id = map.grid_id
             JOIN keymap ON grid_key.key_name = keymap.key_name
-            WHERE zoom_level = %s AND tile_row = %s AND tile_column = %s;
-        ''' % (self.zoom, self.row, self.col)
-        keys = []
-        for keyrow in c2.execute(kq):
-            keyname, keydata = keyrow
-            keys.append((keyname, eval(keydata)))
-        datadict = dict(keys)
-        tgd[u'data'] = datadict
+            WHERE zoom_level = ? AND tile_row = ? AND tile_column = ?;
+        '''
+        grid[u'data'] = {
+            keyname: json.loads(keydata)
+            for keyname, keydata in self.conn.execute(kq, self._params)
+        }
+        return grid
 
-        return json.dumps(tgd)
+    def get_json(self):
+        grid = self.get_grid()
+        if grid is None:
+            return None
+        return json.dumps(grid)
 
-    def write_png(self, outdir):
+    @property
+    def _params(self):
+        return int(self.zoom), int(self.row), int(self.col)
+
+    def output_paths(self, outdir):
+        """ Return the paths of the PNG and JSON files of the tile.
+        """
         z, x, y = [str(i) for i in [self.zoom, self.col, self.output_row]]
-        pngdir = os.path.join(outdir, z, x)
-        try:
-            os.makedirs(pngdir)
-        except OSError:
-            pass
-        fh = open(os.path.join(pngdir, y + ".png"), 'wb')
-        fh.write(self.get_png())
-        fh.close()
+        base = os.path.join(outdir, z, x, y)
+        return base + '.png', base + '.json'
+
+    def write_png(self, outdir):
+        data = self.get_png()
+        if data is not None:
+            _write_file(self.output_paths(outdir)[0], data)
 
     def write_json(self, outdir):
-        z, x, y = [str(i) for i in [self.zoom, self.col, self.output_row]]
-        jsondir = os.path.join(outdir, z, x)
-        try:
-            os.makedirs(jsondir)
-        except OSError:
-            pass
-        fh = open(os.path.join(jsondir, y + ".json"), 'w')
-        fh.write(self.get_json())
-        fh.close()
+        grid = self.get_json()
+        if grid is not None:
+            _write_file(self.output_paths(outdir)[1], grid.encode('utf-8'))
+
+
+def tile_range(bbox, zoom):
+    """ Return the (min_col, max_col, min_row, max_row) range of the tiles of
+    a zoom level which intersect a (west, south, east, north) bounding box in
+    degrees. Rows use the bottom-origin scheme of MBTiles.
+    """
+    west, south, east, north = bbox
+    n = 1 << zoom
+
+    def col(lon):
+        return min(max(int((lon + 180.0) / 360.0 * n), 0), n - 1)
+
+    def row(lat):
+        lat = math.radians(min(max(lat, -85.0511), 85.0511))
+        y = (1.0 + math.asinh(math.tan(lat)) / math.pi) / 2.0 * n
+        return min(max(int(y), 0), n - 1)
+
+    return col(west), col(east), row(south), row(north)
+
+
+def _write_file(path, data):
+    """ Write a file atomically, so that it is either complete or missing.
+    """
+    dirname = os.path.dirname(path)
+    try:
+        os.makedirs(dirname)
+    except OSError:
+        pass
+    tmp_path = '{}.{}.tmp'.format(path, threading.current_thread().ident)
+    with open(tmp_path, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp_path, path)
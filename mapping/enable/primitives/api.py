@@ -1,3 +1,5 @@
 # flake8: noqa
 from .geo_circle import GeoCircle
 from .geo_marker import GeoMarker
+from .geo_point_layer import GeoPointLayer
+from .geo_cluster_layer import GeoClusterLayer
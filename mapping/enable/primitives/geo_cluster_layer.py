@@ -0,0 +1,141 @@
+import math
+
+import numpy as np
+from enable.api import ColorTrait
+from enable.enable_traits import KivaFont
+from traits.api import Dict, Float, Int, on_trait_change
+
+from .geo_point_layer import GeoPointLayer, fill_path_at_points
+
+
+class GeoClusterLayer(GeoPointLayer):
+    """ A GeoPointLayer which groups the points close to each other on
+    screen into clusters, drawn as a single symbol showing their count.
+
+    The map is divided into a grid of `cluster_size` pixel cells at each
+    zoom level, and the points falling into the same cell make up a cluster,
+    drawn at their centroid. Zooming in splits the clusters up, until
+    `max_cluster_zoom` above which all points are drawn. The clusters of a
+    zoom level are computed once, when it is first drawn, so drawing costs
+    depend on the number of clusters on screen rather than on the number of
+    points.
+    """
+
+    #: The size of the cells of the clustering grid, in pixels.
+    cluster_size = Float(64.0)
+
+    #: The highest zoom level where points are clustered.
+    max_cluster_zoom = Int(14)
+
+    #: The diameter of the symbol of a cluster of less than 10 points. It
+    #: grows with each power of 10.
+    cluster_marker_size = Float(20.0)
+
+    #: The color of the symbol of a cluster.
+    cluster_color = ColorTrait((0.19, 0.39, 0.69, 0.85))
+
+    #: The color of the count of a cluster.
+    text_color = ColorTrait('white')
+
+    #: The font of the count of a cluster.
+    font = KivaFont('sans-serif 10')
+
+    def clusters(self):
+        """ Return the canvas coordinates of the clusters at the current zoom
+        level, as an (M, 2) array, and the number of points in each.
+        """
+        component = self.component
+        if component is None or len(self.lat) == 0:
+            return np.zeros((0, 2)), np.zeros(0, dtype=int)
+        self._project(component)
+        positions, counts, _ = self._get_clusters(component._zoom_level)
+        return positions, counts
+
+    def update_points(self, indices, lat=None, lon=None, size=None,
+                      color=None):
+        super(GeoClusterLayer, self).update_points(
+            indices, lat=lat, lon=lon, size=size, color=color
+        )
+        if lat is not None or lon is not None:
+            self._clusters = {}
+
+    def points_changed(self):
+        super(GeoClusterLayer, self).points_changed()
+        self._clusters = {}
+
+    def overlay(self, other_component, gc, view_bounds=None, mode="normal"):
+        zoom = other_component._zoom_level
+        if zoom > self.max_cluster_zoom:
+            super(GeoClusterLayer, self).overlay(other_component, gc,
+                                                 view_bounds, mode)
+            return
+        if view_bounds is None or len(self.lat) == 0:
+            return
+        self._project(other_component)
+        positions, counts, first = self._get_clusters(zoom)
+
+        x, y, width, height = view_bounds
+        radius = self._symbol_size(counts.max()) / 2.0
+        visible = ((positions[:, 0] >= x - radius) &
+                   (positions[:, 0] <= x + width + radius) &
+                   (positions[:, 1] >= y - radius) &
+                   (positions[:, 1] <= y + height + radius))
+
+        # Lone points are drawn as they are
+        singles = np.zeros(len(self.lat), dtype=bool)
+        singles[first[visible & (counts == 1)]] = True
+        self._draw_points(gc, singles)
+
+        shown = np.flatnonzero(visible & (counts > 1))
+        if len(shown):
+            self._draw_clusters(gc, positions[shown], counts[shown])
+
+    # Private interface ##################################################
+
+    #: The clusters of each zoom level drawn since the points last changed,
+    #: as (positions, counts, index of a point of the cluster) tuples.
+    _clusters = Dict
+
+    @on_trait_change('lat,lon,cluster_size')
+    def _clear_clusters(self):
+        self._clusters = {}
+
+    def _get_clusters(self, zoom):
+        clusters = self._clusters.get(zoom)
+        if clusters is None:
+            screen = self._screen
+            cells = np.floor(screen / self.cluster_size).astype(np.int64)
+            keys = (cells[:, 0] << 32) + (cells[:, 1] & 0xFFFFFFFF)
+            _, first, inverse, counts = np.unique(
+                keys, return_index=True, return_inverse=True,
+                return_counts=True
+            )
+            inverse = inverse.ravel()
+            positions = np.column_stack([
+                np.bincount(inverse, weights=screen[:, 0]) / counts,
+                np.bincount(inverse, weights=screen[:, 1]) / counts,
+            ])
+            clusters = self._clusters[zoom] = (positions, counts, first)
+        return clusters
+
+    def _symbol_size(self, count):
+        digits = np.floor(np.log10(np.maximum(count, 1)))
+        return self.cluster_marker_size * (1 + 0.3 * digits)
+
+    def _draw_clusters(self, gc, positions, counts):
+        sizes = self._symbol_size(counts)
+        with gc:
+            gc.set_fill_color(self.cluster_color_)
+            for size in np.unique(sizes):
+                path = gc.get_empty_path()
+                path.arc(0, 0, size / 2.0, 0, 2 * math.pi)
+                path.close_path()
+                fill_path_at_points(gc, positions[sizes == size], path)
+
+            gc.set_font(self.font)
+            gc.set_fill_color(self.text_color_)
+            for (x, y), count in zip(positions, counts):
+                text = str(count)
+                _, _, width, height = gc.get_text_extent(text)
+                gc.show_text_at_point(text, x - width / 2.0,
+                                      y - height / 2.0)
@@ -0,0 +1,216 @@
+import math
+
+import numpy as np
+from enable.api import AbstractOverlay, ColorTrait
+from kiva.constants import FILL, SQUARE_MARKER
+from traits.api import Any, Array, Enum, Float, on_trait_change
+
+
+class GeoPointLayer(AbstractOverlay):
+    """ Draws a large set of points, held in arrays.
+
+    Add the layer to the overlays of a MappingCanvas, with the canvas as its
+    component. Unlike GeoMarker and GeoCircle, the points are not
+    components: they are projected to the canvas in bulk when the zoom level
+    changes, culled against the visible area, and drawn in one pass per
+    distinct size and color.
+
+    For live data, either assign new arrays, or change the points in place
+    with `update_points`, which only reprojects the points it changes.
+    """
+
+    #: The latitudes of the points, in degrees.
+    lat = Array(dtype=float, shape=(None,), value=np.zeros(0))
+
+    #: The longitudes of the points, in degrees.
+    lon = Array(dtype=float, shape=(None,), value=np.zeros(0))
+
+    #: The diameter of each point, in pixels. Left empty, every point has
+    #: `marker_size`.
+    size = Array(dtype=float, shape=(None,), value=np.zeros(0))
+
+    #: The RGBA color of each point, as floats between 0 and 1. Left empty,
+    #: every point has `fill_color`.
+    color = Array(dtype=float, shape=(None, 4), value=np.zeros((0, 4)))
+
+    #: The diameter of the points without a size.
+    marker_size = Float(6.0)
+
+    #: The color of the points without a color.
+    fill_color = ColorTrait('red')
+
+    #: The shape of the points.
+    marker = Enum('circle', 'square')
+
+    def update_points(self, indices, lat=None, lon=None, size=None,
+                      color=None):
+        """ Change some of the points in place.
+
+        `indices` selects the points as for indexing a NumPy array, and the
+        new values are assigned to the selected points of each given array.
+        """
+        if lat is not None:
+            self.lat[indices] = lat
+        if lon is not None:
+            self.lon[indices] = lon
+        if size is not None:
+            self.size[indices] = size
+        if color is not None:
+            self.color[indices] = color
+
+        if lat is not None or lon is not None:
+            if self._screen is not None and self.component is not None:
+                x, y = self.component._WGS84_to_screen(
+                    self.lat[indices], self.lon[indices], self._projected_zoom
+                )
+                self._screen[indices, 0] = x
+                self._screen[indices, 1] = y
+            else:
+                self._screen = None
+        if size is not None or color is not None:
+            self._groups = None
+        self.request_redraw()
+
+    def points_changed(self):
+        """ Call after changing the arrays in place by other means than
+        `update_points`.
+        """
+        self._invalidate_positions()
+        self._groups = None
+        self.request_redraw()
+
+    def points_in_rect(self, x, y, width, height):
+        """ Return the indices of the points drawn within a rectangle of the
+        canvas, at the current zoom level.
+        """
+        if self.component is None:
+            return np.zeros(0, dtype=int)
+        self._project(self.component)
+        return np.flatnonzero(self._visible((x, y, width, height)))
+
+    def overlay(self, other_component, gc, view_bounds=None, mode="normal"):
+        if view_bounds is None or len(self.lat) == 0:
+            return
+        self._project(other_component)
+        self._draw_points(gc, self._visible(view_bounds))
+
+    # Private interface ##################################################
+
+    #: The canvas coordinates of the points, as an (N, 2) array, or None.
+    _screen = Any
+
+    #: The zoom level `_screen` was projected at.
+    _projected_zoom = Any
+
+    #: The points sorted by size and color, with the boundaries and the
+    #: size and color of each group, or None.
+    _groups = Any
+
+    @on_trait_change('lat,lon')
+    def _invalidate_positions(self):
+        self._screen = None
+
+    @on_trait_change('size,color,marker_size,fill_color')
+    def _invalidate_groups(self):
+        self._groups = None
+
+    def _project(self, canvas):
+        zoom = canvas._zoom_level
+        if self._screen is not None and self._projected_zoom == zoom:
+            return
+        if len(self.lat) != len(self.lon):
+            raise ValueError('lat and lon have different lengths')
+        x, y = canvas.transformToScreen(self.lat, self.lon)
+        self._screen = np.column_stack([x, y])
+        self._projected_zoom = zoom
+
+    def _visible(self, view_bounds):
+        """ Return a mask of the points overlapping the view bounds. """
+        x, y, width, height = view_bounds
+        sizes = self.size if len(self.size) else self.marker_size
+        radius = np.max(sizes) / 2.0 if np.size(sizes) else 0.0
+        screen = self._screen
+        return ((screen[:, 0] >= x - radius) &
+                (screen[:, 0] <= x + width + radius) &
+                (screen[:, 1] >= y - radius) &
+                (screen[:, 1] <= y + height + radius))
+
+    def _get_groups(self):
+        if self._groups is not None:
+            return self._groups
+        count = len(self.lat)
+        if len(self.size) == 0 and len(self.color) == 0:
+            self._groups = (np.arange(count), np.array([0, count]),
+                            [self.marker_size], [self.fill_color_])
+            return self._groups
+
+        sizes = self.size if len(self.size) else np.full(count,
+                                                         self.marker_size)
+        colors = self.color if len(self.color) else np.tile(
+            self.fill_color_, (count, 1))
+        if len(sizes) != count or len(colors) != count:
+            raise ValueError('size and color must have a value for every '
+                             'point')
+        # Group by one integer key, much faster to sort than rows of floats.
+        # Colors are drawn with 8 bits per channel anyway.
+        size_values, size_index = np.unique(sizes, return_inverse=True)
+        rgba = np.round(np.clip(colors, 0, 1) * 255).astype(np.int64)
+        color_code = ((rgba[:, 0] << 24) | (rgba[:, 1] << 16) |
+                      (rgba[:, 2] << 8) | rgba[:, 3])
+        keys, inverse = np.unique((size_index.ravel() << 32) | color_code,
+                                  return_inverse=True)
+        order = np.argsort(inverse.ravel(), kind='stable')
+        starts = np.searchsorted(keys[inverse.ravel()[order]], keys)
+        starts = np.append(starts, count)
+        codes = keys & 0xFFFFFFFF
+        group_colors = np.column_stack([
+            (codes >> shift) & 0xFF for shift in (24, 16, 8, 0)
+        ]) / 255.0
+        self._groups = (order, starts, size_values[keys >> 32], group_colors)
+        return self._groups
+
+    def _draw_points(self, gc, mask):
+        """ Draw the points selected by a boolean mask. """
+        if not mask.any():
+            return
+        order, starts, sizes, colors = self._get_groups()
+        with gc:
+            for start, end, size, color in zip(starts[:-1], starts[1:],
+                                               sizes, colors):
+                indices = order[start:end]
+                indices = indices[mask[indices]]
+                if len(indices):
+                    self._draw_group(gc, self._screen[indices], size, color)
+
+    def _draw_group(self, gc, points, size, color):
+        gc.set_fill_color(tuple(color))
+        radius = size / 2.0
+        if self.marker == 'square':
+            # Kiva's square markers are the fastest way to draw points, where
+            # supported. Their size is half their width.
+            draw_markers = getattr(gc, 'draw_marker_at_points', None)
+            if draw_markers is not None and draw_markers(points, radius,
+                                                         SQUARE_MARKER):
+                return
+
+        path = gc.get_empty_path()
+        if self.marker == 'circle':
+            path.arc(0, 0, radius, 0, 2 * math.pi)
+        else:
+            path.rect(-radius, -radius, size, size)
+        path.close_path()
+        fill_path_at_points(gc, points, path)
+
+
+def fill_path_at_points(gc, points, path):
+    """ Fill a path at each of an array of (x, y) points, in one call where
+    the graphics context supports it.
+    """
+    if hasattr(gc, 'draw_path_at_points'):
+        gc.draw_path_at_points(points, path, FILL)
+        return
+    for x, y in points:
+        with gc:
+            gc.translate_ctm(x, y)
+            gc.add_path(path)
+            gc.fill_path()
@@ -0,0 +1,192 @@
+""" A single-file store for the levels of detail of a large image.
+
+The file starts with a fixed preamble: an 8 byte magic string and the length
+of the JSON header which follows it, as a little-endian uint64. The header
+describes the tiles and each level's dimensions, and where in the file the
+level's index is. An index is an array of (offset, size, height, width)
+records, one per tile in row-major order, with a size of 0 for missing
+tiles. The tile data follows the indices, each tile stored as its raw pixel
+bytes, optionally zlib-compressed.
+
+Opening a file only reads the preamble and the header. The indices and the
+uncompressed tiles are used straight from a memory map of the file.
+"""
+import json
+import mmap
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b'MAPPYR1\x00'
+
+#: An entry of a level's tile index.
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('size', '<u8'),
+                        ('height', '<u4'), ('width', '<u4')])
+
+_PREAMBLE = struct.Struct('<8sQ')
+
+
+class Pyramid(object):
+    """ Read-only access to a single-file image pyramid.
+
+    Levels are numbered from 0, the coarsest, and tile rows from the top of
+    the image.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as fp:
+            magic, header_size = _PREAMBLE.unpack(fp.read(_PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError('{} is not a pyramid file'.format(filename))
+            header = json.loads(fp.read(header_size).decode('utf-8'))
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.tile_size = header['tile_size']
+        self.channels = header['channels']
+        self.dtype = np.dtype(header['dtype'])
+        self.compression = header['compression']
+        self.level_dimensions = tuple(
+            (level['rows'], level['cols']) for level in header['levels']
+        )
+        self._indices = [
+            np.frombuffer(self._mmap, dtype=INDEX_DTYPE,
+                          count=level['rows'] * level['cols'],
+                          offset=level['index_offset']).reshape(
+                              level['rows'], level['cols'])
+            for level in header['levels']
+        ]
+
+    def has_tile(self, level, row, col):
+        entry = self._entry(level, row, col)
+        return entry is not None and entry['size'] > 0
+
+    def get_tile(self, level, row, col):
+        """ Return the pixels of a tile as a (height, width, channels) array,
+        or None if the tile doesn't exist. Uncompressed tiles are read-only
+        views of the memory-mapped file.
+        """
+        entry = self._entry(level, row, col)
+        if entry is None or entry['size'] == 0:
+            return None
+        offset, size = int(entry['offset']), int(entry['size'])
+        shape = (int(entry['height']), int(entry['width']), self.channels)
+        if self.compression == 'zlib':
+            data = zlib.decompress(self._mmap[offset:offset + size])
+            return np.frombuffer(data, dtype=self.dtype).reshape(shape)
+        count = size // self.dtype.itemsize
+        return np.frombuffer(self._mmap, dtype=self.dtype, count=count,
+                             offset=offset).reshape(shape)
+
+    def close(self):
+        self._indices = []
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Tiles handed out still use the map, which is closed once they
+            # are gone.
+            pass
+
+    def _entry(self, level, row, col):
+        if not 0 <= level < len(self._indices):
+            return None
+        index = self._indices[level]
+        rows, cols = index.shape
+        if not (0 <= row < rows and 0 <= col < cols):
+            return None
+        return index[row, col]
+
+
+class PyramidWriter(object):
+    """ Writes a single-file image pyramid, one tile at a time.
+
+    `level_dimensions` gives the (rows, cols) of tiles of each level. Tiles
+    may be written in any order, and missing tiles are left empty. Use the
+    writer as a context manager, or call `close` once all tiles are written.
+    """
+
+    def __init__(self, filename, level_dimensions, tile_size=256, channels=3,
+                 dtype=np.uint8, compression=None):
+        if compression not in (None, 'zlib'):
+            raise ValueError('Unknown compression {!r}'.format(compression))
+        self.filename = filename
+        self.compression = compression
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+
+        levels = []
+        offset = 0
+        for rows, cols in level_dimensions:
+            levels.append(dict(rows=rows, cols=cols, index_offset=offset))
+            offset += rows * cols * INDEX_DTYPE.itemsize
+        header = dict(tile_size=tile_size, channels=channels,
+                      dtype=self.dtype.str, compression=compression,
+                      levels=levels)
+        # The indices follow the header, which holds their offsets. Make room
+        # for the header with the widest possible offsets, and pad it.
+        draft = json.dumps(dict(header, levels=[
+            dict(level, index_offset=2 ** 63) for level in levels
+        ]))
+        start = _align(_PREAMBLE.size + len(draft))
+        for level in levels:
+            level['index_offset'] += start
+        header_bytes = json.dumps(header).encode('utf-8')
+        header_bytes += b' ' * (start - _PREAMBLE.size - len(header_bytes))
+
+        self._indices = [np.zeros((rows, cols), dtype=INDEX_DTYPE)
+                         for rows, cols in level_dimensions]
+        self._index_start = start
+        self._fp = open(filename, 'wb')
+        self._fp.write(_PREAMBLE.pack(MAGIC, len(header_bytes)))
+        self._fp.write(header_bytes)
+        self._fp.seek(start + offset)
+
+    def write_tile(self, level, row, col, tile):
+        """ Store the (height, width, channels) pixels of a tile.
+        """
+        data, height, width = encode_tile(tile, self.dtype, self.channels,
+                                          self.compression)
+        self.write_data(level, row, col, data, height, width)
+
+    def write_data(self, level, row, col, data, height, width):
+        """ Store a tile already encoded by `encode_tile`.
+        """
+        self._indices[level][row, col] = (self._fp.tell(), len(data),
+                                          height, width)
+        self._fp.write(data)
+
+    def close(self):
+        if self._fp.closed:
+            return
+        self._fp.seek(self._index_start)
+        for index in self._indices:
+            self._fp.write(index.tobytes())
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def encode_tile(tile, dtype, channels, compression=None):
+    """ Encode the pixels of a tile for a pyramid file. Returns the encoded
+    bytes, and the height and width of the tile.
+    """
+    tile = np.ascontiguousarray(tile, dtype=dtype)
+    if tile.ndim == 2:
+        tile = tile[:, :, np.newaxis]
+    if tile.shape[2] != channels:
+        raise ValueError('Expected {} channels, got {}'.format(
+            channels, tile.shape[2]))
+    data = tile.tobytes()
+    if compression == 'zlib':
+        data = zlib.compress(data)
+    height, width = tile.shape[:2]
+    return data, height, width
+
+
+def _align(offset, alignment=8):
+    return (offset + alignment - 1) // alignment * alignment
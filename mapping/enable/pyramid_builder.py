@@ -0,0 +1,445 @@
+""" Build the levels of detail of a large image, for ImageTileManager.
+
+The source image is read in strips of tile rows, so images larger than
+memory can be tiled as long as the source can be read piecewise: `.npy`
+files are memory-mapped, and any array-like object with a `shape` which can
+be sliced by rows (a numpy memmap, an HDF5 or zarr array...) is read strip by
+strip. Other files are read with PIL: images stored in strips or tiles, as
+TIFF images usually are, are read strip by strip as well, while images in
+other formats have to be decoded whole.
+
+Each level is built by averaging 2x2 blocks of pixels of the level above it,
+strip by strip as those are completed, so only a strip of each level is ever
+held in memory. Tiles are encoded and written by a pool of processes.
+
+Usage::
+
+    python -m mapping.enable.pyramid_builder IMAGE OUTPUT
+        [--format {npy,mbtiles,pyramid}] [--workers N] [--compress]
+"""
+from __future__ import print_function
+
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import logging
+import os
+import os.path as op
+import sqlite3
+import time
+
+import numpy as np
+
+from .lod_manifest import write_manifest
+from .pyramid import PyramidWriter, encode_tile
+
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = 256
+
+#: The modes of the image files which are converted before being tiled, to
+#: the mode they are converted to. Files of other modes than these and the
+#: 8-bit L, RGB and RGBA modes can't be tiled.
+_MODE_CONVERSIONS = {
+    '1': 'L',
+    'LA': 'RGBA',
+    'P': 'RGB',
+    'PA': 'RGBA',
+    'CMYK': 'RGB',
+    'YCbCr': 'RGB',
+}
+
+
+def build_pyramid(source, output, output_format='npy', tile_size=TILE_SIZE,
+                  num_workers=None, compression=None, progress=None):
+    """ Tile an image into a pyramid of levels of detail.
+
+    `source` is the path of an image file or an array-like object of shape
+    (height, width[, channels]). `output` is the directory of the npy tree
+    (`<level>/<row>.<col>.npy` files and their manifest), or the MBTiles or
+    single-file pyramid file, depending on `output_format`. `compression`
+    may be 'zlib' for a single-file pyramid. Level 0 is the coarsest level,
+    fitting in a single tile, and the last level has the full resolution.
+
+    Tiles are encoded and written by `num_workers` processes, by default one
+    per CPU. With 0 workers everything is done in this process. `progress`
+    is called after each row of tiles and at the end, with the number of
+    tiles written, the total number of tiles and the throughput in tiles/s.
+
+    Returns the (rows, cols) dimensions of the levels.
+    """
+    array = open_source(source)
+    sinks = {'npy': _NpySink, 'mbtiles': _MBTilesSink,
+             'pyramid': _PyramidSink}
+    if output_format not in sinks:
+        raise ValueError('Unknown pyramid format {!r}'.format(output_format))
+
+    sizes = level_sizes(array.shape[:2], tile_size)
+    dimensions = [(-(-height // tile_size), -(-width // tile_size))
+                  for height, width in reversed(sizes)]
+    channels = array.shape[2] if len(array.shape) > 2 else 1
+    sink = sinks[output_format](output, dimensions, tile_size, channels,
+                                np.dtype(array.dtype), compression)
+    builder = _Builder(sink, sizes, tile_size, num_workers, progress,
+                       total=sum(rows * cols for rows, cols in dimensions))
+    try:
+        height = array.shape[0]
+        for start in range(0, height, tile_size):
+            stop = min(start + tile_size, height)
+            builder.add_rows(0, np.asarray(array[start:stop]),
+                             final=stop == height)
+        builder.finish()
+    finally:
+        builder.shutdown()
+        sink.close()
+    return dimensions
+
+
+def level_sizes(shape, tile_size=TILE_SIZE):
+    """ Return the (height, width) of each level of an image, from the full
+    resolution level down to the first which fits in a single tile.
+    """
+    sizes = [tuple(shape)]
+    while max(sizes[-1]) > tile_size:
+        height, width = sizes[-1]
+        sizes.append(((height + 1) // 2, (width + 1) // 2))
+    return sizes
+
+
+def halve(block):
+    """ Halve the resolution of an image by averaging 2x2 blocks of pixels.
+    An odd last row or column is averaged with itself.
+    """
+    height, width = block.shape[:2]
+    if height % 2:
+        block = np.concatenate([block, block[-1:]], axis=0)
+    if width % 2:
+        block = np.concatenate([block, block[:, -1:]], axis=1)
+    if np.issubdtype(block.dtype, np.integer):
+        total = block.astype(np.int64)
+        total = (total[0::2, 0::2] + total[1::2, 0::2] +
+                 total[0::2, 1::2] + total[1::2, 1::2])
+        return ((total + 2) // 4).astype(block.dtype)
+    total = block.astype(np.float64)
+    total = (total[0::2, 0::2] + total[1::2, 0::2] +
+             total[0::2, 1::2] + total[1::2, 1::2])
+    return (total / 4).astype(block.dtype)
+
+
+def open_source(source):
+    """ Return an array-like view of an image, which is read lazily where
+    possible.
+    """
+    if not isinstance(source, str):
+        return source
+    if source.endswith('.npy'):
+        return np.load(source, mmap_mode='r')
+    return _ImageFile(source)
+
+
+class _ImageFile(object):
+    """ An image file read with PIL, as an array-like object which can be
+    sliced by rows.
+
+    Only the strips or tiles of the file holding the rows are decoded. Files
+    which aren't split into strips or tiles are decoded whole, once. Images
+    are converted to 8-bit grayscale, RGB or RGBA pixels as described by
+    `_MODE_CONVERSIONS`.
+    """
+
+    def __init__(self, filename):
+        from PIL import Image
+        self.filename = filename
+        with Image.open(filename) as image:
+            width, height = image.size
+            mode = _MODE_CONVERSIONS.get(image.mode, image.mode)
+            if image.mode == 'P' and 'transparency' in image.info:
+                mode = 'RGBA'
+        if mode not in ('L', 'RGB', 'RGBA'):
+            raise ValueError(
+                "Can't tile images of mode {!r}, convert them to 8-bit "
+                "grayscale, RGB or RGBA first".format(image.mode)
+            )
+        #: The mode the image is converted to.
+        self.mode = mode
+        pixel = np.asarray(Image.new(mode, (1, 1)))
+        self.shape = (height, width) + pixel.shape[2:]
+        self.dtype = pixel.dtype
+        # The last rows decoded, and the first of them
+        self._block = None
+        self._block_start = 0
+        self._warned = False
+
+    def __getitem__(self, rows):
+        start, stop, _ = rows.indices(self.shape[0])
+        block = self._block
+        if (block is None or start < self._block_start or
+                stop > self._block_start + len(block)):
+            self._block_start, block = self._decode(start, stop)
+            self._block = block
+        return block[start - self._block_start:stop - self._block_start]
+
+    def _decode(self, start, stop):
+        """ Decode the parts of the file holding a range of rows. Returns
+        the first row decoded and the decoded rows.
+        """
+        from PIL import Image
+        with Image.open(self.filename) as image:
+            top = 0
+            if _has_known_tiles(image):
+                tiles = [tile for tile in image.tile
+                         if tile[1][1] < stop and tile[1][3] > start]
+                top = min(tile[1][1] for tile in tiles)
+                bottom = max(tile[1][3] for tile in tiles)
+                if (top, bottom) != (0, self.shape[0]):
+                    # Decode the tiles as an image of their rows alone. This
+                    # relies on the private state of PIL's image files.
+                    image.tile = [
+                        (name, (x0, y0 - top, x1, y1 - top), offset, args)
+                        for name, (x0, y0, x1, y1), offset, args in tiles
+                    ]
+                    image._size = (image.size[0], bottom - top)
+            elif not self._warned:
+                logger.warning("Can't read %s in strips with this version "
+                               "of PIL, decoding it whole", self.filename)
+                self._warned = True
+            if image.mode != self.mode:
+                image = image.convert(self.mode)
+            return top, np.asarray(image)
+
+
+def _has_known_tiles(image):
+    """ Whether the tiles of a PIL image file have the form expected by
+    `_ImageFile`: (decoder, (x0, y0, x1, y1), offset, args) tuples, along
+    with the image size in a `_size` attribute.
+    """
+    if not hasattr(image, '_size') or not image.tile:
+        return False
+    for tile in image.tile:
+        if not (isinstance(tile, tuple) and len(tile) == 4):
+            return False
+        extents = tile[1]
+        if not (isinstance(extents, tuple) and len(extents) == 4 and
+                all(isinstance(value, int) for value in extents)):
+            return False
+    return True
+
+
+class _Builder(object):
+    """ Cascades strips of pixels down the levels, and hands complete rows
+    of tiles to the sink.
+    """
+
+    def __init__(self, sink, sizes, tile_size, num_workers, progress, total):
+        self.sink = sink
+        self.sizes = sizes
+        self.tile_size = tile_size
+        self.progress = progress
+        self.total = total
+        self.done = 0
+        self.start = time.time()
+        # Rows of each level which don't make up a row of tiles yet
+        self._buffers = [None] * len(sizes)
+        self._next_row = [0] * len(sizes)
+
+        if num_workers is None:
+            num_workers = os.cpu_count() or 1
+        self._pool = (ProcessPoolExecutor(max_workers=num_workers)
+                      if num_workers > 0 else None)
+        self._max_in_flight = 4 * max(num_workers, 1)
+        self._in_flight = deque()
+
+    def add_rows(self, index, rows, final):
+        """ Add rows of pixels to the level `index` levels below the full
+        resolution, `final` if they are the last rows of the level.
+        """
+        tile_size = self.tile_size
+        buffer = self._buffers[index]
+        if buffer is not None:
+            rows = np.concatenate([buffer, rows])
+        count = len(rows) if final else len(rows) // tile_size * tile_size
+        done, self._buffers[index] = rows[:count], rows[count:]
+        for start in range(0, count, tile_size):
+            self._write_row(index, done[start:start + tile_size])
+        if index + 1 < len(self.sizes) and (count or final):
+            # Tile rows start at even rows, so pairs of rows never straddle
+            # two strips
+            self.add_rows(index + 1, halve(done), final)
+
+    def finish(self):
+        while self._in_flight:
+            self._store_oldest()
+        self._report()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    def _write_row(self, index, block):
+        level = len(self.sizes) - 1 - index
+        row = self._next_row[index]
+        self._next_row[index] += 1
+        tile_size = self.tile_size
+        for col in range(-(-block.shape[1] // tile_size)):
+            tile = np.ascontiguousarray(
+                block[:, col * tile_size:(col + 1) * tile_size]
+            )
+            func, args = self.sink.job(level, row, col, tile)
+            if self._pool is None:
+                result = func(*args)
+                self.sink.store(level, row, col, result)
+                self.done += 1
+            else:
+                self._in_flight.append(
+                    (level, row, col, self._pool.submit(func, *args))
+                )
+                while len(self._in_flight) > self._max_in_flight:
+                    self._store_oldest()
+        self._report()
+
+    def _report(self):
+        if self.progress is not None:
+            rate = self.done / max(time.time() - self.start, 1e-9)
+            self.progress(self.done, self.total, rate)
+
+    def _store_oldest(self):
+        level, row, col, future = self._in_flight.popleft()
+        self.sink.store(level, row, col, future.result())
+        self.done += 1
+
+
+# Sinks ##################################################################
+# A sink gives the job encoding or writing a tile, which is run in a worker
+# process, and stores the result of the job in the main process.
+
+class _NpySink(object):
+    def __init__(self, path, dimensions, tile_size, channels, dtype,
+                 compression):
+        self.path = path
+        self.presence = [np.zeros(shape, dtype=bool) for shape in dimensions]
+        for level in range(len(dimensions)):
+            level_dir = op.join(path, str(level))
+            if not op.isdir(level_dir):
+                os.makedirs(level_dir)
+
+    def job(self, level, row, col, tile):
+        path = op.join(self.path, str(level), '{}.{}.npy'.format(row, col))
+        return _save_npy, (path, tile)
+
+    def store(self, level, row, col, result):
+        self.presence[level][row, col] = True
+
+    def close(self):
+        # Spare ImageTileManager listing the tiles
+        write_manifest(self.path, self.presence)
+
+
+class _MBTilesSink(object):
+    def __init__(self, filename, dimensions, tile_size, channels, dtype,
+                 compression):
+        self.dimensions = dimensions
+        self.tile_size = tile_size
+        self.conn = sqlite3.connect(filename)
+        with self.conn:
+            self.conn.executescript('''
+                CREATE TABLE IF NOT EXISTS metadata (name text, value text);
+                CREATE TABLE IF NOT EXISTS tiles (
+                    zoom_level integer,
+                    tile_column integer,
+                    tile_row integer,
+                    tile_data blob
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS tile_index
+                    ON tiles (zoom_level, tile_column, tile_row);
+                DELETE FROM metadata;
+            ''')
+            self.conn.executemany(
+                'INSERT INTO metadata VALUES (?, ?)',
+                [('format', 'png'), ('minzoom', '0'),
+                 ('maxzoom', str(len(dimensions) - 1))]
+            )
+
+    def job(self, level, row, col, tile):
+        return _encode_png, (tile, self.tile_size)
+
+    def store(self, level, row, col, result):
+        # MBTiles rows count from the bottom of the 2**level rows of the
+        # level, whatever the rows of the image. Levels with an odd number of
+        # rows then still line up with the level above.
+        self.conn.execute(
+            'INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)',
+            (level, col, (1 << level) - 1 - row, sqlite3.Binary(result))
+        )
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+class _PyramidSink(object):
+    def __init__(self, filename, dimensions, tile_size, channels, dtype,
+                 compression):
+        self.writer = PyramidWriter(filename, dimensions, tile_size=tile_size,
+                                    channels=channels, dtype=dtype,
+                                    compression=compression)
+
+    def job(self, level, row, col, tile):
+        return encode_tile, (tile, self.writer.dtype, self.writer.channels,
+                             self.writer.compression)
+
+    def store(self, level, row, col, result):
+        data, height, width = result
+        self.writer.write_data(level, row, col, data, height, width)
+
+    def close(self):
+        self.writer.close()
+
+
+def _save_npy(path, tile):
+    np.save(path, tile, allow_pickle=False)
+
+
+def _encode_png(tile, tile_size):
+    from PIL import Image
+    height, width = tile.shape[:2]
+    if (height, width) != (tile_size, tile_size):
+        # MBTiles readers expect whole tiles
+        padded = np.zeros((tile_size, tile_size) + tile.shape[2:],
+                          dtype=tile.dtype)
+        padded[:height, :width] = tile
+        tile = padded
+    data = BytesIO()
+    Image.fromarray(tile).save(data, format='png')
+    return data.getvalue()
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description='Tile an image into levels of detail.'
+    )
+    ap.add_argument('image', help='the image, or a .npy array of pixels')
+    ap.add_argument('output', help='the output directory or file')
+    ap.add_argument('--format', choices=['npy', 'mbtiles', 'pyramid'],
+                    default='npy')
+    ap.add_argument('--workers', type=int, default=None,
+                    help='the number of worker processes')
+    ap.add_argument('--compress', action='store_true',
+                    help='compress the tiles of a single-file pyramid')
+    args = ap.parse_args()
+
+    def report(done, total, rate):
+        print('\r{}/{} tiles, {:.0f} tiles/s'.format(done, total, rate),
+              end='')
+
+    dimensions = build_pyramid(
+        args.image, args.output, output_format=args.format,
+        num_workers=args.workers,
+        compression='zlib' if args.compress else None, progress=report
+    )
+    print()
+    print('Wrote {} levels to {}'.format(len(dimensions), args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+import threading
+from unittest import TestCase
+
+from mapping.enable.async_loader import (
+    AsyncLoader, AsyncRequest, RequestQueue
+)
+
+
+class BlockingRequest(AsyncRequest):
+    """ A request which waits until released, recording the running thread.
+    """
+    def __init__(self, release, threads, done):
+        self.release = release
+        self.threads = threads
+        self.done = done
+
+    def execute(self):
+        self.threads.add(threading.current_thread())
+        self.release.wait(5.0)
+        self.done.release()
+
+
+class TestAsyncLoader(TestCase):
+    def setUp(self):
+        self.loader = AsyncLoader(num_workers=4)
+        self.loader.start()
+
+    def tearDown(self):
+        self.loader.stop()
+
+    def run_requests(self, count):
+        release = threading.Event()
+        threads = set()
+        done = threading.Semaphore(0)
+        for _ in range(count):
+            self.loader.put(BlockingRequest(release, threads, done))
+        # Give every worker the chance to pick up a request before releasing
+        for _ in range(50):
+            if len(threads) >= min(count, self.loader.num_workers):
+                break
+            threading.Event().wait(0.02)
+        release.set()
+        for _ in range(count):
+            self.assertTrue(done.acquire(timeout=5.0))
+        return threads
+
+    def test_requests_run_in_parallel(self):
+        threads = self.run_requests(8)
+        self.assertEqual(len(threads), 4)
+
+    def test_resize_pool(self):
+        self.loader.num_workers = 2
+        self.assertEqual(len(self.loader._threads), 2)
+        self.loader.num_workers = 6
+        self.assertEqual(len(self.loader._threads), 6)
+        self.assertGreaterEqual(len(self.run_requests(12)), 6)
+
+    def test_stop_joins_workers(self):
+        threads = list(self.loader._threads)
+        self.loader.stop()
+        self.assertFalse(self.loader.running)
+        self.assertFalse(any(t.is_alive() for t in threads))
+        # Restarting brings up a fresh pool
+        self.loader.start()
+        self.assertEqual(len(self.loader._threads), 4)
+
+    def test_failing_request_does_not_kill_worker(self):
+        class FailingRequest(AsyncRequest):
+            def execute(self):
+                raise ValueError("boom")
+
+        self.loader.num_workers = 1
+        self.loader.put(FailingRequest())
+        self.assertEqual(len(self.run_requests(1)), 1)
+
+
+class PriorityRequest(AsyncRequest):
+    def __init__(self, name, priority, stale=False):
+        self.name = name
+        self._priority = priority
+        self.stale = stale
+        self.discarded = False
+
+    def execute(self):
+        pass
+
+    def priority(self):
+        return self._priority
+
+    def is_stale(self):
+        return self.stale
+
+    def discard(self):
+        self.discarded = True
+
+
+class TestRequestQueue(TestCase):
+    def setUp(self):
+        self.queue = RequestQueue()
+
+    def drain(self):
+        names = []
+        while not self.queue.empty():
+            names.append(self.queue.get_nowait().name)
+        return names
+
+    def test_priority_order(self):
+        for name, priority in [('c', 2), ('a', 0), ('b', 1), ('a2', 0)]:
+            self.queue.put(PriorityRequest(name, priority))
+        self.assertEqual(self.drain(), ['a', 'a2', 'b', 'c'])
+
+    def test_reprioritize(self):
+        requests = [PriorityRequest(name, i) for i, name in enumerate('abc')]
+        for request in requests:
+            self.queue.put(request)
+        requests[0]._priority = 5
+        requests[1].stale = True
+        stale = self.queue.reprioritize()
+        self.assertEqual(stale, [requests[1]])
+        self.assertEqual(self.drain(), ['c', 'a'])
+
+    def test_loader_discards_stale_requests(self):
+        loader = AsyncLoader()
+        fresh = PriorityRequest('fresh', 0)
+        stale = PriorityRequest('stale', 0)
+        loader.put(fresh)
+        loader.put(stale)
+        stale.stale = True
+        loader.reprioritize()
+        self.assertTrue(stale.discarded)
+        self.assertFalse(fresh.discarded)
+        self.assertEqual(loader._queue.qsize(), 1)
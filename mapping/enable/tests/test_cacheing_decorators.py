@@ -0,0 +1,92 @@
+from threading import Event, Thread
+from unittest import TestCase
+
+from mapping.enable.cacheing_decorators import lru_cache
+
+
+class TestLRUCache(TestCase):
+    def setUp(self):
+        self.calls = []
+
+        @lru_cache(maxsize=3)
+        def load(zoom, row, col, scale=1):
+            self.calls.append((zoom, row, col))
+            return (zoom, row, col, scale)
+
+        self.load = load
+
+    def test_hits_and_misses(self):
+        self.load(0, 0, 0)
+        self.load(0, 0, 0)
+        self.load(0, 0, 0, scale=2)
+        self.assertEqual(self.load.hits, 1)
+        self.assertEqual(self.load.misses, 2)
+        self.assertEqual(self.load(0, 0, 0, scale=2), (0, 0, 0, 2))
+
+    def test_least_recently_used_evicted(self):
+        for col in range(3):
+            self.load(1, 0, col)
+        # Touch the oldest entry so that the second one is evicted instead
+        self.load(1, 0, 0)
+        self.load(1, 0, 3)
+        self.assertEqual(self.load.peek(1, 0, 0), (1, 0, 0, 1))
+        self.assertIsNone(self.load.peek(1, 0, 1))
+        self.assertEqual(self.load.peek(1, 0, 3), (1, 0, 3, 1))
+
+    def test_replace_peek_discard_clear(self):
+        self.load.replace('tile', 2, 1, 1)
+        self.assertEqual(self.load.peek(2, 1, 1), 'tile')
+        self.assertEqual(self.load(2, 1, 1), 'tile')
+        self.assertEqual(self.calls, [])
+        self.load.discard(2, 1, 1)
+        self.assertIsNone(self.load.peek(2, 1, 1))
+        self.load(2, 1, 1)
+        self.load.clear()
+        self.assertEqual((self.load.hits, self.load.misses), (0, 0))
+        self.assertIsNone(self.load.peek(2, 1, 1))
+
+    def test_replace_bounded(self):
+        for col in range(5):
+            self.load.replace(col, 0, 0, col)
+        self.assertIsNone(self.load.peek(0, 0, 1))
+        self.assertEqual(self.load.peek(0, 0, 4), 4)
+
+    def test_replace_during_call_wins(self):
+        # A value stored with `replace` while the function runs, e.g. by an
+        # asynchronous loader, isn't overwritten by the function's result.
+        started = Event()
+        release = Event()
+
+        @lru_cache(maxsize=3)
+        def load(key):
+            started.set()
+            release.wait(5)
+            return None
+
+        results = []
+        thread = Thread(target=lambda: results.append(load('a')))
+        thread.start()
+        started.wait(5)
+        load.replace('tile', 'a')
+        release.set()
+        thread.join(5)
+        self.assertEqual(results, ['tile'])
+        self.assertEqual(load.peek('a'), 'tile')
+
+    def test_concurrent_use(self):
+        @lru_cache(maxsize=16)
+        def load(key):
+            return key
+
+        def work(offset):
+            for i in range(2000):
+                key = (i + offset) % 40
+                self.assertEqual(load(key), key)
+                load.replace(key, key)
+
+        threads = [Thread(target=work, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(load.hits + load.misses, 8000)
@@ -1,10 +1,48 @@
 from unittest import TestCase
+from unittest.mock import MagicMock
 
+import numpy as np
 from kiva.image import Image
 
 from mapping.api import get_builtin_mbtiles_path
 from mapping.enable.canvas import MappingCanvas
 from mapping.enable.api import MBTileManager
+from mapping.enable.http_tile_manager import HTTPTileManager
+from mapping.enable.img_tile_manager import ImageTileManager
+
+
+class CachedTileManager(HTTPTileManager):
+    """ A tile manager serving tiles from a fixed dictionary. """
+
+    def __init__(self, tiles, **traits):
+        super(CachedTileManager, self).__init__(**traits)
+        self.tiles = tiles
+
+    def get_tile(self, zoom, row, col):
+        return self.tiles.get((zoom, row, col))
+
+    def get_cached_tile(self, zoom, row, col):
+        return self.tiles.get((zoom, row, col))
+
+    def set_visible_tiles(self, tiles, viewer=None):
+        self.visible = tiles
+
+
+class CachedImageTileManager(ImageTileManager):
+    """ An image tile manager serving the tiles in its cache, with levels
+    of the given dimensions.
+    """
+
+    def __init__(self, tiles, level_dimensions):
+        super(CachedImageTileManager, self).__init__(
+            _level_dimensions=level_dimensions,
+            max_level=len(level_dimensions) - 1
+        )
+        for key, tile in tiles.items():
+            self._put_in_cache(key, tile)
+
+    def get_tile(self, zoom, row, col):
+        return self.get_cached_tile(zoom, row, col)
 
 
 class TestMappingCanvas(TestCase):
@@ -16,3 +54,87 @@ class TestMappingCanvas(TestCase):
 
     def test__blank_tile(self):
         self.assertIsInstance(self.canvas._blank_tile, Image)
+
+
+class TestFallbackTiles(TestCase):
+    def draw(self, tiles, zoom, view_bounds, **traits):
+        manager = CachedTileManager(tiles, min_level=0, max_level=4)
+        canvas = MappingCanvas(tile_cache=manager, _zoom_level=zoom,
+                               **traits)
+        gc = MagicMock()
+        canvas._draw_underlay(gc, view_bounds)
+        self.visible = manager.visible
+        return [(c[0][0], c[0][1]) for c in gc.draw_image.call_args_list]
+
+    def test_visible_tiles_by_distance(self):
+        self.draw({}, 1, (0, 0, 512, 512))
+        self.assertEqual(set(self.visible), {(1, 0.0, 0.0), (1, 0.0, 1.0),
+                                             (1, 1.0, 0.0), (1, 1.0, 1.0)})
+        self.assertEqual(set(self.visible.values()), {0.5 ** 0.5})
+
+    def test_parent_scaled_up(self):
+        parent = object()
+        # Zoom 2 tile at screen (256, 768) lies within zoom 0 tile (0, 0)
+        draws = self.draw({(0, 0.0, 0.0): parent}, 2, (256, 768, 256, 256))
+        self.assertEqual(draws, [(parent, (0, 0, 1028, 1028))])
+
+    def test_children_scaled_down(self):
+        child = object()
+        draws = self.draw({(2, 3.0, 0.0): child}, 1, (0, 0, 256, 256))
+        self.assertEqual(draws, [(child, (0, 0, 129, 129))])
+
+    def draw_odd_rows(self, tiles, zoom, view_bounds):
+        # The last level has 3 rows of tiles, drawn from the bottom of the
+        # canvas, so its tiles are offset from those of the level above.
+        manager = CachedImageTileManager(tiles, ((1, 1), (2, 1), (3, 1)))
+        canvas = MappingCanvas(tile_cache=manager, _zoom_level=zoom)
+        gc = MagicMock()
+        canvas._draw_underlay(gc, view_bounds)
+        return [(c[0][0], c[0][1]) for c in gc.draw_image.call_args_list]
+
+    def test_parent_of_odd_rows(self):
+        parent = object()
+        # The middle row of zoom 2 is the bottom half of the top tile of
+        # zoom 1, which is its second row from the bottom
+        draws = self.draw_odd_rows({(1, 1, 0): parent}, 2, (0, 256, 256, 256))
+        self.assertEqual(draws, [(parent, (0, 256, 514, 514))])
+
+    def test_children_of_odd_rows(self):
+        child = object()
+        # The bottom tile of zoom 1 has a single child, the bottom tile of
+        # zoom 2, in its upper half
+        draws = self.draw_odd_rows({(2, 0, 0): child}, 1, (0, 0, 256, 256))
+        self.assertEqual(draws, [(child, (0, 128, 129, 129))])
+
+    def test_blank_without_fallback(self):
+        parent = object()
+        canvas_draws = self.draw({(0, 0.0, 0.0): parent}, 1, (0, 0, 256, 256),
+                                 draw_fallback_tiles=False)
+        self.assertEqual(len(canvas_draws), 1)
+        self.assertIsInstance(canvas_draws[0][0], Image)
+
+
+class TestProjection(TestCase):
+    def setUp(self):
+        manager = CachedTileManager({}, min_level=0, max_level=4)
+        self.canvas = MappingCanvas(tile_cache=manager, _zoom_level=3)
+        self.lats = np.array([-80., -33.9, 0., 40.7, 85.])
+        self.lons = np.array([-180., 151.2, 0., -74., 179.9])
+
+    def test_arrays_match_scalars(self):
+        xs, ys = self.canvas.transformToScreen(self.lats, self.lons)
+        self.assertEqual(xs.shape, (5,))
+        for lat, lon, x, y in zip(self.lats, self.lons, xs, ys):
+            expected = self.canvas.transformToScreen(float(lat), float(lon))
+            np.testing.assert_allclose((x, y), expected, rtol=1e-12)
+
+    def test_scalars(self):
+        x, y = self.canvas.transformToScreen(0., 0.)
+        self.assertIsInstance(x, float)
+        self.assertEqual((x, y), (1024., 1024.))
+
+    def test_round_trip(self):
+        xs, ys = self.canvas.transformToScreen(self.lats, self.lons)
+        lats, lons = self.canvas.transformToWGS84(xs, ys)
+        np.testing.assert_allclose(lats, self.lats, atol=1e-9)
+        np.testing.assert_allclose(lons, self.lons, atol=1e-9)
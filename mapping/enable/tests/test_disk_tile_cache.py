@@ -0,0 +1,111 @@
+import os.path as op
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+from mapping.enable.disk_tile_cache import DiskTileCache
+from mapping.enable.mbtiles import MbtileSet
+
+
+class TestDiskTileCache(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = op.join(self.tmpdir, 'cache.mbtiles')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip_persists(self):
+        cache = DiskTileCache(self.filename)
+        self.assertIsNone(cache.get(3, 1, 2))
+        cache.put(3, 1, 2, b'tile')
+        self.assertEqual(cache.get(3, 1, 2), b'tile')
+        cache.close()
+
+        cache = DiskTileCache(self.filename)
+        self.assertEqual(cache.get(3, 1, 2), b'tile')
+        self.assertEqual(cache.total_bytes, 4)
+        cache.close()
+
+    def test_file_is_readable_as_mbtiles(self):
+        cache = DiskTileCache(self.filename, origin='top')
+        cache.put(3, 1, 2, b'tile')
+        cache.close()
+        # MBTiles rows use a bottom origin
+        tileset = MbtileSet(mbtiles=self.filename)
+        self.assertEqual(tileset.get_tile(3, 6, 2).get_png(), b'tile')
+
+    def test_sources_kept_apart(self):
+        a = 'http://a.test/%(zoom)d/%(col)d/%(row)d.png'
+        b = 'http://b.test/%(zoom)d/%(col)d/%(row)d.png'
+        cache = DiskTileCache(self.filename)
+        cache.put(3, 1, 2, b'tile a', source=a)
+        self.assertIsNone(cache.get(3, 1, 2, source=b))
+        self.assertIsNone(cache.get(3, 1, 2))
+        cache.put(3, 1, 2, b'tile b', source=b)
+        cache.close()
+
+        cache = DiskTileCache(self.filename)
+        self.assertEqual(cache.get(3, 1, 2, source=a), b'tile a')
+        self.assertEqual(cache.get(3, 1, 2, source=b), b'tile b')
+        self.assertEqual(cache.total_bytes, 12)
+        cache.close()
+
+    def test_evicts_least_recently_used(self):
+        cache = DiskTileCache(self.filename, max_bytes=30)
+        for col in range(3):
+            cache.put(4, 0, col, b'x' * 10)
+        # Touch the oldest tile so that the second one is evicted instead
+        cache.get(4, 0, 0)
+        cache.put(4, 0, 3, b'x' * 10)
+        self.assertEqual(cache.total_bytes, 30)
+        self.assertIsNone(cache.get(4, 0, 1))
+        for col in (0, 2, 3):
+            self.assertIsNotNone(cache.get(4, 0, col))
+        cache.close()
+
+    def test_eviction_spans_sources(self):
+        cache = DiskTileCache(self.filename, max_bytes=30)
+        cache.put(4, 0, 0, b'x' * 10, source='a')
+        cache.put(4, 0, 0, b'x' * 10, source='b')
+        cache.put(4, 0, 1, b'x' * 10, source='a')
+        cache.get(4, 0, 0, source='a')
+        cache.put(4, 0, 2, b'x' * 10, source='a')
+        self.assertEqual(cache.total_bytes, 30)
+        self.assertIsNone(cache.get(4, 0, 0, source='b'))
+        for col in range(3):
+            self.assertIsNotNone(cache.get(4, 0, col, source='a'))
+        cache.close()
+
+    def test_concurrent_access(self):
+        cache = DiskTileCache(self.filename, max_bytes=1000)
+        errors = []
+
+        def work(zoom):
+            try:
+                for i in range(50):
+                    cache.put(zoom, i, i, b'x' * 10)
+                    cache.get(zoom, i // 2, i // 2)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(z,))
+                   for z in range(8, 12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(cache.total_bytes, 1000)
+        cache.close()
+
+    def test_cache_info(self):
+        cache = DiskTileCache(self.filename)
+        cache.put(3, 1, 2, b'tile')
+        self.assertEqual(cache.get_entry(3, 1, 2), (b'tile', None))
+        cache.put(3, 1, 2, b'tile', ('"v1"', None, 10.0))
+        cache.update_info(3, 1, 2, ('"v2"', None, 20.0))
+        self.assertEqual(cache.get_entry(3, 1, 2),
+                         (b'tile', ('"v2"', None, 20.0)))
+        cache.close()
@@ -0,0 +1,64 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from mapping.enable.canvas import MappingCanvas
+from mapping.enable.http_tile_manager import HTTPTileManager
+from mapping.enable.primitives.api import GeoClusterLayer
+
+
+class TestGeoClusterLayer(TestCase):
+    def setUp(self):
+        self.canvas = MappingCanvas(tile_cache=HTTPTileManager(),
+                                    _zoom_level=2)
+        # Three points a degree apart near (0, 0), and one far away
+        self.layer = GeoClusterLayer(component=self.canvas,
+                                     lat=[0., 1., 1., 0.],
+                                     lon=[0., 1., 2., 90.])
+        self.canvas.overlays.append(self.layer)
+
+    def draw(self, view_bounds=(0, 0, 1024, 1024)):
+        gc = MagicMock()
+        gc.get_text_extent.return_value = (0, 0, 12, 8)
+        self.layer.overlay(self.canvas, gc, view_bounds)
+        points = [call[0][0].tolist()
+                  for call in gc.draw_path_at_points.call_args_list]
+        labels = [call[0][0]
+                  for call in gc.show_text_at_point.call_args_list]
+        return points, labels
+
+    def test_clusters(self):
+        positions, counts = self.layer.clusters()
+        self.assertEqual(sorted(counts.tolist()), [1, 3])
+        cluster = positions[counts == 3][0]
+        self.assertAlmostEqual(cluster[0], 512 + 1024 / 360.)
+
+    def test_draw(self):
+        points, labels = self.draw()
+        # The lone point, then the cluster symbol
+        self.assertEqual(points[0], [[768., 512.]])
+        self.assertEqual(len(points[1]), 1)
+        self.assertEqual(labels, ['3'])
+
+    def test_culled(self):
+        points, labels = self.draw((700, 400, 100, 200))
+        self.assertEqual(points, [[[768., 512.]]])
+        self.assertEqual(labels, [])
+
+    def test_split_when_zooming_in(self):
+        self.canvas._zoom_level = 10
+        self.assertEqual(self.layer.clusters()[1].tolist(), [1, 1, 1, 1])
+        self.canvas._zoom_level = 2
+        self.assertEqual(len(self.layer.clusters()[1]), 2)
+
+    def test_not_clustered_above_max_zoom(self):
+        self.layer.max_cluster_zoom = 1
+        points, labels = self.draw()
+        self.assertEqual(len(points[0]), 4)
+        self.assertEqual(labels, [])
+
+    def test_update_points(self):
+        self.layer.clusters()
+        self.layer.update_points([3], lat=[-1.], lon=[-1.])
+        self.assertEqual(sorted(self.layer.clusters()[1].tolist()), [1, 3])
+        self.layer.update_points([3], lat=[0.5], lon=[1.5])
+        self.assertEqual(self.layer.clusters()[1].tolist(), [4])
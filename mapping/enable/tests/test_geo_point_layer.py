@@ -0,0 +1,84 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from mapping.enable.canvas import MappingCanvas
+from mapping.enable.http_tile_manager import HTTPTileManager
+from mapping.enable.primitives.api import GeoPointLayer
+
+
+class TestGeoPointLayer(TestCase):
+    def setUp(self):
+        self.canvas = MappingCanvas(tile_cache=HTTPTileManager(),
+                                    _zoom_level=2)
+        # Points at (0, 0), (0, 90) and (0, -90) are at (512, 512),
+        # (768, 512) and (256, 512) on the 1024 pixel map.
+        self.layer = GeoPointLayer(component=self.canvas, lat=[0., 0., 0.],
+                                   lon=[0., 90., -90.])
+        self.canvas.overlays.append(self.layer)
+
+    def draw(self, view_bounds):
+        gc = MagicMock()
+        self.layer.overlay(self.canvas, gc, view_bounds)
+        return [(call[0][0].tolist(), call[0][0])
+                for call in gc.draw_path_at_points.call_args_list]
+
+    def test_culling(self):
+        draws = self.draw((400, 400, 400, 200))
+        self.assertEqual(len(draws), 1)
+        self.assertEqual(draws[0][0], [[512., 512.], [768., 512.]])
+        # Points just outside the view still overlap it
+        self.assertEqual(len(self.draw((771, 0, 100, 1000))), 1)
+        self.assertEqual(self.draw((775, 0, 100, 1000)), [])
+
+    def test_groups(self):
+        self.layer.size = [4., 8., 4.]
+        self.layer.color = np.tile([0., 0., 1., 1.], (3, 1))
+        draws = self.draw((0, 0, 1024, 1024))
+        self.assertEqual(sorted(points for points, _ in draws),
+                         [[[512., 512.], [256., 512.]], [[768., 512.]]])
+
+    def test_group_colors(self):
+        self.layer.color = [[1., 0., 0., 1.], [0., 0., 1., .5],
+                            [1., 0., 0., 1.]]
+        gc = MagicMock()
+        self.layer.overlay(self.canvas, gc, (0, 0, 1024, 1024))
+        colors = [call[0][0] for call in gc.set_fill_color.call_args_list]
+        self.assertEqual(sorted(colors),
+                         [(0., 0., 1., 128 / 255.), (1., 0., 0., 1.)])
+
+    def test_square_markers(self):
+        self.layer.marker = 'square'
+        gc = MagicMock()
+        self.layer.overlay(self.canvas, gc, (0, 0, 1024, 1024))
+        points, size, _ = gc.draw_marker_at_points.call_args[0]
+        self.assertEqual(len(points), 3)
+        self.assertEqual(size, 3.)
+        self.assertFalse(gc.draw_path_at_points.called)
+
+    def test_reprojected_on_zoom(self):
+        self.assertEqual(self.layer.points_in_rect(0, 0, 1024, 1024).tolist(),
+                         [0, 1, 2])
+        self.canvas._zoom_level = 1
+        self.assertEqual(self.layer.points_in_rect(0, 0, 300, 300).tolist(),
+                         [0, 2])
+
+    def test_update_points(self):
+        self.draw((0, 0, 1024, 1024))
+        self.layer.update_points([1], lat=[0.], lon=[-180.])
+        self.assertEqual(self.layer.lon.tolist(), [0., -180., -90.])
+        self.assertEqual(self.layer.points_in_rect(0, 0, 300, 1024).tolist(),
+                         [1, 2])
+
+    def test_points_changed(self):
+        self.draw((0, 0, 1024, 1024))
+        self.layer.lon[0] = 180.
+        self.layer.points_changed()
+        self.assertEqual(self.layer.points_in_rect(1000, 0, 100,
+                                                   1024).tolist(), [0])
+
+    def test_mismatched_arrays(self):
+        self.layer.size = [1., 2.]
+        with self.assertRaises(ValueError):
+            self.draw((0, 0, 1024, 1024))
@@ -0,0 +1,44 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from mapping.enable.canvas import MappingCanvas
+from mapping.enable.geojson_overlay import GeoJSONOverlay
+from mapping.enable.http_tile_manager import HTTPTileManager
+
+
+def square(lon, lat, size=1.):
+    ring = [[lon, lat], [lon + size, lat], [lon + size, lat + size],
+            [lon, lat + size], [lon, lat]]
+    return {'type': 'Feature', 'properties': {},
+            'geometry': {'type': 'Polygon', 'coordinates': [ring]}}
+
+
+class TestGeoJSONOverlay(TestCase):
+    def setUp(self):
+        fd, filename = tempfile.mkstemp(suffix='.geojson')
+        self.addCleanup(os.remove, filename)
+        collection = {'type': 'FeatureCollection',
+                      'features': [square(0, 0), square(90, 0),
+                                   square(-90, 45)]}
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(collection, fp)
+        self.canvas = MappingCanvas(tile_cache=HTTPTileManager(),
+                                    _zoom_level=2)
+        self.overlay = GeoJSONOverlay(component=self.canvas,
+                                      geojs_filename=filename)
+
+    def draw(self, view_bounds):
+        gc = MagicMock()
+        self.overlay.overlay(self.canvas, gc, view_bounds)
+        return [call[0][0] for call in gc.add_path.call_args_list]
+
+    def test_draws_visible_features(self):
+        # The squares start at (512, 512), (768, 512) and (256, ~673)
+        paths = self.overlay._paths
+        self.assertEqual(self.draw((0, 0, 1024, 1024)), paths)
+        self.assertEqual(self.draw((500, 500, 30, 30)), [paths[0]])
+        self.assertEqual(self.draw((700, 400, 100, 200)), [paths[1]])
+        self.assertEqual(self.draw((0, 0, 200, 200)), [])
@@ -0,0 +1,31 @@
+from unittest import TestCase
+
+import numpy as np
+
+from mapping.enable.grid_index import GridIndex
+
+
+class TestGridIndex(TestCase):
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        mins = rng.uniform(0, 1, (500, 2))
+        sizes = rng.uniform(0, 0.2, (500, 2))
+        bboxes = np.column_stack([mins, mins + sizes])
+        index = GridIndex(bboxes, cells=16)
+        for xmin, ymin in rng.uniform(-0.1, 1, (50, 2)):
+            xmax, ymax = xmin + 0.1, ymin + 0.3
+            expected = np.flatnonzero(
+                (bboxes[:, 0] <= xmax) & (bboxes[:, 2] >= xmin) &
+                (bboxes[:, 1] <= ymax) & (bboxes[:, 3] >= ymin))
+            np.testing.assert_array_equal(
+                index.query(xmin, ymin, xmax, ymax), expected)
+
+    def test_outside_extent(self):
+        index = GridIndex([(-2, -2, -1, -1), (0.5, 0.5, 3, 0.6)])
+        self.assertEqual(index.query(-5, -5, -1.5, -1.5).tolist(), [0])
+        self.assertEqual(index.query(2, 0, 4, 1).tolist(), [1])
+
+    def test_empty(self):
+        self.assertEqual(len(GridIndex([]).query(0, 0, 1, 1)), 0)
+        index = GridIndex([(np.inf, np.inf, -np.inf, -np.inf)])
+        self.assertEqual(len(index.query(0, 0, 1, 1)), 0)
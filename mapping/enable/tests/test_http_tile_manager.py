@@ -0,0 +1,348 @@
+import os.path as op
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+import requests
+
+from mapping.enable.async_loader import AsyncLoader
+from mapping.enable.disk_tile_cache import DiskTileCache
+from mapping.enable.http_tile_manager import (
+    HTTPTileManager, TileRequest, TileValidators, get_shared_session,
+    get_validators
+)
+
+
+class TestHTTPTileManager(TestCase):
+    def setUp(self):
+        # The loader is never started, so requests stay queued
+        self.loader = AsyncLoader()
+        self.manager = HTTPTileManager(server='localhost',
+                                       url='/%(zoom)d/%(col)d/%(row)d.png',
+                                       async_loader=self.loader,
+                                       redraw_interval=0)
+
+    def queued_tiles(self):
+        tiles = []
+        while not self.loader._queue.empty():
+            args = self.loader._queue.get_nowait()._tile_args
+            tiles.append((args['zoom'], args['row'], args['col']))
+        return tiles
+
+    @patch('mapping.enable.tile_manager.GUI')
+    def test_construction_schedules_nothing(self, gui):
+        # There is nothing to repaint yet, whatever the order of the traits
+        HTTPTileManager(server='localhost', url='/%(zoom)d.png',
+                        redraw_interval=0)
+        self.assertEqual(gui.invoke_after.call_count, 0)
+
+    def test_get_tile_queues_request(self):
+        self.assertIsNone(self.manager.get_tile(1, 0, 1))
+        self.assertEqual(self.queued_tiles(), [(1, 0, 1)])
+
+    def test_requests_ordered_by_distance(self):
+        self.manager.set_visible_tiles({(2, 0, 0): 2.0, (2, 1, 1): 0.5,
+                                        (2, 1, 0): 1.0})
+        for key in [(2, 0, 0), (2, 1, 0), (2, 1, 1)]:
+            self.manager.get_tile(*key)
+        self.assertEqual(self.queued_tiles(),
+                         [(2, 1, 1), (2, 1, 0), (2, 0, 0)])
+
+    @patch('mapping.enable.http_tile_manager.GUI')
+    def test_tiles_leaving_view_are_dropped(self, gui):
+        self.manager.set_visible_tiles({(2, 0, 0): 0.0, (2, 0, 1): 1.0})
+        self.manager.get_tile(2, 0, 0)
+        self.manager.get_tile(2, 0, 1)
+        # Zoom in: neither tile is visible any more
+        self.manager.set_visible_tiles({(3, 0, 0): 0.0})
+        self.assertEqual(self.queued_tiles(), [])
+        self.assertEqual(gui.invoke_later.call_count, 2)
+
+        # Running the discard callbacks forgets the pending fetches, so the
+        # tiles are requested again once they are back in view
+        for call in gui.invoke_later.call_args_list:
+            callback, tile_args = call[0]
+            callback(tile_args)
+        self.manager.set_visible_tiles({(2, 0, 0): 0.0})
+        self.manager.get_tile(2, 0, 0)
+        self.assertEqual(self.queued_tiles(), [(2, 0, 0)])
+
+    def test_viewers_share_manager(self):
+        viewer_a, viewer_b = HTTPTileManager(), HTTPTileManager()
+        self.manager.set_visible_tiles({(2, 0, 0): 0.0}, viewer=viewer_a)
+        self.manager.set_visible_tiles({(2, 3, 3): 0.0}, viewer=viewer_b)
+        self.assertFalse(self.manager._tile_is_stale(
+            dict(zoom=2, row=0, col=0)))
+        self.assertFalse(self.manager._tile_is_stale(
+            dict(zoom=2, row=3, col=3)))
+        # Regions of viewers which go away are forgotten
+        del viewer_b
+        self.manager.set_visible_tiles({(2, 0, 0): 0.0}, viewer=viewer_a)
+        self.assertTrue(self.manager._tile_is_stale(
+            dict(zoom=2, row=3, col=3)))
+
+    def test_one_fetch_in_flight_per_tile(self):
+        self.manager.process_raw = lambda data: data
+        ready = []
+        self.manager.on_trait_change(lambda new: ready.append(new),
+                                     'tile_ready')
+        self.manager.get_tile(1, 0, 1)
+        # Evicting the placeholder must not trigger a second fetch
+        self.manager._clear_cache()
+        self.manager.get_tile(1, 0, 1)
+        request = self.loader._queue.get_nowait()
+        self.assertTrue(self.loader._queue.empty())
+
+        request.handler(request._tile_args, b'tile')
+        self.assertEqual(ready, [(1, 0, 1)])
+        self.assertEqual(self.manager.get_tile(1, 0, 1), b'tile')
+        self.assertEqual(self.manager._pending, {})
+
+    def test_results_for_old_server_are_ignored(self):
+        self.manager.process_raw = lambda data: data
+        self.manager.get_tile(1, 0, 1)
+        old = self.loader._queue.get_nowait()
+        self.manager.server = 'example.com'
+        self.manager.get_tile(1, 0, 1)
+        new = self.loader._queue.get_nowait()
+
+        old.handler(old._tile_args, b'old')
+        self.assertIsNone(self.manager.get_tile(1, 0, 1))
+        new.handler(new._tile_args, b'new')
+        self.assertEqual(self.manager.get_tile(1, 0, 1), b'new')
+
+    @patch('mapping.enable.http_tile_manager.GUI')
+    def test_disk_cache_keeps_servers_apart(self, gui):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        cache = DiskTileCache(op.join(tmpdir, 'cache.mbtiles'))
+        self.addCleanup(cache.close)
+        self.manager.disk_cache = cache
+        self.manager.process_raw = lambda data: data
+
+        def serve(data):
+            fake = FakeSession(FakeResponse(200, {}, data))
+            self.manager.session = requests.Session()
+            self.manager.session.get = fake.get
+            return fake
+
+        def fetch():
+            self.manager.get_tile(1, 0, 1)
+            request = self.loader._queue.get_nowait()
+            request.execute()
+            handler, *args = gui.invoke_later.call_args[0]
+            handler(*args)
+
+        serve(b'old')
+        fetch()
+        self.manager.server = 'example.com'
+        fake = serve(b'new')
+        fetch()
+        self.assertEqual([url for url, _ in fake.requests],
+                         ['http://example.com/1/1/0.png'])
+        self.assertEqual(self.manager.get_tile(1, 0, 1), b'new')
+
+        # Switching back serves the first server's tile from disk
+        self.manager.server = 'localhost'
+        fake = serve(b'unused')
+        fetch()
+        self.assertEqual(fake.requests, [])
+        self.assertEqual(self.manager.get_tile(1, 0, 1), b'old')
+
+    def test_failed_fetch_clears_pending(self):
+        self.manager.get_tile(1, 0, 1)
+        request = self.loader._queue.get_nowait()
+        request.handler(request._tile_args, None)
+        self.assertEqual(self.manager._pending, {})
+
+    def test_expired_tile_is_served_while_revalidating(self):
+        self.manager.process_raw = lambda data: data
+        self.manager.get_tile(1, 0, 1)
+        request = self.loader._queue.get_nowait()
+        expired = TileValidators('"v1"', None, time.time() - 1)
+        request.handler(request._tile_args, b'tile', expired)
+
+        self.assertEqual(self.manager.get_tile(1, 0, 1), b'tile')
+        revalidation = self.loader._queue.get_nowait()
+        self.assertEqual(revalidation._validators, expired)
+        # Only one revalidation is in flight at a time
+        self.manager.get_tile(1, 0, 1)
+        self.assertTrue(self.loader._queue.empty())
+
+        fresh = expired._replace(expires=time.time() + 60)
+        revalidation.handler(revalidation._tile_args, None, fresh,
+                             not_modified=True)
+        self.assertEqual(self.manager.get_tile(1, 0, 1), b'tile')
+        self.assertTrue(self.loader._queue.empty())
+
+    def test_failed_revalidation_of_evicted_tile(self):
+        self.manager.process_raw = lambda data: data
+        self.manager.get_tile(1, 0, 1)
+        request = self.loader._queue.get_nowait()
+        expired = TileValidators('"v1"', None, time.time() - 1)
+        request.handler(request._tile_args, b'tile', expired)
+        self.manager.get_tile(1, 0, 1)
+        revalidation = self.loader._queue.get_nowait()
+
+        # The tile is evicted while it is revalidated, then the
+        # revalidation fails
+        self.manager._clear_cache()
+        revalidation.handler(revalidation._tile_args, None)
+        # The failure is remembered, so the tile isn't requested on every
+        # draw
+        self.assertIsNone(self.manager.get_tile(1, 0, 1))
+        self.assertTrue(self.loader._queue.empty())
+
+    def test_validators_dropped_on_eviction(self):
+        self.manager.process_raw = lambda data: data
+        self.manager.max_cache_bytes = 1024
+        validators = TileValidators('"v1"', None, time.time() + 60)
+        for col in range(20):
+            self.manager.get_tile(5, 0, col)
+            request = self.loader._queue.get_nowait()
+            request.handler(request._tile_args, b'x' * 100, validators)
+        cached = [key for key in self.manager._validators
+                  if self.manager._is_cached(key)]
+        self.assertLess(len(cached), 20)
+        self.assertEqual(sorted(self.manager._validators), sorted(cached))
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, headers, content=b''):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+
+class FakeSession(object):
+    def __init__(self, response):
+        self.response = response
+        self.requests = []
+        self.timeouts = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.requests.append((url, headers))
+        self.timeouts.append(timeout)
+        return self.response
+
+
+@patch('mapping.enable.http_tile_manager.GUI')
+class TestTileRequest(TestCase):
+    def make_request(self, response, validators=None, process_raw=None):
+        self.session = FakeSession(response)
+        self.handler = object()
+        return TileRequest(self.handler, 'localhost', 8080, '/%(zoom)d.png',
+                           dict(zoom=3, row=0, col=0), session=self.session,
+                           validators=validators, default_max_age=100,
+                           process_raw=process_raw)
+
+    def test_tile_decoded_by_request(self, gui):
+        decoded_on = []
+
+        def decode(data):
+            decoded_on.append(threading.current_thread())
+            if data != b'png':
+                raise ValueError('Bad tile')
+            return 'image'
+
+        thread = threading.Thread(target=self.make_request(
+            FakeResponse(200, {}, b'png'), process_raw=decode).execute)
+        thread.start()
+        thread.join()
+        self.assertEqual(decoded_on, [thread])
+        self.assertEqual(gui.invoke_later.call_args[0][2], 'image')
+
+        # Undecodable tiles are reported as failures
+        self.make_request(FakeResponse(200, {}, b'junk'),
+                          process_raw=decode).execute()
+        self.assertEqual(len(gui.invoke_later.call_args[0]), 3)
+        self.assertIsNone(gui.invoke_later.call_args[0][2])
+
+    def test_fetch_records_validators(self, gui):
+        response = FakeResponse(200, {'ETag': '"abc"',
+                                      'Cache-Control': 'public, max-age=60'},
+                                b'tile')
+        self.make_request(response).execute()
+        (handler, _, data, validators), _ = gui.invoke_later.call_args
+        self.assertEqual(self.session.requests,
+                         [('http://localhost:8080/3.png', {})])
+        self.assertEqual(data, b'tile')
+        self.assertEqual(validators.etag, '"abc"')
+        self.assertAlmostEqual(validators.expires, time.time() + 60, delta=5)
+
+    def test_revalidation_not_modified(self, gui):
+        old = TileValidators('"abc"', 'Tue, 15 Nov 1994 12:45:26 GMT', 0)
+        self.make_request(FakeResponse(304, {}), validators=old).execute()
+        _, headers = self.session.requests[0]
+        self.assertEqual(headers, {
+            'If-None-Match': '"abc"',
+            'If-Modified-Since': 'Tue, 15 Nov 1994 12:45:26 GMT',
+        })
+        args, kwargs = gui.invoke_later.call_args
+        self.assertIsNone(args[2])
+        self.assertTrue(kwargs['not_modified'])
+        # No freshness information, so the default max age applies
+        self.assertEqual(args[3].etag, '"abc"')
+        self.assertAlmostEqual(args[3].expires, time.time() + 100, delta=5)
+
+
+class TestSharedSession(TestCase):
+    def test_shared_per_server(self):
+        session = get_shared_session('tiles.test', 8080)
+        self.assertIs(get_shared_session('tiles.test', 8080), session)
+        self.assertIsNot(get_shared_session('tiles.test', 8081), session)
+        self.assertIsNot(get_shared_session('other.test', 8080), session)
+
+        managers = [HTTPTileManager(server='tiles.test', port=8080)
+                    for _ in range(2)]
+        self.assertIs(managers[0].session, session)
+        self.assertIs(managers[1].session, session)
+        managers[1].port = 8081
+        self.assertIsNot(managers[1].session, session)
+
+    def test_pool_configuration(self):
+        session = get_shared_session('pool.test', 8080, pool_size=3,
+                                     max_retries=5)
+        adapter = session.get_adapter('http://pool.test:8080/0/0/0.png')
+        self.assertEqual(adapter._pool_maxsize, 3)
+        self.assertTrue(adapter._pool_block)
+        self.assertEqual(adapter.max_retries.total, 5)
+        # Only the tile server's connections are pooled
+        self.assertIsNot(session.get_adapter('http://other.test/'), adapter)
+
+    @patch('mapping.enable.http_tile_manager.GUI')
+    def test_timeout_reaches_request(self, gui):
+        loader = AsyncLoader()
+        manager = HTTPTileManager(server='localhost', url='/%(zoom)d.png',
+                                  async_loader=loader, timeout=(1.0, 2.5))
+        fake = FakeSession(FakeResponse(200, {}, b'png'))
+        manager.session = requests.Session()
+        manager.session.get = fake.get
+        manager.get_tile(3, 0, 0)
+        loader._queue.get_nowait().execute()
+        self.assertEqual(fake.timeouts, [(1.0, 2.5)])
+
+
+class TestGetValidators(TestCase):
+    def test_expires_header(self):
+        validators = get_validators({
+            'Date': 'Tue, 15 Nov 1994 08:12:31 GMT',
+            'Expires': 'Tue, 15 Nov 1994 09:12:31 GMT',
+            'Last-Modified': 'Mon, 14 Nov 1994 08:12:31 GMT',
+        }, 0)
+        self.assertAlmostEqual(validators.expires, time.time() + 3600,
+                               delta=5)
+        self.assertEqual(validators.last_modified,
+                         'Mon, 14 Nov 1994 08:12:31 GMT')
+
+    def test_no_cache(self):
+        validators = get_validators({'Cache-Control': 'no-cache'}, 100)
+        self.assertLessEqual(validators.expires, time.time())
+
+    def test_age_is_subtracted(self):
+        validators = get_validators({'Cache-Control': 'max-age=100',
+                                     'Age': '40'}, 0)
+        self.assertAlmostEqual(validators.expires, time.time() + 60, delta=5)
@@ -0,0 +1,107 @@
+import os
+import os.path as op
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+from kiva.image import Image
+
+from mapping.enable.canvas import MappingCanvas, array_to_image
+from mapping.enable.img_tile_manager import ImageTileManager
+from mapping.enable.lod_manifest import MANIFEST_NAME, read_manifest
+
+
+def make_lod_dir(path, levels=2):
+    """ Write a pyramid whose tiles are filled with their level, row and
+    column.
+    """
+    for level in range(levels):
+        level_dir = op.join(path, str(level))
+        os.makedirs(level_dir)
+        count = 1 << level
+        for row in range(count):
+            for col in range(count):
+                tile = np.empty((256, 256, 3), dtype=np.uint8)
+                tile[...] = (level, row, col)
+                np.save(op.join(level_dir, '{}.{}.npy'.format(row, col)),
+                        tile)
+
+
+class TestImageTileManager(TestCase):
+    def setUp(self):
+        self.lod_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.lod_dir)
+        make_lod_dir(self.lod_dir)
+
+    def test_direct_path(self):
+        manager = ImageTileManager(lod_dir=self.lod_dir)
+        MappingCanvas(tile_cache=manager)
+        with patch('mapping.enable.img_tile_manager.Image') as pil_image:
+            tile = manager.get_tile(1, 0, 1)
+            self.assertFalse(pil_image.fromarray.called)
+        # Rows are flipped: row 0 is the bottom row of tiles
+        self.assertEqual(tile.bmp_array.shape, (256, 256, 3))
+        self.assertEqual(tuple(tile.bmp_array[0, 0]), (1, 1, 1))
+        self.assertEqual(tile.format(), 'rgb24')
+
+    def test_png_path(self):
+        manager = ImageTileManager(lod_dir=self.lod_dir,
+                                   process_raw=lambda d: Image(BytesIO(d)))
+        tile = manager.get_tile(1, 1, 0)
+        self.assertEqual(tuple(tile.bmp_array[0, 0, :3]), (1, 0, 0))
+
+    def test_missing_tile(self):
+        manager = ImageTileManager(lod_dir=self.lod_dir)
+        MappingCanvas(tile_cache=manager)
+        self.assertIsNone(manager.get_tile(3, 0, 0))
+
+    def test_manifest_written(self):
+        ImageTileManager(lod_dir=self.lod_dir)
+        self.assertTrue(op.exists(op.join(self.lod_dir, MANIFEST_NAME)))
+        presence = read_manifest(self.lod_dir)
+        self.assertEqual([bitmap.shape for bitmap in presence],
+                         [(1, 1), (2, 2)])
+        self.assertTrue(all(bitmap.all() for bitmap in presence))
+
+    def test_manifest_read_first(self):
+        os.remove(op.join(self.lod_dir, '1', '0.1.npy'))
+        ImageTileManager(lod_dir=self.lod_dir)
+        with patch('mapping.enable.lod_manifest.os.listdir') as listdir:
+            manager = ImageTileManager(lod_dir=self.lod_dir)
+            self.assertFalse(listdir.called)
+        MappingCanvas(tile_cache=manager)
+        self.assertEqual(manager.get_data_dimensions(1), (2, 2))
+        with patch('mapping.enable.img_tile_manager.np.load') as load:
+            # Row 1 from the bottom is row 0 from the top
+            self.assertIsNone(manager.get_tile(1, 1, 1))
+            self.assertFalse(load.called)
+        self.assertIsNotNone(manager.get_tile(1, 1, 0))
+
+    def test_read_only_dir(self):
+        with patch('mapping.enable.lod_manifest.write_manifest',
+                   side_effect=OSError):
+            manager = ImageTileManager(lod_dir=self.lod_dir)
+        self.assertEqual(manager.get_data_dimensions(1), (2, 2))
+
+    def test_invalid_manifest(self):
+        with open(op.join(self.lod_dir, MANIFEST_NAME), 'w') as fp:
+            fp.write('{"version": 1, "levels": [{"rows": 1}]}')
+        manager = ImageTileManager(lod_dir=self.lod_dir)
+        self.assertEqual(manager.get_data_dimensions(1), (2, 2))
+
+
+class TestArrayToImage(TestCase):
+    def test_no_copy(self):
+        array = np.zeros((256, 256, 4), dtype=np.uint8)
+        image = array_to_image(array)
+        self.assertEqual(image.format(), 'rgba32')
+        self.assertTrue(np.shares_memory(image.bmp_array, array))
+
+    def test_grayscale(self):
+        array = np.full((16, 16), 7, dtype=np.uint8)
+        image = array_to_image(array)
+        self.assertEqual(image.format(), 'rgb24')
+        self.assertEqual(tuple(image.bmp_array[3, 3]), (7, 7, 7))
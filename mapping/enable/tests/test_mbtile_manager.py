@@ -0,0 +1,184 @@
+import os.path as op
+import shutil
+import sqlite3
+import tempfile
+from threading import Thread
+from unittest import TestCase
+from unittest.mock import patch
+
+from six.moves import queue
+
+from mapping.api import get_builtin_mbtiles_path
+from mapping.enable.async_loader import AsyncLoader
+from mapping.enable.mbtile_manager import MBTileManager
+from mapping.enable.mbtiles import MbtileSet
+
+
+class TestMbtileSet(TestCase):
+    def setUp(self):
+        self.tileset = MbtileSet(mbtiles=get_builtin_mbtiles_path())
+
+    def test_get_tiles_matches_get_tile(self):
+        keys = [(2, row, col) for row in range(4) for col in range(4)]
+        tiles = self.tileset.get_tiles(keys)
+        self.assertEqual(set(tiles), set(keys))
+        for key in keys:
+            self.assertEqual(tiles[key],
+                             self.tileset.get_tile(*key).get_png())
+
+    def test_get_tiles_skips_missing(self):
+        tiles = self.tileset.get_tiles([(0, 0, 0), (0, 5, 5), (30, 0, 0)])
+        self.assertEqual(list(tiles), [(0, 0, 0)])
+
+    def test_get_tiles_keeps_given_keys(self):
+        # Tile managers work with float tile numbers
+        tiles = self.tileset.get_tiles([(1.0, 1.0, 0.0)])
+        self.assertEqual(list(tiles), [(1.0, 1.0, 0.0)])
+
+    def test_get_tiles_many_queries(self):
+        keys = [(4, row, col) for row in range(16) for col in range(16)]
+        keys += [(3, row, col) for row in range(8) for col in range(8)]
+        with patch('mapping.enable.mbtiles.TILES_PER_QUERY', 7):
+            tiles = self.tileset.get_tiles(keys)
+        self.assertEqual(tiles, self.tileset.get_tiles(keys))
+        self.assertEqual(len(tiles), 228 + 61)
+
+    def test_get_tiles_from_other_thread(self):
+        keys = [(2, row, col) for row in range(4) for col in range(4)]
+        results = []
+        thread = Thread(target=lambda: results.append(
+            (self.tileset.get_tiles(keys), self.tileset.conn)
+        ))
+        thread.start()
+        thread.join()
+        tiles, conn = results[0]
+        self.assertEqual(tiles, self.tileset.get_tiles(keys))
+        # The thread used a connection of its own
+        self.assertIsNot(conn, self.tileset.conn)
+
+
+class TestMBTileManager(TestCase):
+    def setUp(self):
+        self.manager = MBTileManager(filename=get_builtin_mbtiles_path(),
+                                     process_raw=lambda data: data)
+
+    def test_visible_tiles_loaded_in_one_query(self):
+        visible = {(3, row, col): 0 for row in range(8) for col in range(8)}
+        with patch.object(self.manager._tileset, 'get_tiles',
+                          wraps=self.manager._tileset.get_tiles) as get_tiles:
+            self.manager.set_visible_tiles(visible)
+            self.assertEqual(get_tiles.call_count, 1)
+            # Everything is cached now, including the tiles which don't exist
+            self.manager.set_visible_tiles(visible)
+            self.assertEqual(get_tiles.call_count, 1)
+
+        with patch.object(self.manager, '_load_tile') as load_tile:
+            for zoom, row, col in visible:
+                self.manager.get_tile(zoom, row, col)
+            self.assertFalse(load_tile.called)
+        self.assertEqual(self.manager.get_tile(3, 0, 0),
+                         self.manager._tileset.get_tile(3, 0, 0).get_png())
+
+
+class TestAsyncMBTileManager(TestCase):
+    def setUp(self):
+        self.loader = AsyncLoader()
+        self.loader.start()
+        self.manager = MBTileManager(filename=get_builtin_mbtiles_path(),
+                                     process_raw=lambda data: data,
+                                     async_loading=True,
+                                     async_loader=self.loader,
+                                     redraw_interval=0)
+        self.ready = []
+        self.manager.on_trait_change(lambda new: self.ready.append(new),
+                                     'tile_ready')
+        # Stands in for the GUI event loop
+        self.calls = queue.Queue()
+        patcher = patch('mapping.enable.mbtile_manager.GUI')
+        gui = patcher.start()
+        gui.invoke_later.side_effect = (
+            lambda func, *args: self.calls.put((func, args))
+        )
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.loader.stop)
+
+    def process_events(self, count=1):
+        for i in range(count):
+            func, args = self.calls.get(timeout=5)
+            func(*args)
+
+    def test_get_tile_loads_in_background(self):
+        self.assertIsNone(self.manager.get_tile(2, 1, 1))
+        # Asking again while the tile is loading doesn't queue another read
+        self.assertIsNone(self.manager.get_tile(2, 1, 1))
+        self.process_events()
+        self.assertTrue(self.calls.empty())
+        self.assertEqual(self.ready, [(2, 1, 1)])
+        self.assertEqual(self.manager.get_tile(2, 1, 1),
+                         self.manager._tileset.get_tile(2, 1, 1).get_png())
+
+    def test_visible_tiles_read_in_one_request(self):
+        visible = {(3, row, col): 0 for row in range(8) for col in range(8)}
+        self.manager.set_visible_tiles(visible)
+        for key in visible:
+            self.assertIsNone(self.manager.get_tile(*key))
+        self.process_events()
+        self.assertTrue(self.calls.empty())
+        # Only the tiles in the file are announced, but all are cached
+        self.assertEqual(len(self.ready), 61)
+        self.assertTrue(all(self.manager._is_cached(key) for key in visible))
+
+    def test_filename_change_drops_results(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        filename = op.join(tmpdir, 'copy.mbtiles')
+        shutil.copy(get_builtin_mbtiles_path(), filename)
+
+        self.manager.get_tile(2, 1, 1)
+        self.manager.filename = filename
+        self.process_events()
+        self.assertEqual(self.ready, [])
+        self.assertFalse(self.manager._is_cached((2, 1, 1)))
+
+
+class TestReadOnlyMbtileSet(TestCase):
+    def setUp(self):
+        self.tileset = MbtileSet(mbtiles=get_builtin_mbtiles_path(),
+                                 read_only=True, mmap_size=1 << 20,
+                                 cache_size=-512)
+
+    def pragma(self, conn, name):
+        return conn.execute('PRAGMA {}'.format(name)).fetchone()[0]
+
+    def test_pragmas(self):
+        conn = self.tileset.conn
+        self.assertEqual(self.pragma(conn, 'query_only'), 1)
+        self.assertEqual(self.pragma(conn, 'mmap_size'), 1 << 20)
+        self.assertEqual(self.pragma(conn, 'cache_size'), -512)
+
+    def test_writes_refused(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            self.tileset.conn.execute('DELETE FROM tiles')
+
+    def test_reads_match(self):
+        keys = [(3, row, col) for row in range(8) for col in range(8)]
+        default = MbtileSet(mbtiles=get_builtin_mbtiles_path())
+        self.assertEqual(self.tileset.get_tiles(keys), default.get_tiles(keys))
+
+    def test_thread_connections_configured(self):
+        results = []
+        thread = Thread(target=lambda: results.append(
+            self.pragma(self.tileset.conn, 'mmap_size')
+        ))
+        thread.start()
+        thread.join()
+        self.assertEqual(results, [1 << 20])
+
+    def test_manager_options(self):
+        manager = MBTileManager(filename=get_builtin_mbtiles_path(),
+                                read_only=True, mmap_size=1 << 20)
+        self.assertTrue(manager._tileset.read_only)
+        self.assertEqual(manager._tileset.mmap_size, 1 << 20)
+        manager.page_cache_size = -256
+        self.assertEqual(self.pragma(manager._tileset.conn, 'cache_size'),
+                         -256)
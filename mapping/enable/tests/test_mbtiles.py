@@ -0,0 +1,96 @@
+import os
+import os.path as op
+import shutil
+import sqlite3
+import tempfile
+from unittest import TestCase
+
+from mapping.api import get_builtin_mbtiles_path
+from mapping.enable.mbtiles import MbtileSet, tile_range
+
+
+class TestWriteAll(TestCase):
+    def setUp(self):
+        self.outdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.outdir)
+        self.tileset = MbtileSet(mbtiles=get_builtin_mbtiles_path(),
+                                 outdir=self.outdir)
+
+    def exported(self):
+        files = set()
+        for dirpath, dirnames, filenames in os.walk(self.outdir):
+            for filename in filenames:
+                files.add(op.relpath(op.join(dirpath, filename), self.outdir))
+        return files
+
+    def test_export_everything(self):
+        stats = self.tileset.write_all(chunk_size=50)
+        self.assertEqual(stats['written'], 310)
+        self.assertEqual(stats['skipped'], 0)
+        self.assertGreater(stats['tiles_per_second'], 0)
+        self.assertEqual(len(self.exported()), 310)
+        # <zoom>/<col>/<row>.png, with bottom-origin rows
+        with open(op.join(self.outdir, '2', '3', '1.png'), 'rb') as fh:
+            self.assertEqual(fh.read(),
+                             self.tileset.get_tile(2, 1, 3).get_png())
+
+    def test_zoom_range(self):
+        stats = self.tileset.write_all(zoom_range=(1, 2))
+        self.assertEqual(stats['written'], 20)
+        self.assertEqual({path.split(os.sep)[0] for path in self.exported()},
+                         {'1', '2'})
+
+    def test_bbox(self):
+        # The north-east quarter of the world
+        bbox = (0.0, 0.0, 179.0, 85.0)
+        self.tileset.write_all(zoom_range=(2, 2), bbox=bbox)
+        self.assertEqual(tile_range(bbox, 2), (2, 3, 2, 3))
+        self.assertEqual(
+            self.exported(),
+            {op.join('2', str(col), '{}.png'.format(row))
+             for col in (2, 3) for row in (2, 3)}
+        )
+
+    def test_resume(self):
+        self.tileset.write_all(zoom_range=(0, 3))
+        os.remove(op.join(self.outdir, '3', '4', '4.png'))
+        progress = []
+        stats = self.tileset.write_all(
+            zoom_range=(0, 3), chunk_size=20,
+            progress=lambda done, total, rate: progress.append((done, total))
+        )
+        self.assertEqual(stats['written'], 1)
+        self.assertEqual(stats['skipped'], 81)
+        self.assertEqual(progress[-1], (82, 82))
+        self.assertEqual(len(progress), 5)
+
+    def test_missing_grids(self):
+        filename = op.join(self.outdir, 'grids.mbtiles')
+        shutil.copy(get_builtin_mbtiles_path(), filename)
+        conn = sqlite3.connect(filename)
+        with conn:
+            conn.execute('CREATE TABLE grids (zoom_level integer, '
+                         'tile_column integer, tile_row integer, grid blob)')
+        conn.close()
+        outdir = op.join(self.outdir, 'out')
+        tileset = MbtileSet(mbtiles=filename, outdir=outdir)
+        stats = tileset.write_all(zoom_range=(0, 1))
+        self.assertEqual(stats['written'], 5)
+        self.assertFalse(any(path.endswith('.json')
+                             for path in self.exported()))
+
+    def test_requires_outdir(self):
+        with self.assertRaises(Exception):
+            MbtileSet(mbtiles=get_builtin_mbtiles_path()).write_all()
+
+
+class TestTileRange(TestCase):
+    def test_whole_world(self):
+        world = (-180.0, -90.0, 180.0, 90.0)
+        self.assertEqual(tile_range(world, 0), (0, 0, 0, 0))
+        self.assertEqual(tile_range(world, 3), (0, 7, 0, 7))
+
+    def test_point(self):
+        # Austin, TX at zoom 4: x = 3, top-origin y = 6
+        self.assertEqual(tile_range((-97.7, 30.3, -97.7, 30.3), 4),
+                         (3, 3, 9, 9))
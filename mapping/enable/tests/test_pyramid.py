@@ -0,0 +1,86 @@
+import os.path as op
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from mapping.enable.canvas import MappingCanvas
+from mapping.enable.img_tile_manager import ImageTileManager
+from mapping.enable.pyramid import Pyramid, PyramidWriter
+
+
+def make_tile(level, row, col, shape=(256, 256)):
+    tile = np.empty(shape + (3,), dtype=np.uint8)
+    tile[...] = (level, row, col)
+    return tile
+
+
+class TestPyramid(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.filename = op.join(self.tmpdir, 'image.pyr')
+
+    def write(self, compression=None):
+        with PyramidWriter(self.filename, [(1, 1), (2, 2)],
+                           compression=compression) as writer:
+            writer.write_tile(0, 0, 0, make_tile(0, 0, 0))
+            writer.write_tile(1, 0, 1, make_tile(1, 0, 1))
+            # Edge tiles may be smaller
+            writer.write_tile(1, 1, 0, make_tile(1, 1, 0, (100, 256)))
+        pyramid = Pyramid(self.filename)
+        self.addCleanup(pyramid.close)
+        return pyramid
+
+    def test_round_trip(self):
+        pyramid = self.write()
+        self.assertEqual(pyramid.level_dimensions, ((1, 1), (2, 2)))
+        self.assertEqual(pyramid.tile_size, 256)
+        np.testing.assert_array_equal(pyramid.get_tile(1, 0, 1),
+                                      make_tile(1, 0, 1))
+        self.assertEqual(pyramid.get_tile(1, 1, 0).shape, (100, 256, 3))
+        # Missing and out of range tiles
+        self.assertIsNone(pyramid.get_tile(1, 1, 1))
+        self.assertFalse(pyramid.has_tile(1, 1, 1))
+        self.assertIsNone(pyramid.get_tile(1, 2, 0))
+        self.assertIsNone(pyramid.get_tile(2, 0, 0))
+
+    def test_tiles_are_mapped(self):
+        tile = self.write().get_tile(0, 0, 0)
+        self.assertFalse(tile.flags.writeable)
+        self.assertFalse(tile.flags.owndata)
+
+    def test_compressed(self):
+        pyramid = self.write(compression='zlib')
+        self.assertEqual(pyramid.compression, 'zlib')
+        np.testing.assert_array_equal(pyramid.get_tile(1, 1, 0),
+                                      make_tile(1, 1, 0, (100, 256)))
+        self.assertLess(op.getsize(self.filename), 3 * 1024)
+
+    def test_not_a_pyramid(self):
+        with open(self.filename, 'wb') as fp:
+            fp.write(b'\x93NUMPY' + b'\x00' * 32)
+        with self.assertRaises(ValueError):
+            Pyramid(self.filename)
+
+    def test_image_tile_manager(self):
+        self.write()
+        manager = ImageTileManager(filename=self.filename)
+        MappingCanvas(tile_cache=manager)
+        self.assertEqual(manager.get_data_dimensions(1), (2, 2))
+        self.assertEqual(manager.max_level, 2)
+        # Rows are flipped: row 0 is the bottom row of tiles
+        tile = manager.get_tile(1, 0, 0)
+        self.assertEqual(tuple(tile.bmp_array[0, 0]), (1, 1, 0))
+        self.assertIsNone(manager.get_tile(1, 0, 1))
+
+    def test_grayscale_image_tile_manager(self):
+        with PyramidWriter(self.filename, [(1, 1)], channels=1) as writer:
+            writer.write_tile(0, 0, 0, np.full((256, 256), 9, np.uint8))
+        manager = ImageTileManager(filename=self.filename)
+        self.addCleanup(manager._pyramid.close)
+        MappingCanvas(tile_cache=manager)
+        tile = manager.get_tile(0, 0, 0)
+        self.assertEqual(tile.format(), 'rgb24')
+        self.assertEqual(tuple(tile.bmp_array[5, 5]), (9, 9, 9))
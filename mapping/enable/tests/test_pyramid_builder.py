@@ -0,0 +1,233 @@
+import os.path as op
+import shutil
+import sqlite3
+import tempfile
+from io import BytesIO
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+from PIL import Image, TiffImagePlugin
+
+from mapping.enable.lod_manifest import read_manifest
+from mapping.enable.pyramid import Pyramid
+from mapping.enable.pyramid_builder import (
+    _ImageFile, build_pyramid, halve, level_sizes
+)
+
+SIZE = 16
+
+
+class StripSource(object):
+    """ An array which records the slices read from it. """
+
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.reads = []
+
+    def __getitem__(self, index):
+        self.reads.append(index)
+        return self.array[index]
+
+
+def reference_levels(array):
+    """ The levels of an image, built from the whole image at once. """
+    levels = [array]
+    while max(levels[-1].shape[:2]) > SIZE:
+        levels.append(halve(levels[-1]))
+    return levels[::-1]
+
+
+def split_tiles(array):
+    rows, cols = -(-array.shape[0] // SIZE), -(-array.shape[1] // SIZE)
+    return {(row, col): array[row * SIZE:(row + 1) * SIZE,
+                              col * SIZE:(col + 1) * SIZE]
+            for row in range(rows) for col in range(cols)}
+
+
+class TestPyramidBuilder(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        rng = np.random.default_rng(0)
+        self.image = rng.integers(0, 256, (75, 50, 3), dtype=np.uint8)
+
+    def test_level_sizes(self):
+        self.assertEqual(level_sizes((75, 50), SIZE),
+                         [(75, 50), (38, 25), (19, 13), (10, 7)])
+        self.assertEqual(level_sizes((10, 10), SIZE), [(10, 10)])
+
+    def test_halve(self):
+        block = np.array([[0, 2, 9], [4, 6, 9], [1, 1, 1]], dtype=np.uint8)
+        np.testing.assert_array_equal(halve(block), [[3, 9], [1, 1]])
+        halved = halve(np.ones((5, 3), dtype=np.float32))
+        self.assertEqual(halved.dtype, np.float32)
+        np.testing.assert_array_equal(halved, np.ones((3, 2)))
+
+    def check_npy_tree(self, lod_dir, dimensions):
+        levels = reference_levels(self.image)
+        self.assertEqual(dimensions, [(1, 1), (2, 1), (3, 2), (5, 4)])
+        for level, array in enumerate(levels):
+            for (row, col), tile in split_tiles(array).items():
+                path = op.join(lod_dir, str(level),
+                               '{}.{}.npy'.format(row, col))
+                np.testing.assert_array_equal(np.load(path), tile)
+
+    def test_npy_tree(self):
+        lod_dir = op.join(self.tmpdir, 'lod')
+        source = StripSource(self.image)
+        dimensions = build_pyramid(source, lod_dir, tile_size=SIZE,
+                                   num_workers=0)
+        self.check_npy_tree(lod_dir, dimensions)
+        presence = read_manifest(lod_dir)
+        self.assertEqual([bitmap.shape for bitmap in presence], dimensions)
+        self.assertTrue(all(bitmap.all() for bitmap in presence))
+        # The source is read one strip of tiles at a time
+        self.assertEqual(len(source.reads), 5)
+        self.assertEqual(source.reads[0], slice(0, SIZE))
+
+    def test_worker_processes(self):
+        lod_dir = op.join(self.tmpdir, 'lod')
+        progress = []
+        dimensions = build_pyramid(
+            self.image, lod_dir, tile_size=SIZE, num_workers=2,
+            progress=lambda done, total, rate: progress.append((done, total))
+        )
+        self.check_npy_tree(lod_dir, dimensions)
+        self.assertEqual(progress[-1], (29, 29))
+
+    def test_npy_source(self):
+        filename = op.join(self.tmpdir, 'image.npy')
+        np.save(filename, self.image)
+        lod_dir = op.join(self.tmpdir, 'lod')
+        dimensions = build_pyramid(filename, lod_dir, tile_size=SIZE,
+                                   num_workers=0)
+        self.check_npy_tree(lod_dir, dimensions)
+
+    def build_from_image_file(self, filename):
+        lod_dir = op.join(self.tmpdir, 'lod')
+        decode = _ImageFile._decode
+        with patch.object(_ImageFile, '_decode', autospec=True,
+                          side_effect=decode) as decoded:
+            dimensions = build_pyramid(filename, lod_dir, tile_size=SIZE,
+                                       num_workers=0)
+        self.check_npy_tree(lod_dir, dimensions)
+        return [call[0][1:] for call in decoded.call_args_list]
+
+    def test_striped_image_source(self):
+        filename = op.join(self.tmpdir, 'image.tif')
+        # Pillow only writes several strips through libtiff
+        with patch.object(TiffImagePlugin, 'WRITE_LIBTIFF', True):
+            Image.fromarray(self.image).save(filename,
+                                             strip_size=50 * 3 * 8)
+        with Image.open(filename) as image:
+            self.assertEqual(len(image.tile), 10)
+        # Only the strips of each row of tiles are decoded
+        self.assertEqual(self.build_from_image_file(filename),
+                         [(start, min(start + SIZE, 75))
+                          for start in range(0, 75, SIZE)])
+
+    def test_unknown_tiles_decoded_whole(self):
+        filename = op.join(self.tmpdir, 'image.tif')
+        with patch.object(TiffImagePlugin, 'WRITE_LIBTIFF', True):
+            Image.fromarray(self.image).save(filename,
+                                             strip_size=50 * 3 * 8)
+        open_image = Image.open
+
+        def open_with_lists(*args, **kwargs):
+            # Tiles of another form than the expected tuples
+            image = open_image(*args, **kwargs)
+            image.tile = [list(tile) for tile in image.tile]
+            return image
+
+        with patch.object(Image, 'open', side_effect=open_with_lists), \
+                self.assertLogs('mapping.enable.pyramid_builder', 'WARNING'):
+            decoded = self.build_from_image_file(filename)
+        self.assertEqual(decoded, [(0, SIZE)])
+
+    def test_image_source(self):
+        filename = op.join(self.tmpdir, 'image.png')
+        Image.fromarray(self.image).save(filename)
+        # The image is decoded whole, once
+        self.assertEqual(self.build_from_image_file(filename), [(0, SIZE)])
+
+    def test_palette_image_source(self):
+        filename = op.join(self.tmpdir, 'image.png')
+        image = Image.fromarray(self.image).quantize(colors=16)
+        image.save(filename)
+        self.image = np.asarray(image.convert('RGB'))
+        # The colors are tiled, not the palette indices
+        self.build_from_image_file(filename)
+
+    def test_unsupported_image_mode(self):
+        filename = op.join(self.tmpdir, 'image.tif')
+        Image.fromarray(self.image[..., 0].astype(np.float32)).save(filename)
+        with self.assertRaises(ValueError):
+            build_pyramid(filename, op.join(self.tmpdir, 'lod'),
+                          tile_size=SIZE, num_workers=0)
+
+    def test_single_file_pyramid(self):
+        filename = op.join(self.tmpdir, 'image.pyr')
+        build_pyramid(self.image, filename, output_format='pyramid',
+                      tile_size=SIZE, num_workers=0, compression='zlib')
+        pyramid = Pyramid(filename)
+        self.addCleanup(pyramid.close)
+        self.assertEqual(pyramid.level_dimensions,
+                         ((1, 1), (2, 1), (3, 2), (5, 4)))
+        full = reference_levels(self.image)[-1]
+        np.testing.assert_array_equal(pyramid.get_tile(3, 4, 3),
+                                      split_tiles(full)[4, 3])
+
+    def test_mbtiles(self):
+        filename = op.join(self.tmpdir, 'image.mbtiles')
+        build_pyramid(self.image, filename, output_format='mbtiles',
+                      tile_size=SIZE, num_workers=0)
+        conn = sqlite3.connect(filename)
+        self.addCleanup(conn.close)
+        data, = conn.execute(
+            'SELECT tile_data FROM tiles WHERE zoom_level=3 AND '
+            'tile_column=1 AND tile_row=7'
+        ).fetchone()
+        # Rows count from the bottom of the 8 rows of the level, and edge
+        # tiles are padded
+        tile = np.asarray(Image.open(BytesIO(data)))
+        self.assertEqual(tile.shape, (SIZE, SIZE, 3))
+        np.testing.assert_array_equal(tile, self.image[:SIZE, SIZE:2 * SIZE])
+        data, = conn.execute(
+            'SELECT tile_data FROM tiles WHERE zoom_level=3 AND '
+            'tile_column=3 AND tile_row=3'
+        ).fetchone()
+        tile = np.asarray(Image.open(BytesIO(data)))
+        np.testing.assert_array_equal(tile[:11, :2], self.image[64:, 48:])
+        self.assertFalse(tile[11:].any())
+
+    def test_mbtiles_odd_rows(self):
+        filename = op.join(self.tmpdir, 'image.mbtiles')
+        build_pyramid(self.image, filename, output_format='mbtiles',
+                      tile_size=SIZE, num_workers=0)
+        conn = sqlite3.connect(filename)
+        self.addCleanup(conn.close)
+        levels = reference_levels(self.image)
+
+        def tile(level, col, tile_row):
+            data, = conn.execute(
+                'SELECT tile_data FROM tiles WHERE zoom_level=? AND '
+                'tile_column=? AND tile_row=?', (level, col, tile_row)
+            ).fetchone()
+            return np.asarray(Image.open(BytesIO(data)))
+
+        # Level 3 has 5 rows of tiles. The parent of each tile is found by
+        # halving its row, as for any MBTiles file.
+        for tile_row in range(3, 8):
+            row = 7 - tile_row
+            parent = tile(2, 0, tile_row // 2)
+            top = row // 2 * SIZE
+            expected = levels[2][top:top + SIZE, :SIZE]
+            height, width = expected.shape[:2]
+            np.testing.assert_array_equal(parent[:height, :width], expected)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            build_pyramid(self.image, self.tmpdir, output_format='tiff')
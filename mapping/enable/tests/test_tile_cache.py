@@ -0,0 +1,94 @@
+from unittest import TestCase
+
+import numpy as np
+
+from mapping.enable.tile_cache import (
+    ENTRY_OVERHEAD, TileCache, get_global_tile_cache, tile_nbytes
+)
+
+TILE_BYTES = 256 * 256 * 4
+
+
+def make_tile():
+    return np.zeros((256, 256, 4), dtype=np.uint8)
+
+
+class TestTileCache(TestCase):
+    def setUp(self):
+        # Room for exactly three tiles
+        self.cache = TileCache(max_bytes=3 * (TILE_BYTES + ENTRY_OVERHEAD))
+
+    def test_bounded_by_bytes(self):
+        for col in range(5):
+            self.cache.put((2, 0, col), make_tile())
+        self.assertEqual(len(self.cache), 3)
+        self.assertEqual(self.cache.evictions, 2)
+        self.assertEqual(self.cache.current_bytes,
+                         3 * (TILE_BYTES + ENTRY_OVERHEAD))
+        self.assertNotIn((2, 0, 0), self.cache)
+        self.assertIn((2, 0, 4), self.cache)
+
+    def test_least_recently_used_evicted(self):
+        for col in range(3):
+            self.cache.put((2, 0, col), make_tile())
+        self.cache.get((2, 0, 0))
+        self.cache.put((2, 0, 3), make_tile())
+        self.assertIn((2, 0, 0), self.cache)
+        self.assertNotIn((2, 0, 1), self.cache)
+
+    def test_stats(self):
+        self.cache.put((2, 0, 0), make_tile())
+        self.assertIsNotNone(self.cache.get((2, 0, 0)))
+        self.assertIsNone(self.cache.get((2, 0, 1)))
+        # Peeking isn't counted
+        self.cache.peek((2, 0, 1))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['current_bytes'], TILE_BYTES + ENTRY_OVERHEAD)
+
+    def test_replace_updates_size(self):
+        self.cache.put((2, 0, 0), make_tile())
+        self.cache.put((2, 0, 0), b'1234')
+        self.assertEqual(self.cache.current_bytes, 4 + ENTRY_OVERHEAD)
+
+    def test_namespaces(self):
+        self.cache.put((2, 0, 0), 'a', namespace='a')
+        self.cache.put((2, 0, 0), 'b', namespace='b')
+        self.assertEqual(self.cache.get((2, 0, 0), namespace='a'), 'a')
+        self.cache.clear(namespace='a')
+        self.assertFalse(self.cache.contains((2, 0, 0), namespace='a'))
+        self.assertEqual(self.cache.get((2, 0, 0), namespace='b'), 'b')
+
+    def test_resize_evicts(self):
+        for col in range(3):
+            self.cache.put((2, 0, col), make_tile())
+        self.cache.resize(TILE_BYTES + ENTRY_OVERHEAD)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_evict_callback(self):
+        evicted = []
+        self.cache.set_evict_callback(evicted.append, namespace='a')
+        for col in range(3):
+            self.cache.put((2, 0, col), make_tile(), namespace='a')
+        self.cache.put((2, 0, 0), make_tile(), namespace='b')
+        self.cache.resize(TILE_BYTES + ENTRY_OVERHEAD)
+        self.assertEqual(evicted, [(2, 0, 0), (2, 0, 1), (2, 0, 2)])
+        # Removing tiles explicitly isn't eviction
+        self.cache.clear(namespace='b')
+        self.assertEqual(len(evicted), 3)
+
+    def test_global_cache(self):
+        self.assertIs(get_global_tile_cache(), get_global_tile_cache())
+
+
+class TestTileNbytes(TestCase):
+    def test_sizes(self):
+        self.assertEqual(tile_nbytes(None), 0)
+        self.assertEqual(tile_nbytes(b'abc'), 3)
+        self.assertEqual(tile_nbytes(make_tile()), TILE_BYTES)
+
+    def test_kiva_image(self):
+        from kiva.image import GraphicsContext
+        self.assertEqual(tile_nbytes(GraphicsContext((256, 128))),
+                         256 * 128 * 4)
@@ -0,0 +1,86 @@
+import gc
+from unittest import TestCase
+from unittest.mock import patch
+
+from mapping.enable.tile_cache import TileCache
+from mapping.enable.tile_manager import TileManager
+
+
+class TestTileManager(TestCase):
+    def setUp(self):
+        self.manager = TileManager()
+        self.batches = []
+        self.manager.on_trait_change(lambda new: self.batches.append(new),
+                                     'tiles_ready')
+
+    @patch('mapping.enable.tile_manager.GUI')
+    def test_tile_ready_coalesced(self, gui):
+        for col in range(50):
+            self.manager.tile_ready = (3, 0, col)
+        # One flush is scheduled for the whole burst
+        self.assertEqual(gui.invoke_after.call_count, 1)
+        self.assertEqual(self.batches, [])
+
+        interval, flush = gui.invoke_after.call_args[0]
+        self.assertEqual(interval, 25)
+        flush()
+        self.assertEqual(self.batches,
+                         [frozenset((3, 0, col) for col in range(50))])
+
+        # The next tile schedules a new flush
+        self.manager.tile_ready = (3, 1, 0)
+        self.assertEqual(gui.invoke_after.call_count, 2)
+
+    def test_no_interval_fires_immediately(self):
+        self.manager.redraw_interval = 0
+        self.manager.tile_ready = (3, 0, 0)
+        self.manager.tile_ready = (3, 0, 1)
+        self.assertEqual(self.batches,
+                         [frozenset([(3, 0, 0)]), frozenset([(3, 0, 1)])])
+
+
+class TestTileManagerCache(TestCase):
+    def test_own_cache(self):
+        first, second = TileManager(), TileManager()
+        self.assertIsNot(first.cache, second.cache)
+        self.assertEqual(first.cache.max_bytes, first.max_cache_bytes)
+
+        first._put_in_cache((1, 0, 0), b'first')
+        second._put_in_cache((1, 0, 0), b'second')
+        first._clear_cache()
+        self.assertIsNone(first.get_cached_tile(1, 0, 0))
+        self.assertEqual(second.get_cached_tile(1, 0, 0), b'second')
+
+    def test_max_cache_bytes(self):
+        manager = TileManager(max_cache_bytes=1024)
+        self.assertEqual(manager.cache.max_bytes, 1024)
+        manager.max_cache_bytes = 2048
+        self.assertEqual(manager.cache.max_bytes, 2048)
+
+        # A shared cache keeps its budget
+        shared = TileCache(max_bytes=4096)
+        manager.cache = shared
+        manager.max_cache_bytes = 1024
+        self.assertEqual(shared.max_bytes, 4096)
+
+    def test_shared_cache_released_on_collection(self):
+        shared = TileCache()
+        first = TileManager(cache=shared)
+        second = TileManager(cache=shared)
+        first._put_in_cache((1, 0, 0), b'first')
+        second._put_in_cache((1, 0, 0), b'second')
+        self.assertEqual(len(shared), 2)
+
+        del first
+        gc.collect()
+        self.assertEqual(len(shared), 1)
+        self.assertEqual(len(shared._evict_callbacks), 1)
+        self.assertEqual(second.get_cached_tile(1, 0, 0), b'second')
+
+    def test_replaced_cache_cleared(self):
+        shared = TileCache()
+        manager = TileManager(cache=shared)
+        manager._put_in_cache((1, 0, 0), b'tile')
+        manager.cache = TileCache()
+        self.assertEqual(len(shared), 0)
+        self.assertIsNone(manager.get_cached_tile(1, 0, 0))
@@ -0,0 +1,156 @@
+import json
+import os.path as op
+import shutil
+import sqlite3
+import tempfile
+import zlib
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from six.moves import queue
+
+from mapping.api import get_builtin_mbtiles_path
+from mapping.enable.async_loader import AsyncLoader
+from mapping.enable.canvas import MappingCanvas
+from mapping.enable.mbtiles import MbtileSet
+from mapping.enable.utfgrid import UTFGrid
+from mapping.enable.utfgrid_overlay import UTFGridOverlay
+
+# Feature 'a' in the top right quarter, 'b' in the bottom half
+GRID = {
+    'grid': ['  !!', '  !!', '####', '####'],
+    'keys': ['', 'a', 'b'],
+}
+KEYMAP = {'a': '{"name": "A", "open": true}', 'b': '{"name": "B"}'}
+
+
+def make_grid_mbtiles(filename):
+    """ Write an MBTiles file with a grid for tile (1, 1, 0) only. """
+    conn = sqlite3.connect(filename)
+    with conn:
+        conn.executescript('''
+            CREATE TABLE tiles (zoom_level integer, tile_column integer,
+                                tile_row integer, tile_data blob);
+            CREATE TABLE grids (zoom_level integer, tile_column integer,
+                                tile_row integer, grid blob);
+            CREATE TABLE map (zoom_level integer, tile_column integer,
+                              tile_row integer, grid_id text);
+            CREATE TABLE grid_key (grid_id text, key_name text);
+            CREATE TABLE keymap (key_name text, key_json text);
+        ''')
+        blob = zlib.compress(json.dumps(GRID).encode('utf-8'))
+        conn.execute('INSERT INTO grids VALUES (1, 0, 1, ?)',
+                     (sqlite3.Binary(blob),))
+        conn.execute("INSERT INTO map VALUES (1, 0, 1, 'g')")
+        for name, key_json in KEYMAP.items():
+            conn.execute("INSERT INTO grid_key VALUES ('g', ?)", (name,))
+            conn.execute('INSERT INTO keymap VALUES (?, ?)', (name, key_json))
+    conn.close()
+
+
+class MouseEvent(object):
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+        self.handled = False
+
+
+class GridTestCase(TestCase):
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.filename = op.join(tmpdir, 'grids.mbtiles')
+        make_grid_mbtiles(self.filename)
+
+
+class TestUTFGrid(GridTestCase):
+    def test_get_grid(self):
+        grid = MbtileSet(mbtiles=self.filename).get_tile(1, 1, 0).get_grid()
+        self.assertEqual(grid['grid'], GRID['grid'])
+        # Keys are decoded as JSON, which eval() couldn't
+        self.assertEqual(grid['data'], {'a': {'name': 'A', 'open': True},
+                                        'b': {'name': 'B'}})
+        self.assertIsNone(
+            MbtileSet(mbtiles=self.filename).get_tile(1, 0, 0).get_grid()
+        )
+
+    def test_lookup(self):
+        grid = UTFGrid.from_json(dict(GRID, data={'a': {'name': 'A'}}))
+        self.assertEqual(grid.resolution, 64)
+        self.assertIsNone(grid.key_at(10, 10))
+        self.assertEqual(grid.key_at(200, 10), 'a')
+        self.assertEqual(grid.feature_at(200, 10), {'name': 'A'})
+        self.assertEqual(grid.key_at(10, 200), 'b')
+        # A key without data is still a feature
+        self.assertEqual(grid.feature_at(10, 200), {})
+        self.assertIsNone(grid.key_at(300, 10))
+        self.assertIsNone(grid.key_at(-1, 10))
+
+    def test_escaped_characters(self):
+        # Indices skip '"' (34) and '\\' (92)
+        keys = [str(i) for i in range(62)]
+        grid = UTFGrid([u' !#[]'], keys, {})
+        self.assertEqual(list(grid.indices[0]), [0, 1, 2, 58, 59])
+
+
+class TestUTFGridOverlay(GridTestCase):
+    def setUp(self):
+        super(TestUTFGridOverlay, self).setUp()
+        self.loader = AsyncLoader()
+        self.loader.start()
+        self.addCleanup(self.loader.stop)
+        self.canvas = MappingCanvas(_zoom_level=1)
+        self.overlay = UTFGridOverlay(self.canvas, filename=self.filename,
+                                      async_loader=self.loader)
+        self.canvas.overlays.append(self.overlay)
+
+        # Stands in for the GUI event loop
+        self.calls = queue.Queue()
+        patcher = patch('mapping.enable.utfgrid_overlay.GUI')
+        gui = patcher.start()
+        gui.invoke_later.side_effect = (
+            lambda func, *args: self.calls.put((func, args))
+        )
+        self.addCleanup(patcher.stop)
+
+    def load_visible(self):
+        self.overlay.overlay(self.canvas, MagicMock(), (0, 0, 512, 512))
+        func, args = self.calls.get(timeout=5)
+        func(*args)
+
+    def test_hover(self):
+        self.overlay.normal_mouse_move(MouseEvent(200, 500))
+        # The grid isn't loaded yet
+        self.assertIsNone(self.overlay.hover_key)
+
+        self.load_visible()
+        # The hover is updated as soon as the grid arrives
+        self.assertEqual(self.overlay.hover_key, 'a')
+        self.assertEqual(self.overlay.hover_feature,
+                         {'name': 'A', 'open': True})
+
+        with patch.object(MbtileSet, 'get_tile') as get_tile:
+            self.overlay.normal_mouse_move(MouseEvent(10, 300))
+            self.assertEqual(self.overlay.hover_feature, {'name': 'B'})
+            # Tiles without grids have no features
+            self.overlay.normal_mouse_move(MouseEvent(300, 300))
+            self.assertIsNone(self.overlay.hover_feature)
+            # No grid is read while the mouse moves
+            self.assertFalse(get_tile.called)
+
+        self.overlay.normal_mouse_move(MouseEvent(10, 300))
+        self.overlay.normal_mouse_leave(MouseEvent(10, 300))
+        self.assertIsNone(self.overlay.hover_key)
+
+    def test_grids_loaded_once(self):
+        self.load_visible()
+        self.overlay.overlay(self.canvas, MagicMock(), (0, 0, 512, 512))
+        self.assertTrue(self.calls.empty())
+        self.assertEqual(self.overlay.feature_key_at(200, 500), 'a')
+        self.assertIsNone(self.overlay.feature_at(0, 0))
+
+    def test_no_grids(self):
+        overlay = UTFGridOverlay(self.canvas,
+                                 filename=get_builtin_mbtiles_path(),
+                                 async_loader=self.loader)
+        overlay.overlay(self.canvas, MagicMock(), (0, 0, 512, 512))
+        self.assertEqual(overlay._pending, {})
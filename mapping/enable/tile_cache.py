@@ -0,0 +1,191 @@
+from collections import OrderedDict
+from threading import RLock
+
+#: Rough bookkeeping cost of a cache entry, in bytes. Also keeps empty
+#: placeholder entries from being free.
+ENTRY_OVERHEAD = 128
+
+
+class TileCache(object):
+    """ A least-recently-used cache of tiles, bounded by the memory used by
+    the tiles rather than by their number.
+
+    Tiles are stored under (zoom, row, col) keys. Several tile managers can
+    share one cache, and so one memory budget, by keeping their tiles in
+    separate namespaces. The cache may be used from several threads at once.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, sizeof=None):
+        #: The memory budget of the cache, in bytes.
+        self.max_bytes = max_bytes
+        #: The function used to estimate the size of a tile in bytes.
+        self.sizeof = sizeof if sizeof is not None else tile_nbytes
+
+        #: The estimated memory used by the cached tiles, in bytes.
+        self.current_bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+        # Maps (namespace, key) to (tile, size), least recently used first
+        self._entries = OrderedDict()
+        # Maps each namespace to the keys it has in the cache
+        self._namespaces = {}
+        # Maps namespaces to the function told of their evicted tiles
+        self._evict_callbacks = {}
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return (None, key) in self._entries
+
+    def contains(self, key, namespace=None):
+        return (namespace, key) in self._entries
+
+    def get(self, key, default=None, namespace=None):
+        """ Return a tile, marking it as recently used, or `default` if the
+        tile isn't cached.
+        """
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end((namespace, key))
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key, default=None, namespace=None):
+        """ Return a tile without marking it as used or counting the access.
+        """
+        entry = self._entries.get((namespace, key))
+        return default if entry is None else entry[0]
+
+    def put(self, key, tile, namespace=None):
+        """ Add or replace a tile, evicting old tiles to stay within budget.
+        """
+        size = self.sizeof(tile) + ENTRY_OVERHEAD
+        with self._lock:
+            self._remove((namespace, key))
+            self._entries[namespace, key] = (tile, size)
+            self._namespaces.setdefault(namespace, set()).add(key)
+            self.current_bytes += size
+            evicted = self._evict()
+        self._notify_evicted(evicted)
+
+    def discard(self, key, namespace=None):
+        """ Remove a tile from the cache, if present.
+        """
+        with self._lock:
+            self._remove((namespace, key))
+
+    def clear(self, namespace=None):
+        """ Remove the tiles of one namespace from the cache.
+        """
+        with self._lock:
+            for key in list(self._namespaces.get(namespace, ())):
+                self._remove((namespace, key))
+
+    def set_evict_callback(self, callback, namespace=None):
+        """ Set a function to be called with the key of each tile of a
+        namespace which is evicted to stay within budget. A `callback` of
+        None removes the function.
+        """
+        with self._lock:
+            if callback is None:
+                self._evict_callbacks.pop(namespace, None)
+            else:
+                self._evict_callbacks[namespace] = callback
+
+    def clear_all(self):
+        """ Remove every tile from the cache and reset the statistics.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._namespaces.clear()
+            self.current_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def resize(self, max_bytes):
+        """ Change the memory budget of the cache.
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            evicted = self._evict()
+        self._notify_evicted(evicted)
+
+    def stats(self):
+        """ Return a dictionary of the cache statistics.
+        """
+        return dict(hits=self.hits, misses=self.misses,
+                    evictions=self.evictions, entries=len(self._entries),
+                    current_bytes=self.current_bytes,
+                    max_bytes=self.max_bytes)
+
+    # Private interface ##################################################
+
+    def _remove(self, full_key):
+        entry = self._entries.pop(full_key, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+            namespace, key = full_key
+            keys = self._namespaces[namespace]
+            keys.discard(key)
+            if not keys:
+                del self._namespaces[namespace]
+
+    def _evict(self):
+        """ Remove the least recently used tiles until the cache fits its
+        budget. Returns the (namespace, key) of the evicted tiles.
+        """
+        evicted = []
+        while self.current_bytes > self.max_bytes and self._entries:
+            full_key = next(iter(self._entries))
+            self._remove(full_key)
+            self.evictions += 1
+            evicted.append(full_key)
+        return evicted
+
+    def _notify_evicted(self, evicted):
+        for namespace, key in evicted:
+            callback = self._evict_callbacks.get(namespace)
+            if callback is not None:
+                callback(key)
+
+
+def tile_nbytes(tile):
+    """ Estimate the memory used by a tile, in bytes.
+    """
+    if tile is None:
+        return 0
+    if isinstance(tile, (bytes, bytearray)):
+        return len(tile)
+    # numpy arrays, and kiva images through their pixel buffer
+    array = getattr(tile, 'bmp_array', tile)
+    nbytes = getattr(array, 'nbytes', None)
+    if nbytes is not None:
+        return nbytes
+    try:
+        return tile.width() * tile.height() * 4
+    except Exception:
+        return 0
+
+
+#: Global tile cache instance. Use get_global_tile_cache
+#: to request this instance.
+_tile_cache = None
+
+
+def get_global_tile_cache(max_bytes=None):
+    """
+    Get the current global TileCache instance, creating it if necessary.
+
+    If `max_bytes` is given, the budget of the global cache is changed to
+    that many bytes.
+    """
+    global _tile_cache
+    if _tile_cache is None:
+        _tile_cache = TileCache()
+    if max_bytes is not None:
+        _tile_cache.resize(max_bytes)
+    return _tile_cache
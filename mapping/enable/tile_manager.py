@@ -1,7 +1,18 @@
+import logging
+import weakref
 
-from traits.api import HasTraits, Event, Int, Callable, provides
+from pyface.gui import GUI
+from traits.api import (
+    HasTraits, Any, Bool, Dict, Event, Float, Instance, Int, Callable, Set,
+    provides
+)
 
+from .async_loader import AsyncRequest
 from .i_tile_manager import ITileManager
+from .tile_cache import TileCache
+
+#: Marks tiles missing from the cache
+_MISSING = object()
 
 
 @provides(ITileManager)
@@ -13,10 +24,35 @@ class TileManager(HasTraits):
     min_level = Int(0)
     max_level = Int(17)
 
+    #: Fired with the (zoom, row, col) of each tile as it becomes ready.
     tile_ready = Event
 
+    #: Fired with the set of (zoom, row, col) tiles which became ready within
+    #: one `redraw_interval`. Listen to this one to redraw.
+    tiles_ready = Event
+
+    #: The interval over which `tile_ready` notifications are coalesced into
+    #: a single `tiles_ready` notification, in seconds.
+    redraw_interval = Float(0.025)
+
     process_raw = Callable
 
+    #: Turns an array of RGB or RGBA pixels into a tile ready to draw. Tile
+    #: managers holding raw pixels use it rather than `process_raw`, to skip
+    #: encoding the pixels as an image file.
+    process_array = Callable
+
+    #: The cache holding the loaded tiles. By default every manager has a
+    #: cache of its own. Several managers can share one memory budget by
+    #: setting this to a shared cache, e.g. `get_global_tile_cache()`; the
+    #: tiles of a manager are removed from a shared cache when the manager is
+    #: garbage collected.
+    cache = Instance(TileCache)
+
+    #: The memory budget of the manager's own cache, in bytes. A shared
+    #: cache keeps its own budget.
+    max_cache_bytes = Int(64 * 1024 * 1024)
+
     def get_data_dimensions(self, zoom):
         """ Return the rows X columns dimension of the data at the given zoom
         level. zoom == -1 is a synonym for the maximum zoom level
@@ -36,6 +72,22 @@ class TileManager(HasTraits):
         """
         raise Exception()
 
+    def get_cached_tile(self, zoom, row, col):
+        """ Return a tile if it is already loaded, without requesting it.
+        Returns None if the tile isn't loaded.
+        """
+        return self.cache.peek((zoom, row, col),
+                               namespace=self._cache_namespace)
+
+    def set_visible_tiles(self, tiles, viewer=None):
+        """ Tell the manager which tiles are currently on screen.
+
+        `tiles` maps (zoom, row, col) tuples to their distance from the center
+        of the view, in tiles. `viewer` identifies the view being drawn, so
+        that several views can share one manager.
+        """
+        pass
+
     def get_wrap_flags(self):
         """ Return a tuple of booleans which indicate which axes should wrap
         infinitely.
@@ -47,3 +99,141 @@ class TileManager(HasTraits):
         """ Convert screen space to a particular tile reference
         """
         raise Exception()
+
+    # Private interface ##################################################
+
+    #: The namespace of this manager's tiles in the cache.
+    _cache_namespace = Any
+
+    #: Removes this manager's tiles from a shared cache on garbage collection.
+    _cache_finalizer = Any
+
+    #: True while `cache` is the cache created by this manager.
+    _owns_cache = Bool(False)
+
+    def _cache_default(self):
+        self._owns_cache = True
+        cache = TileCache(max_bytes=self.max_cache_bytes)
+        self._watch_evictions(cache)
+        return cache
+
+    def __cache_namespace_default(self):
+        return object()
+
+    def _cache_changed(self, old, new):
+        if self._cache_finalizer is not None:
+            self._cache_finalizer.detach()
+            self._cache_finalizer = None
+        if old is not None:
+            _release_namespace(old, self._cache_namespace)
+        self._owns_cache = False
+        if new is not None:
+            self._watch_evictions(new)
+            # The finalizer must not refer to the manager itself
+            self._cache_finalizer = weakref.finalize(
+                self, _release_namespace, new, self._cache_namespace
+            )
+
+    def _watch_evictions(self, cache):
+        # The callback must not keep the manager alive either
+        manager_ref = weakref.ref(self)
+
+        def evicted(key):
+            manager = manager_ref()
+            if manager is not None:
+                manager._tile_evicted(key)
+
+        cache.set_evict_callback(evicted, namespace=self._cache_namespace)
+
+    def _tile_evicted(self, key):
+        """ Called with the key of each tile evicted from the cache to stay
+        within its budget.
+        """
+        pass
+
+    def _max_cache_bytes_changed(self, new):
+        if self._owns_cache:
+            self.cache.resize(new)
+
+    def _get_from_cache(self, key, default=None):
+        return self.cache.get(key, default, namespace=self._cache_namespace)
+
+    def _is_cached(self, key):
+        return self.cache.contains(key, namespace=self._cache_namespace)
+
+    def _put_in_cache(self, key, tile):
+        self.cache.put(key, tile, namespace=self._cache_namespace)
+
+    def _discard_from_cache(self, key):
+        self.cache.discard(key, namespace=self._cache_namespace)
+
+    def _clear_cache(self):
+        self.cache.clear(namespace=self._cache_namespace)
+
+    #: The request in flight for each pending tile, or any object standing
+    #: for it, for managers loading tiles asynchronously. Only ever touched
+    #: on the GUI thread.
+    _pending = Dict
+
+    def _finish_pending(self, key, request):
+        """ Mark the request for a tile as done. Returns False if the request
+        is no longer the one the manager is waiting on.
+        """
+        if self._pending.get(key) is not request:
+            return False
+        del self._pending[key]
+        return True
+
+    #: The tiles which became ready since `tiles_ready` was last fired.
+    _ready_batch = Set
+
+    #: True while a `tiles_ready` notification is scheduled.
+    _flush_scheduled = Bool(False)
+
+    def _tile_ready_fired(self, tile):
+        self._ready_batch.add(tile)
+        if self._flush_scheduled:
+            return
+        if self.redraw_interval <= 0:
+            self._flush_ready_batch()
+        else:
+            GUI.invoke_after(int(self.redraw_interval * 1000),
+                             self._flush_ready_batch)
+            self._flush_scheduled = True
+
+    def _flush_ready_batch(self):
+        tiles, self._ready_batch = frozenset(self._ready_batch), set()
+        self._flush_scheduled = False
+        if tiles:
+            self.tiles_ready = tiles
+
+
+def _release_namespace(cache, namespace):
+    """ Remove the tiles of a manager from a cache it no longer uses.
+    """
+    cache.clear(namespace=namespace)
+    cache.set_evict_callback(None, namespace=namespace)
+
+
+class AsyncTileRequest(AsyncRequest):
+    """ Base class for requests loading tiles on the loader thread.
+
+    Subclasses decode the data they load with `_process`, which applies the
+    manager's `process_raw` and logs the tiles which fail to decode.
+    """
+
+    def __init__(self, handler, process_raw=None):
+        self.handler = handler
+        self._process_raw = process_raw
+
+    def _process(self, data):
+        """ Decode raw tile data. Returns None if the data is unusable.
+        """
+        if self._process_raw is None:
+            return data
+        try:
+            return self._process_raw(data)
+        except Exception:
+            # Failed to process tile
+            logging.exception("Failed to process %s", self)
+            return None
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+class UTFGrid(object):
+    """ A decoded UTFGrid: the interaction data of one map tile.
+
+    The grid is decoded once, into an array holding the index in `keys` of
+    the feature covering each grid cell, so looking up the feature at a point
+    is a constant time array lookup.
+    """
+
+    def __init__(self, grid, keys, data, tile_size=256):
+        #: The key of each feature in the grid. The first key is usually
+        #: empty, for the cells without a feature.
+        self.keys = list(keys)
+        #: The data of each key, as decoded from its JSON.
+        self.data = data
+        #: The size of the tile the grid covers, in pixels.
+        self.tile_size = tile_size
+
+        self.indices = decode_grid(grid)
+        #: The number of pixels of the tile covered by a grid cell.
+        self.resolution = float(tile_size) / len(self.indices)
+
+    @classmethod
+    def from_json(cls, obj, tile_size=256):
+        """ Create a UTFGrid from its JSON representation, decoded as a
+        dictionary, e.g. as returned by `Mbtile.get_grid`.
+        """
+        return cls(obj['grid'], obj['keys'], obj.get('data') or {},
+                   tile_size=tile_size)
+
+    @property
+    def nbytes(self):
+        """ A rough estimate of the memory used by the grid, in bytes. """
+        return self.indices.nbytes + 64 * (len(self.keys) + len(self.data))
+
+    def key_at(self, x, y):
+        """ Return the key of the feature at (x, y), in pixels from the top
+        left corner of the tile, or None if there is no feature there.
+        """
+        i = int(y / self.resolution)
+        j = int(x / self.resolution)
+        rows, cols = self.indices.shape
+        if not (0 <= i < rows and 0 <= j < cols):
+            return None
+        index = self.indices[i, j]
+        if index >= len(self.keys):
+            return None
+        return self.keys[index] or None
+
+    def feature_at(self, x, y):
+        """ Return the data of the feature at (x, y), in pixels from the top
+        left corner of the tile, or None if there is no feature there.
+        """
+        key = self.key_at(x, y)
+        if key is None:
+            return None
+        return self.data.get(key, {})
+
+
+def decode_grid(grid):
+    """ Decode the rows of a UTFGrid into an array of key indices.
+
+    Each character encodes an index, shifted past the control characters
+    and the characters which would need escaping in JSON, '"' and '\\'.
+    """
+    rows = len(grid)
+    if rows == 0:
+        return np.zeros((0, 0), dtype=np.uint32)
+    codes = np.frombuffer(u''.join(grid).encode('utf-32-le'), dtype='<u4')
+    codes = codes.reshape(rows, -1).astype(np.int64)
+    codes -= (codes >= 93).astype(np.int64) + (codes >= 35) + 32
+    return codes.clip(0).astype(np.uint32)
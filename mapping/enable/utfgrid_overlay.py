@@ -0,0 +1,184 @@
+import logging
+
+from enable.api import AbstractOverlay
+from pyface.gui import GUI
+from traits.api import Any, Bool, Dict, Instance, Int, Str
+
+from .async_loader import AsyncLoader, AsyncRequest, get_global_async_loader
+from .mbtiles import MbtileSet
+from .tile_cache import TileCache
+from .utfgrid import UTFGrid
+
+
+class UTFGridOverlay(AbstractOverlay):
+    """ Hit-testing of the features of a map through the UTFGrid interaction
+    data of an MBTiles file.
+
+    Add the overlay to the overlays of a MappingCanvas. The grids of the
+    visible tiles are loaded lazily on the loader threads as the canvas is
+    drawn, and `hover_feature` follows the feature under the mouse. Looking
+    a feature up only touches grids which are already loaded and decoded.
+    """
+
+    #: The MBTiles file holding the grids.
+    filename = Str
+
+    #: The key of the feature under the mouse, or None.
+    hover_key = Any
+
+    #: The data of the feature under the mouse, or None.
+    hover_feature = Any
+
+    #: The memory budget of the cache of decoded grids, in bytes.
+    max_cache_bytes = Int(16 * 1024 * 1024)
+
+    #: The async_loader instance used to load the grids.
+    async_loader = Instance(AsyncLoader)
+
+    #: The size of the tiles the grids cover, in pixels.
+    tile_size = Int(256)
+
+    def feature_key_at(self, x, y):
+        """ Return the key of the feature at (x, y) in canvas coordinates, or
+        None if there is none or its grid isn't loaded.
+        """
+        grid, px, py = self._grid_at(x, y)
+        return None if grid is None else grid.key_at(px, py)
+
+    def feature_at(self, x, y):
+        """ Return the data of the feature at (x, y) in canvas coordinates,
+        or None if there is none or its grid isn't loaded.
+        """
+        grid, px, py = self._grid_at(x, y)
+        return None if grid is None else grid.feature_at(px, py)
+
+    def overlay(self, other_component, gc, view_bounds=None, mode="normal"):
+        # Nothing is drawn, but the draw tells us which grids are visible
+        if view_bounds is None or not self._has_grids:
+            return
+        x, y, width, height = view_bounds
+        zoom = other_component._zoom_level
+        size = self.tile_size
+        n = 1 << zoom
+        missing = []
+        for tx in range(int(x) // size, int(x + width) // size + 1):
+            for ty in range(max(int(y) // size, 0),
+                            min(int(y + height) // size + 1, n)):
+                key = (zoom, ty, tx % n)
+                if key not in self._pending and key not in self._cache:
+                    missing.append(key)
+        if missing:
+            request = GridRequest(self._grids_received, self._tileset,
+                                  missing, tile_size=size)
+            for key in missing:
+                self._pending[key] = request
+            self.async_loader.put(request)
+
+    def normal_mouse_move(self, event):
+        self._mouse_position = (event.x, event.y)
+        self._update_hover()
+
+    def normal_mouse_leave(self, event):
+        self._mouse_position = None
+        self._update_hover()
+
+    # Private interface ##################################################
+
+    _tileset = Instance(MbtileSet)
+
+    #: Whether the file has grids at all.
+    _has_grids = Bool(False)
+
+    #: The decoded grids, keyed by MBTiles (zoom, row, col) tile numbers.
+    #: Tiles without a grid are cached as None.
+    _cache = Instance(TileCache)
+
+    #: The request in flight for each pending grid. Only ever touched on
+    #: the GUI thread.
+    _pending = Dict
+
+    #: The last position of the mouse over the canvas, or None.
+    _mouse_position = Any
+
+    def _async_loader_default(self):
+        return get_global_async_loader()
+
+    def __cache_default(self):
+        return TileCache(max_bytes=self.max_cache_bytes)
+
+    def _max_cache_bytes_changed(self, new):
+        self._cache.resize(new)
+
+    def _filename_changed(self, new):
+        self._tileset = MbtileSet(mbtiles=new, read_only=True)
+        self._has_grids = self._tileset.has_grids()
+        self._cache.clear()
+        # Results of requests still in flight are for the old file
+        self._pending = {}
+        self._update_hover()
+
+    def _grid_at(self, x, y):
+        component = self.component
+        if component is None or not self._has_grids:
+            return None, 0, 0
+        size = self.tile_size
+        zoom = component._zoom_level
+        n = 1 << zoom
+        tx, ty = int(x // size), int(y // size)
+        if not 0 <= ty < n:
+            return None, 0, 0
+        grid = self._cache.peek((zoom, ty, tx % n))
+        # Grids run from the top of the tile, canvas coordinates from the
+        # bottom.
+        return grid, x - tx * size, (ty + 1) * size - y
+
+    def _grids_received(self, request, grids):
+        for key in request.keys:
+            if self._pending.get(key) is not request:
+                # The file was changed while the grid was in flight
+                continue
+            del self._pending[key]
+            self._cache.put(key, grids.get(key))
+        # The grid under the mouse may just have arrived
+        self._update_hover()
+
+    def _update_hover(self):
+        key = feature = None
+        if self._mouse_position is not None:
+            grid, px, py = self._grid_at(*self._mouse_position)
+            if grid is not None:
+                key = grid.key_at(px, py)
+                feature = grid.feature_at(px, py)
+        self.hover_key = key
+        self.hover_feature = feature
+
+
+class GridRequest(AsyncRequest):
+    """ A request for a batch of UTFGrids from an MBTiles file.
+
+    The grids are read and decoded on the loader thread. The handler
+    receives the request and a dictionary mapping the keys of the tiles
+    which have a grid to their decoded UTFGrid.
+    """
+
+    def __init__(self, handler, tileset, keys, tile_size=256):
+        self.handler = handler
+        self.keys = keys
+        self._tileset = tileset
+        self._tile_size = tile_size
+
+    def execute(self):
+        grids = {}
+        for key in self.keys:
+            try:
+                obj = self._tileset.get_tile(*key).get_grid()
+                if obj is not None:
+                    grids[key] = UTFGrid.from_json(obj,
+                                                   tile_size=self._tile_size)
+            except Exception:
+                logging.exception("Failed to load grid %s for %s", key, self)
+        GUI.invoke_later(self.handler, self, grids)
+
+    def __str__(self):
+        return "GridRequest({} grids of {})".format(len(self.keys),
+                                                    self._tileset.filename)
@@ -162,5 +162,6 @@ class MappingViewport(Viewport):
                         # FIXME This is a bit hacky - i should pass in the
                         # zoom level to the draw function
                         self.component._zoom_level = self.zoom_level
+                        self.component._viewer = self
                         self.component.draw(gc, new_bounds, mode=mode)
         return